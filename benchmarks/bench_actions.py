@@ -0,0 +1,90 @@
+"""Dict actions vs compact opcode tuples on the shipped chapters: memory of the loaded quest
+and per-action dispatch cost of execute_action (if-chain on action["type"] vs jump table).
+
+Run from the project root:  python -m benchmarks.bench_actions
+"""
+import gc
+import json
+import time
+import tracemalloc
+from utils.actions import compile_action, compile_actions, OTHER
+from utils.linker import link_chapters
+
+CHAPTERS_FILE = "data/chapters.json"
+
+
+def traced_kib(build):
+    gc.collect()
+    tracemalloc.start()
+    quest = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size / 1024, quest
+
+
+# ✅ Dispatch as execute_action did it before the jump table (handlers are no-ops here)
+def legacy_dispatch(action, handlers):
+    action_type = action["type"]
+    value = action["value"]
+    if action_type == "text":
+        handlers["text"](value)
+    elif action_type == "btn" or action_type == "xbtn":
+        handlers["btn"](value)
+    elif action_type == "inventory":
+        handlers["inventory"](value)
+    elif action_type == "gold":
+        handlers["gold"](value)
+    elif action_type == "assign":
+        handlers["assign"](value)
+    elif action_type == "goto":
+        handlers["goto"](value)
+    elif action_type == "image":
+        handlers["image"](value)
+    elif action_type == "if":
+        handlers["if"](value)
+    elif action_type == "end":
+        handlers["end"](value)
+
+
+def table_dispatch(action, table):
+    table[action[0]](action)
+
+
+def timed(func, runs=7):
+    results = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        results.append(time.perf_counter() - start)
+    return sorted(results)[runs // 2]
+
+
+def main():
+    with open(CHAPTERS_FILE, "r", encoding="utf-8") as file:
+        text = file.read()
+
+    dict_kib, dict_quest = traced_kib(lambda: link_chapters(json.loads(text)))
+    tuple_kib, tuple_quest = traced_kib(lambda: link_chapters(json.loads(text), compile_actions))
+    print(f"{len(dict_quest)} chapters loaded (tracemalloc)")
+    print(f"dict actions : {dict_kib:8.1f} KiB")
+    print(f"tuple actions: {tuple_kib:8.1f} KiB  ({tuple_kib / dict_kib:.0%})")
+
+    dict_actions = [action for actions in dict_quest.chapters for action in actions] * 50
+    tuple_actions = [compile_action(action) for action in dict_actions]
+
+    def noop(value):
+        pass
+    handlers = dict.fromkeys(("text", "btn", "inventory", "gold", "assign", "goto", "image", "if", "end"), noop)
+    table = [noop] * (OTHER + 1)
+
+    legacy = timed(lambda: [legacy_dispatch(action, handlers) for action in dict_actions])
+    jump = timed(lambda: [table_dispatch(action, table) for action in tuple_actions])
+    count = len(dict_actions)
+    print(f"\ndispatch of {count} actions")
+    print(f"if-chain on type: {legacy / count * 1e9:6.1f} ns/action")
+    print(f"jump table      : {jump / count * 1e9:6.1f} ns/action")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Microbenchmark: compiled assignment expressions vs regex + eval() in handle_assign.
+
+Run from the project root:  python -m benchmarks.bench_assign
+"""
+import random
+import re
+import time
+from utils.expressions import compile_expression
+from benchmarks.bench_conditions import collect_actions
+
+
+# ✅ Reference implementation (handle_assign right-hand side before the compiler)
+def legacy_assign_value(state, key, new_value):
+    new_value = re.sub(r'rnd(\d+)', lambda m: str(random.randint(1, int(m.group(1)))), new_value)
+    local_vars = {k: v["value"] for k, v in state["characteristics"].items()}
+    try:
+        return int(new_value) if new_value.isdigit() else eval(new_value, {}, local_vars)
+    except Exception:
+        return state["characteristics"].get(key, {"value": 0})["value"]
+
+
+def compiled_assign_value(state, key, new_value):
+    try:
+        return compile_expression(new_value)(state)
+    except Exception:
+        return state["characteristics"].get(key, {"value": 0})["value"]
+
+
+def make_state(assigns, size):
+    names = {name for _, expression in assigns for name in re.findall(r'[A-Za-z_][A-Za-z0-9_]*', expression)}
+    names.update(f"filler{i}" for i in range(max(0, size - len(names))))
+    return {"characteristics": {name: {"name": "", "value": 5} for name in names}, "inventory": []}
+
+
+def timed(func, assigns, state, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for key, expression in assigns:
+            func(state, key, expression)
+    return time.perf_counter() - start
+
+
+def main(rounds=50):
+    assigns = [(action["value"]["key"], action["value"]["value"]) for action in collect_actions("assign")]
+    calls = rounds * len(assigns)
+    print(f"assign actions: {len(assigns)} ({len({e for _, e in assigns})} distinct), calls per run: {calls}")
+
+    for size in (20, 200, 2000):
+        state = make_state(assigns, size)
+        for key, expression in assigns:
+            random.seed(1)
+            expected = legacy_assign_value(state, key, expression)
+            random.seed(1)
+            assert compiled_assign_value(state, key, expression) == expected, expression
+
+        legacy = timed(legacy_assign_value, assigns, state, rounds)
+        fast = timed(compiled_assign_value, assigns, state, rounds)
+        print(f"{size:5d} characteristics: legacy {legacy / calls * 1e6:8.2f} µs/assign, "
+              f"compiled {fast / calls * 1e6:6.2f} µs/assign  (x{legacy / fast:.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Update throughput: threaded TeleBot engine vs asyncio engine against a local fake Bot API.
+
+The fake server answers every Bot API method after a fixed delay (network round trip).
+Every simulated player starts the game with /start and then presses random inline
+buttons, each press waiting for the previous one to finish.
+The threaded mode runs the players on a pool the size of TeleBot's default worker pool.
+Run from the project root:  python -m benchmarks.bench_async [players] [presses] [delay_ms] [threads]
+"""
+import asyncio
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+from telebot import apihelper, asyncio_helper, types
+from telebot.async_telebot import AsyncTeleBot
+from config import bot, config
+from utils.state_manager import reset_state, state_cache
+from utils.async_engine import AsyncEngine
+import handlers.game_handler  # noqa: F401  registers the game handlers
+
+
+class FakeBotApi:
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = 0
+        self.port = None
+        self._ready = threading.Event()
+        threading.Thread(target=self._serve, daemon=True).start()
+        self._ready.wait()
+
+    async def _handle(self, request):
+        params = dict(request.query)
+        if request.can_read_body:
+            params.update(await request.post())
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        result = {"message_id": self.calls, "date": int(time.time()),
+                  "chat": {"id": int(params.get("chat_id", 0)), "type": "private"}}
+        if request.match_info["method"].lower() == "sendphoto":
+            result["photo"] = [{"file_id": f"photo-{self.calls}", "file_unique_id": str(self.calls),
+                                "width": 1, "height": 1}]
+        return web.json_response({"ok": True, "result": result})
+
+    def _serve(self):
+        async def start():
+            app = web.Application()
+            app.router.add_post("/bot{token}/{method}", self._handle)
+            app.router.add_get("/bot{token}/{method}", self._handle)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            self.port = site._server.sockets[0].getsockname()[1]
+            self._ready.set()
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(start())
+        loop.run_forever()
+
+
+def start_message(chat_id):
+    return types.Message.de_json({"message_id": 1, "date": 0, "text": "/start",
+                                  "chat": {"id": chat_id, "type": "private"},
+                                  "from": {"id": chat_id, "is_bot": False, "first_name": "p"},
+                                  "entities": [{"type": "bot_command", "offset": 0, "length": 6}]})
+
+
+def button_press(chat_id, data):
+    return types.CallbackQuery.de_json({"id": "1", "chat_instance": "1", "data": data,
+                                        "from": {"id": chat_id, "is_bot": False, "first_name": "p"},
+                                        "message": {"message_id": 1, "date": 0,
+                                                    "chat": {"id": chat_id, "type": "private"}}})
+
+
+def next_update(chat_id, rng):
+    """Random game button of the current chapter, /start again when the quest ended."""
+    options = [text for text in state_cache[chat_id]["options"] if not text.endswith("_actions")]
+    if not options:
+        reset_state(chat_id)
+        return bot.process_new_messages, [start_message(chat_id)]
+    return bot.process_new_callback_query, [button_press(chat_id, rng.choice(options))]
+
+
+def players_range(players):
+    return range(1_000_000, 1_000_000 + players)
+
+
+def run_threaded(players, presses, threads):
+    def play(chat_id):
+        rng = random.Random(chat_id)
+        reset_state(chat_id)
+        bot.process_new_messages([start_message(chat_id)])
+        for _ in range(presses):
+            func, updates = next_update(chat_id, rng)
+            func(updates)
+
+    bot.threaded = False  # the pool below plays the part of TeleBot's worker threads
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(play, players_range(players)))
+
+
+async def run_async(players, presses):
+    engine = AsyncEngine(AsyncTeleBot(config.TOKEN))
+
+    async def play(chat_id):
+        rng = random.Random(chat_id)
+        reset_state(chat_id)
+        await engine.process(chat_id, bot.process_new_messages, [start_message(chat_id)])
+        for _ in range(presses):
+            func, updates = next_update(chat_id, rng)
+            await engine.process(chat_id, func, updates)
+
+    try:
+        await asyncio.gather(*(play(chat_id) for chat_id in players_range(players)))
+    finally:
+        engine.close()
+        await engine.async_bot.close_session()
+    return engine
+
+
+def measure(label, server, run, updates):
+    calls = server.calls
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = run()
+    elapsed = time.perf_counter() - start
+    print(f"{label:9}: {elapsed:6.2f} s, {updates / elapsed:7.1f} updates/s, "
+          f"{(server.calls - calls) / updates:.2f} API calls/update")
+    return result
+
+
+def main():
+    players = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    presses = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    delay_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 30
+    threads = int(sys.argv[4]) if len(sys.argv) > 4 else 2  # TeleBot(num_threads=2) default
+
+    server = FakeBotApi(delay_ms / 1000)
+    url = f"http://127.0.0.1:{server.port}/bot{{0}}/{{1}}"
+    apihelper.API_URL = asyncio_helper.API_URL = url
+    updates = players * (presses + 1)
+    print(f"{players} players x {presses + 1} updates, Bot API round trip {delay_ms:.0f} ms")
+    with tempfile.TemporaryDirectory() as tmp:
+        config.MEDIA_CACHE_FILE = os.path.join(tmp, "media_cache.json")  # fake file_ids stay out of data/
+        measure(f"threaded{threads}", server, lambda: run_threaded(players, presses, threads), updates)
+        engine = measure("asyncio", server, lambda: asyncio.run(run_async(players, presses)), updates)
+    print(f"asyncio engine: {engine.stats}")
+
+
+if __name__ == "__main__":
+    main()
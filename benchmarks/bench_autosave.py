@@ -0,0 +1,52 @@
+"""Autosave: cost of a write-behind pass and of restoring sessions after a restart.
+
+A number of sessions (a real state of the first chapter) are changed, then one autosave
+pass writes them in a batch: JSON files vs SQLite. After a "restart" (a new cache over the
+same store) every session is read back on its first lookup.
+Run from the project root:  python -m benchmarks.bench_autosave [sessions]
+"""
+import os
+import sys
+import tempfile
+import time
+from config import config
+from benchmarks.bench_saves import sample_state
+from utils.save_store import JsonSaveStore, SqliteSaveStore
+from utils.session_cache import SessionCache
+
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    state = sample_state()
+    print(f"{sessions} changed sessions")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, store in (("json", JsonSaveStore(tmp, config.SAVES_LIMIT)),
+                             ("sqlite", SqliteSaveStore(os.path.join(tmp, "saves.db"), config.SAVES_LIMIT))):
+            cache = SessionCache(store, max_entries=sessions)
+            for chat_id in range(sessions):
+                cache[chat_id] = dict(state, gold=chat_id)
+
+            start = time.perf_counter()
+            written, _ = cache.flush_dirty()
+            flushed = time.perf_counter() - start
+
+            for chat_id in range(sessions):
+                cache.get(chat_id)  # looked up, not changed
+            start = time.perf_counter()
+            _, unchanged = cache.flush_dirty()
+            skipped = time.perf_counter() - start
+
+            restarted = SessionCache(store, max_entries=sessions)
+            start = time.perf_counter()
+            for chat_id in range(sessions):
+                assert restarted.get(chat_id)["gold"] == chat_id
+            restored = time.perf_counter() - start
+
+            print(f"{label:6} pass: {written} written in {flushed * 1000:7.1f} ms, "
+                  f"{unchanged} unchanged in {skipped * 1000:6.1f} ms; "
+                  f"restore {restored / sessions * 1e6:6.1f} us per session")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Startup time and resident memory: chapters.json vs the compiled msgpack bundle.
+
+Every measurement runs in a fresh interpreter so RSS isn't shared between the two loaders.
+Run from the project root:  python -m benchmarks.bench_bundle
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+CHAPTERS_FILE = "data/chapters.json"
+
+
+def resident_kib():
+    # Current RSS from /proc (Linux); falls back to the peak RSS elsewhere
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def child(mode, path):
+    from utils.bundle import load_bundle
+    before = resident_kib()
+    start = time.perf_counter()
+    if mode == "json":
+        with open(path, "r", encoding="utf-8") as file:
+            chapters = json.load(file)
+    else:
+        chapters = load_bundle(path)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"ms": elapsed * 1000, "rss_kib": resident_kib() - before, "chapters": len(chapters)}))
+
+
+def measure(mode, path, runs):
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-m", "benchmarks.bench_bundle", "--child", mode, path],
+                                capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output))
+    results.sort(key=lambda r: r["ms"])
+    return results[len(results) // 2]
+
+
+def main(runs=9):
+    from utils.bundle import save_bundle
+    with open(CHAPTERS_FILE, "r", encoding="utf-8") as file:
+        chapters = json.load(file)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bundle_path = os.path.join(tmp, "chapters.msgpack")
+        save_bundle(chapters, bundle_path)
+
+        print(f"{len(chapters)} chapters, median of {runs} fresh processes")
+        for mode, path in (("json", CHAPTERS_FILE), ("bundle", bundle_path)):
+            result = measure(mode, path, runs)
+            print(f"{mode:7s} {os.path.getsize(path) / 1024:7.0f} KiB on disk  "
+                  f"{result['ms']:6.1f} ms load  {result['rss_kib']:6d} KiB resident")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--child":
+        child(sys.argv[2], sys.argv[3])
+    else:
+        main()
@@ -0,0 +1,73 @@
+"""Button actions: bytes per session with copied action lists vs references into the quest.
+
+A population of players is spread over the quest chapters (every chapter is opened with
+send_chapter). Each session is measured as it is written to a save slot / the session
+store (JSON) and in memory after it is read back, as after a restart or an eviction.
+"Copies" replaces every ActionRef with the button's actions, as the options held before.
+Run from the project root:  python -m benchmarks.bench_button_refs [players]
+"""
+import contextlib
+import gc
+import io
+import json
+import random
+import sys
+import tracemalloc
+from unittest.mock import patch
+from config import bot, config
+from handlers.game_handler import send_chapter
+from utils import state_manager
+from utils.actions import ActionRef, button_actions
+
+
+def play(players):
+    rng = random.Random(1)
+    chapters = list(config.chapters.keys())
+    cache = {}
+    with patch.object(state_manager, "state_cache", cache), \
+         patch("handlers.game_handler.state_cache", cache), \
+         contextlib.redirect_stdout(io.StringIO()):
+        for chat_id in range(players):
+            state = state_manager.get_state(chat_id)
+            state["chapter"] = config.chapters.id_of(rng.choice(chapters))
+            send_chapter(chat_id)
+    return list(cache.values())
+
+
+def with_copies(state):
+    options = {}
+    for text, target in state["options"].items():
+        if isinstance(target, ActionRef):
+            target = button_actions(config.chapters.get(target.chapter), target, text[:-len("_actions")])
+        options[text] = target
+    return dict(state, options=options)
+
+
+def measure(label, states):
+    saved = [json.dumps(state_manager.state_cache.dump(state), ensure_ascii=False) for state in states]
+    gc.collect()
+    tracemalloc.start()
+    restored = [state_manager.state_cache.load(json.loads(text)) for text in saved]
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    count = len(states)
+    print(f"{label:7}: {sum(len(text.encode()) for text in saved) / count:8.1f} bytes per saved session, "
+          f"{memory / count:8.1f} bytes per restored session")
+    return restored
+
+
+def main():
+    players = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    bot.send_message = bot.send_photo = lambda *args, **kwargs: None  # no Telegram
+    states = play(players)
+    buttons = [state for state in states if any(isinstance(target, ActionRef) for target in state["options"].values())]
+    print(f"{players} players, {len(buttons)} of them see buttons with actions")
+
+    for label, population in (("all", states), ("buttons", buttons)):
+        print(f"-- {label} sessions")
+        measure("copies", [with_copies(state) for state in population])
+        measure("refs", population)
+
+
+if __name__ == "__main__":
+    main()
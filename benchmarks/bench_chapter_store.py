@@ -0,0 +1,71 @@
+"""Cold start and resident memory: eager chapters dict vs the lazy memory-mapped ChapterStore.
+
+Runs on the shipped quest and on a synthetic quest made of copies of it.
+Every measurement runs in a fresh interpreter.
+Run from the project root:  python -m benchmarks.bench_chapter_store
+"""
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.bench_bundle import resident_kib
+
+CHAPTERS_FILE = "data/chapters.json"
+
+
+def child(mode, path, index_path, lookups):
+    from utils.bundle import load_bundle, ChapterStore
+    before = resident_kib()
+    start = time.perf_counter()
+    chapters = load_bundle(path) if mode == "eager" else ChapterStore(path, index_path, cache_size=256)
+    opened = time.perf_counter() - start
+    rss_open = resident_kib() - before
+
+    keys = list(chapters)
+    rng = random.Random(7)
+    start = time.perf_counter()
+    for _ in range(lookups):
+        chapters[keys[int(rng.paretovariate(1.2)) % len(keys)]]  # few hot chapters, long tail
+    lookup = (time.perf_counter() - start) / lookups
+    print(json.dumps({"open_ms": opened * 1000, "rss_open": rss_open, "rss_after": resident_kib() - before,
+                      "lookup_us": lookup * 1e6, "chapters": len(keys)}))
+
+
+def synthetic(chapters, copies):
+    quest = {}
+    for copy in range(copies):
+        for key, actions in chapters.items():
+            quest[f"{key}~{copy}" if copy else key] = actions
+    return quest
+
+
+def main(runs=5, lookups=20000):
+    from utils.bundle import save_bundle
+    with open(CHAPTERS_FILE, "r", encoding="utf-8") as file:
+        chapters = json.load(file)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for copies in (1, 20):
+            path, index_path = os.path.join(tmp, f"q{copies}.msgpack"), os.path.join(tmp, f"q{copies}.idx")
+            save_bundle(synthetic(chapters, copies), path, index_path)
+            for mode in ("eager", "lazy"):
+                results = []
+                for _ in range(runs):
+                    output = subprocess.run(
+                        [sys.executable, "-m", "benchmarks.bench_chapter_store", "--child", mode, path, index_path, str(lookups)],
+                        capture_output=True, text=True, check=True).stdout
+                    results.append(json.loads(output))
+                r = sorted(results, key=lambda r: r["open_ms"])[runs // 2]
+                print(f"{r['chapters']:6d} chapters {mode:5s}: open {r['open_ms']:7.1f} ms, "
+                      f"RSS {r['rss_open']:6d} KiB after open / {r['rss_after']:6d} KiB after {lookups} lookups, "
+                      f"{r['lookup_us']:5.1f} µs/lookup")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 6 and sys.argv[1] == "--child":
+        child(sys.argv[2], sys.argv[3], sys.argv[4], int(sys.argv[5]))
+    else:
+        main()
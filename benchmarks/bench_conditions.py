@@ -0,0 +1,124 @@
+"""Microbenchmark: compiled conditions vs the old regex + eval() path.
+
+Run from the project root:  python -m benchmarks.bench_conditions
+"""
+import contextlib
+import io
+import random
+import re
+import time
+from config import config
+from utils.actions import actions_to_dicts
+from utils.expressions import compile_condition
+
+
+# ✅ Reference implementation (evaluate_condition before the condition compiler)
+def legacy_evaluate_condition(state, condition):
+    print(f"🔎 Original condition: {condition}")
+    condition = condition.replace("=>", ">=")
+    condition = condition.replace("=<", "<=")
+    condition = re.sub(r'(?<!<|>|!)=(?!=)', '==', condition)
+
+    parts = [part.strip() for part in re.split(r'(\band\b|\bor\b|\bnot\b)', condition) if part.strip()]
+    evaluated_parts = []
+    for part in parts:
+        if part in {"and", "or", "not"}:
+            evaluated_parts.append(part)
+        elif any(op in part for op in {">", "<", ">=", "<=", "==", "!="}):
+            evaluated_part = re.sub(r'\b([A-Za-z_][A-Za-z0-9_]*)\b',
+                                    lambda m: legacy_replace_variable(m.group(1).strip(), state),
+                                    part)
+            evaluated_parts.append(f"({evaluated_part})")
+        else:
+            evaluated_parts.append("True" if part in state['inventory'] else "False")
+
+    final_condition = " ".join(evaluated_parts)
+    print(f"⚙️ Final expression for eval: {final_condition}")
+    try:
+        local_vars = {k: v["value"] for k, v in state["characteristics"].items()}
+        local_vars["state"] = state
+        result = eval(final_condition, {}, local_vars)
+        print(f"Result of eval(): {result}")
+        return result
+    except Exception as e:
+        print(f"❌ Error in evaluate_condition: {e}")
+        return False
+
+
+def legacy_replace_variable(var_name, state):
+    if var_name in {"and", "or", "not", "in", "state", "inventory"}:
+        return var_name
+    key = var_name.lower()
+    if key in state["characteristics"]:
+        value = state["characteristics"][key].get("value", 0)
+        print(f"Substituting from characteristics: {var_name} = {value}")
+        return str(value)
+    if key in [item.lower() for item in state["inventory"]]:
+        print(f"Substituting from inventory: {var_name} = True")
+        return "True"
+    print(f"⚠️ Variable {var_name} not found")
+    return "False"
+
+
+def collect_actions(action_type, chapters=None):
+    """All actions of one type in the quest (dict form), including nested if/xbtn actions."""
+    found = []
+
+    def walk(actions):
+        for action in actions:
+            if action["type"] == action_type:
+                found.append(action)
+            if action["type"] == "if":
+                walk(action["value"]["actions"])
+                walk(action["value"].get("else_actions", []))
+            elif action["type"] == "xbtn":
+                walk(action["value"].get("actions", []))
+
+    for actions in (chapters or config.chapters).values():
+        walk(actions_to_dicts(actions))  # loaded chapters are opcode tuples
+    return found
+
+
+def random_state(conditions, rng):
+    # Every identifier seen in the quest gets a small random value, half of the items are owned
+    names = set()
+    for condition in conditions:
+        names.update(re.findall(r'[A-Za-z_][A-Za-z0-9_]*', condition))
+    items = [c for c in conditions if not any(op in c for op in "<>=")]
+    return {
+        "characteristics": {name: {"name": "", "value": rng.randint(-1, 12)} for name in names if rng.random() < 0.8},
+        "inventory": [item for item in items if rng.random() < 0.5],
+    }
+
+
+def timed(func, conditions, states, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for state in states:
+            for condition in conditions:
+                func(state, condition)
+    return time.perf_counter() - start
+
+
+def main(rounds=20):
+    conditions = [action["value"]["condition"] for action in collect_actions("if")]
+    rng = random.Random(42)
+    states = [random_state(conditions, rng) for _ in range(10)]
+    compiled = lambda state, condition: compile_condition(condition)(state)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for state in states:
+            for condition in conditions:
+                expected = bool(legacy_evaluate_condition(state, condition))
+                assert bool(compiled(state, condition)) == expected, condition
+        legacy = timed(legacy_evaluate_condition, conditions, states, rounds)
+    fast = timed(compiled, conditions, states, rounds)
+
+    calls = rounds * len(states) * len(conditions)
+    print(f"conditions: {len(conditions)} ({len(set(conditions))} distinct), calls: {calls}")
+    print(f"legacy regex + eval : {legacy / calls * 1e6:8.2f} µs/call")
+    print(f"compiled closures   : {fast / calls * 1e6:8.2f} µs/call  (x{legacy / fast:.1f})")
+
+
+if __name__ == "__main__":
+    main()
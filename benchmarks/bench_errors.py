@@ -0,0 +1,56 @@
+"""Error storm: cost of reporting the same handler error many times.
+
+A handler fails with the same exception (a bad chapter hit by every player). "Before"
+formats the traceback twice and appends it to the log file inside the handler, as
+safe_handler did; "after" goes through ErrorReporter (one record per window, background
+writer). Analytics is disabled in both.
+Run from the project root:  python -m benchmarks.bench_errors [errors]
+"""
+import os
+import sys
+import tempfile
+import time
+import traceback
+from datetime import datetime
+from utils.error_handler import ErrorReporter
+
+
+def bad_chapter(chapters):
+    return chapters["missing"]
+
+
+def before(path, error):
+    error_message = f"❌ Ошибка в обработчике handle_inline_choice: {error}\n{traceback.format_exc()}"
+    with open(path, "a", encoding="utf-8") as log_file:
+        log_file.write(f"{datetime.now()} - {error_message}\n")
+    traceback.format_exc()[:1000]  # analytics params
+
+
+def storm(errors, report):
+    start = time.perf_counter()
+    for _ in range(errors):
+        try:
+            bad_chapter({})
+        except KeyError as e:
+            report(e)
+    return time.perf_counter() - start
+
+
+def main():
+    errors = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    print(f"{errors} identical errors")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "before.log")
+        elapsed = storm(errors, lambda e: before(path, e))
+        print(f"before: {elapsed / errors * 1e6:6.1f} us per error, {os.path.getsize(path) / 2 ** 20:7.2f} MiB written")
+
+        path = os.path.join(tmp, "after.log")
+        reporter = ErrorReporter(path, send=lambda *args: None)
+        elapsed = storm(errors, lambda e: reporter.report("handle_inline_choice", e, 42, context="обработчике"))
+        reporter.close()
+        print(f"after : {elapsed / errors * 1e6:6.1f} us per error, {os.path.getsize(path) / 2 ** 20:7.2f} MiB written"
+              f" ({reporter.stats})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Parse time and peak memory on a large synthetic quest: split + if-chain vs streaming lexer.
+
+The quest is data/input.txt repeated until it reaches ~50 MB, chapter names suffixed per copy.
+Each variant runs in its own process so peak RSS isn't shared.
+
+Run from the project root:  python -m benchmarks.bench_lexer [size_mb]
+"""
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from utils import parser
+
+INPUT_FILE = "data/input.txt"
+
+
+# ✅ parse_action before the table dispatch (kept here for comparison)
+def legacy_parse_action(line, usable_items, chapter_id, rest_data):
+    line_lower = line.lower()
+    if line.strip().startswith(';') or line.startswith('Pause'):
+        return None
+    if line.lower().startswith('pln'):
+        return {"type": "text", "value": line[4:].strip()}
+    elif line.lower().startswith('btn'):
+        parts = line[4:].split(',', 1)
+        if len(parts) == 2:
+            return {"type": "btn", "value": {"text": parts[1].strip(), "target": parts[0].strip().lower()}}
+        rest_data.append(f"{chapter_id}: {line}")
+        return {"type": "unknown", "value": line}
+    elif line.lower().startswith('inv+') or line.lower().startswith('inv-'):
+        return parser.parse_inventory_action(line, usable_items, rest_data, chapter_id)
+    elif line.lower().startswith('goto '):
+        return {"type": "goto", "value": line[5:].strip().lower()}
+    elif line.lower().startswith('if '):
+        return parser.parse_if_action(line, usable_items, chapter_id, rest_data)
+    elif line_lower.startswith('xbtn'):
+        return parser.parse_xbtn_action(line, usable_items, chapter_id, rest_data)
+    elif line_lower.startswith('image'):
+        return parser.parse_image_action(line)
+    elif line_lower.startswith('end') and line.strip().lower() == 'end':
+        return {"type": "end", "value": ""}
+    elif '=' in line:
+        return parser.parse_assign_action(line)
+    rest_data.append(f"{chapter_id}: {line}")
+    return {"type": "unknown", "value": line}
+
+
+def legacy_parse(input_path):
+    parser.parse_action = legacy_parse_action
+    chapters = parser.split_into_chapters(parser.read_file(input_path))
+    usable_items = parser.collect_usable_items(chapters)
+    json_data, rest_data = {}, []
+    for chapter in chapters:
+        chapter_id, actions = parser.parse_chapter(chapter, usable_items, rest_data)
+        json_data[chapter_id] = actions
+    return json_data, rest_data
+
+
+def make_quest(path, size_mb):
+    with open(INPUT_FILE, encoding="utf-8") as file:
+        source = file.read()
+    # Suffix chapter names (headers and btn/goto/xbtn targets) so every copy is a separate chapter set
+    header = re.compile(r'^:(\S+)', re.M)
+    target = re.compile(r'\b(btn|goto|xbtn)(\s+)([^,&\s]+)', re.I)
+    with open(path, "w", encoding="utf-8") as file:
+        copy = 0
+        while file.tell() < size_mb * 1024 * 1024:
+            text = header.sub(lambda m: f":{m.group(1)}_{copy}", source)
+            text = target.sub(lambda m: f"{m.group(1)}{m.group(2)}{m.group(3)}_{copy}", text)
+            file.write(text.rstrip("\n") + "\n")
+            copy += 1
+    return copy
+
+
+def child(variant, input_path):
+    start = time.perf_counter()
+    if variant == "legacy":
+        chapters, rest = legacy_parse(input_path)
+    else:
+        chapters, rest = parser.parse_input_to_json(input_path)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    digest = hash(json.dumps([chapters, rest], ensure_ascii=False))
+    print(json.dumps({"seconds": elapsed, "peak_kib": peak, "chapters": len(chapters), "digest": digest}))
+
+
+def run(variant, input_path):
+    env = dict(os.environ, PYTHONHASHSEED="0")
+    output = subprocess.run([sys.executable, "-m", "benchmarks.bench_lexer", "--child", variant, input_path],
+                            check=True, capture_output=True, text=True, env=env).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    size_mb = float(sys.argv[1]) if len(sys.argv) > 1 else 50
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, "quest.txt")
+        copies = make_quest(input_path, size_mb)
+        print(f"synthetic quest: {os.path.getsize(input_path) / 1024 / 1024:.1f} MB, {copies} copies of {INPUT_FILE}")
+
+        results = {variant: run(variant, input_path) for variant in ("legacy", "streaming")}
+        assert results["legacy"]["digest"] == results["streaming"]["digest"], "streaming output differs"
+        for variant, result in results.items():
+            print(f"{variant:9}: {result['seconds']:6.2f} s, peak RSS {result['peak_kib'] / 1024:7.1f} MiB, "
+                  f"{result['chapters']} chapters")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        child(sys.argv[2], sys.argv[3])
+    else:
+        main()
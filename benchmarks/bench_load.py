@@ -0,0 +1,245 @@
+"""Load test: simulated players random-walking the quest on each engine mode, results as JSON.
+
+Every player has its own chat ID. It starts with /start and then presses a random game
+button of the inline options its last chapter produced (handle_inline_choice), /start
+again when a path ends. Players move in steps: one update each, the next step once the
+previous one is handled. The Bot API is replaced by an in-process fake that answers at
+once, so the numbers are the engine's own cost.
+Engines (ENGINES; add a function there for a new engine mode):
+  inline     - the handlers called directly
+  telebot    - TeleBot.process_new_updates, no worker threads
+  dispatcher - utils.dispatcher.ChatDispatcher (UPDATE_WORKERS threads)
+  asyncio    - utils.async_engine.AsyncEngine
+Per engine: updates/s, p50/p99 handler latency (for asyncio without the sends, made after
+the handler), API calls per update and bytes per session (sessions read back from their
+saved form, as after a restart).
+Run from the project root:
+  python -m benchmarks.bench_load [engines|all] [players] [steps] [output.json]
+"""
+import asyncio
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from telebot import apihelper, asyncio_helper, types
+from telebot.async_telebot import AsyncTeleBot
+from config import bot, config
+from utils import dispatcher
+from utils.state_manager import reset_state, state_cache
+import handlers.game_handler  # noqa: F401  registers the game handlers
+
+
+class FakeBotApi:
+    """Bot API answered in-process (TeleBot and AsyncTeleBot), counting the calls."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def result(self, method_name, params):
+        self.calls += 1
+        result = {"message_id": self.calls, "date": 0,
+                  "chat": {"id": int((params or {}).get("chat_id", 0)), "type": "private"}}
+        if method_name.lower() == "sendphoto":
+            result["photo"] = [{"file_id": f"photo-{self.calls}", "file_unique_id": str(self.calls),
+                                "width": 1, "height": 1}]
+        return result
+
+    def make_request(self, token, method_name, method='get', params=None, files=None):
+        return self.result(method_name, params)
+
+    async def process_request(self, token, url, method='get', params=None, files=None, **kwargs):
+        return self.result(url, params)
+
+    def install(self):
+        apihelper._make_request = self.make_request
+        asyncio_helper._process_request = self.process_request
+
+
+def update(update_id, chat_id, data=None):
+    """/start (data None) or a press of the button data, as an Update from Telegram."""
+    user = {"id": chat_id, "is_bot": False, "first_name": "p"}
+    chat = {"id": chat_id, "type": "private"}
+    if data is None:
+        return types.Update.de_json({"update_id": update_id, "message": {
+            "message_id": 1, "date": 0, "text": "/start", "chat": chat, "from": user,
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}]}})
+    return types.Update.de_json({"update_id": update_id, "callback_query": {
+        "id": str(update_id), "chat_instance": "1", "data": data, "from": user,
+        "message": {"message_id": 1, "date": 0, "chat": chat}}})
+
+
+def steps(chats, count, seed):
+    """count + 1 lists with one update per player, made when the previous list is handled."""
+    rngs = [random.Random(seed * 1_000_003 + chat_id) for chat_id in chats]
+    for chat_id in chats:
+        reset_state(chat_id)
+    yield [update(chat_id, chat_id) for chat_id in chats]
+    for step in range(1, count + 1):
+        updates = []
+        for chat_id, rng in zip(chats, rngs):
+            state = state_cache.get(chat_id)
+            buttons = [text for text in (state or {}).get("options", ()) if not text.endswith("_actions")]
+            if not buttons:  # the end of a path (or an error): start over
+                reset_state(chat_id)
+                updates.append(update(step, chat_id))
+            else:
+                updates.append(update(step, chat_id, rng.choice(buttons)))
+        yield updates
+
+
+# ✅ Engine modes: each handles the steps of the players and returns when all are done
+
+def run_inline(chats, count, seed):
+    functions = {handler["function"].__name__: handler["function"] for handler in bot.callback_query_handlers +
+                 bot.message_handlers}
+    for updates in steps(chats, count, seed):
+        for item in updates:
+            if item.message is not None:
+                functions["start_game"](item.message)
+            else:
+                functions["handle_inline_choice"](item.callback_query)
+
+
+def run_telebot(chats, count, seed):
+    bot.threaded = False
+    for updates in steps(chats, count, seed):
+        for item in updates:
+            bot.process_new_updates([item])
+
+
+def run_dispatcher(chats, count, seed):
+    bot.threaded = False
+    chat_dispatcher = dispatcher.ChatDispatcher(bot.process_new_updates, config.UPDATE_WORKERS)
+    try:
+        for updates in steps(chats, count, seed):
+            chat_dispatcher.process_new_updates(updates)
+            chat_dispatcher.join()
+    finally:
+        chat_dispatcher.shutdown()
+
+
+def run_asyncio(chats, count, seed):
+    from utils.async_engine import AsyncEngine
+
+    engine = AsyncEngine(AsyncTeleBot(config.TOKEN))  # records bot.send_* while it handles an update
+
+    async def play():  # no aiohttp session to close: the fake API answers in-process
+        for updates in steps(chats, count, seed):
+            await asyncio.gather(*(engine.process(dispatcher.update_chat_id(item), bot.process_new_updates, [item])
+                                   for item in updates))
+
+    try:
+        asyncio.run(play())
+    finally:
+        engine.close()  # the other engines send directly again
+
+
+ENGINES = {"inline": run_inline, "telebot": run_telebot, "dispatcher": run_dispatcher, "asyncio": run_asyncio}
+
+
+def timed_handlers(latencies):
+    """Replace every bot handler with one recording its duration; returns the originals."""
+    handlers = bot.message_handlers + bot.callback_query_handlers
+    originals = [handler["function"] for handler in handlers]
+
+    def timed(func):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                latencies.append(time.perf_counter() - start)
+        wrapper.__name__ = func.__name__
+        return wrapper
+
+    for handler, function in zip(handlers, originals):
+        handler["function"] = timed(function)
+    return originals
+
+
+def session_bytes(chats):
+    """Average memory of the players' sessions, read back from their saved (JSON) form."""
+    saved = [json.dumps(state_cache.dump(state), ensure_ascii=False)
+             for state in map(state_cache.get, chats) if state is not None]
+    gc.collect()
+    tracemalloc.start()
+    restored = [state_cache.load(json.loads(text)) for text in saved]
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del restored
+    return memory / len(saved) if saved else 0
+
+
+def measure(name, api, players, count, seed):
+    chats = list(range(1_000_000, 1_000_000 + players))
+    latencies = []
+    originals = timed_handlers(latencies)
+    calls = api.calls
+    try:
+        gc.collect()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            ENGINES[name](chats, count, seed)
+        elapsed = time.perf_counter() - start
+    finally:
+        for handler, function in zip(bot.message_handlers + bot.callback_query_handlers, originals):
+            handler["function"] = function
+
+    updates = players * (count + 1)
+    percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [0.0] * 99
+    return {
+        "engine": name,
+        "updates": updates,
+        "seconds": round(elapsed, 4),
+        "updates_per_second": round(updates / elapsed, 1),
+        "handler_p50_ms": round(percentiles[49] * 1000, 4),
+        "handler_p99_ms": round(percentiles[98] * 1000, 4),
+        "api_calls_per_update": round((api.calls - calls) / updates, 3),
+        "bytes_per_session": round(session_bytes(chats), 1),
+    }
+
+
+def main():
+    engines = sys.argv[1] if len(sys.argv) > 1 else "all"
+    players = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    count = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    output = sys.argv[4] if len(sys.argv) > 4 else None
+    names = list(ENGINES) if engines == "all" else engines.split(",")
+    unknown = [name for name in names if name not in ENGINES]
+    if unknown:
+        sys.exit(f"Unknown engine {', '.join(unknown)}: choose from {', '.join(ENGINES)} or all")
+
+    api = FakeBotApi()
+    api.install()
+    report = {
+        "players": players, "steps": count, "seed": 1,
+        "chapters": len(config.chapters), "python": platform.python_version(),
+        "results": [],
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        config.MEDIA_CACHE_FILE = os.path.join(tmp, "media_cache.json")  # fake file_ids stay out of data/
+        for name in names:
+            result = measure(name, api, players, count, report["seed"])
+            report["results"].append(result)
+            print(f"{name:10}: {result['updates_per_second']:8.1f} updates/s, p50 {result['handler_p50_ms']:.3f} ms,"
+                  f" p99 {result['handler_p99_ms']:.3f} ms, {result['api_calls_per_update']:.2f} API calls/update,"
+                  f" {result['bytes_per_session']:.0f} bytes/session", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Logging cost of send_chapter on the shipped quest.
+
+Every chapter of the quest is opened with send_chapter (Telegram calls are no-ops, log
+output goes to /dev/null). Compared:
+  print-like   — DEBUG, each record formatted and written by the handler thread, as the
+                 print calls did before
+  debug queue  — DEBUG through the queue of utils/log.py (written by the log thread)
+  production   — the production default (INFO): no debug message is formatted
+Run from the project root:  python -m benchmarks.bench_logging [views]
+"""
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from config import bot, config
+from handlers.game_handler import send_chapter
+from utils import log
+from utils.state_manager import reset_state
+
+
+def play(views):
+    chapters = list(config.chapters.keys())
+    start = time.perf_counter()
+    for view in range(views):
+        state = reset_state(1)
+        state["chapter"] = config.chapters.id_of(chapters[view % len(chapters)])
+        send_chapter(1)
+    return time.perf_counter() - start
+
+
+def main():
+    views = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    bot.send_message = bot.send_photo = lambda *args, **kwargs: None  # no Telegram
+    log.stop()
+    root = logging.getLogger()
+    devnull = open(os.devnull, "w", encoding="utf-8")
+    print(f"{views} chapter views")
+
+    for label, level, queued in (("print-like", "DEBUG", False), ("debug queue", "DEBUG", True),
+                                 ("production", "INFO", True)):
+        handler = logging.StreamHandler(devnull)
+        handler.setFormatter(logging.Formatter(log.FORMAT if queued else "%(message)s"))
+        listener = None
+        if queued:
+            records = queue.Queue(config.LOG_QUEUE_SIZE)
+            listener = logging.handlers.QueueListener(records, handler)
+            listener.start()
+            handler = log.DroppingQueueHandler(records)
+        root.handlers[:] = [handler]
+        root.setLevel(level)
+
+        play(min(views, 500))  # warm up: chapters decoded, expressions compiled
+        dropped = log.stats["dropped"]
+        elapsed = play(views)
+        if listener:
+            listener.stop()
+        print(f"{label:11}: {elapsed / views * 1e6:7.1f} us per send_chapter"
+              f" ({log.stats['dropped'] - dropped} records dropped)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Upload bytes per chapter view: image uploaded on every send vs Telegram file_id cache.
+
+Every chapter with an image of data/chapters.json is viewed by a number of players through
+handle_image; bot.send_photo is replaced by a fake that returns a file_id.
+Run from the project root:  python -m benchmarks.bench_media [players]
+"""
+import contextlib
+import io
+import os
+import sys
+import tempfile
+from unittest.mock import MagicMock, patch
+from config import bot, config
+from handlers.game_handler import handle_image
+from utils import media_cache
+from utils.actions import IMAGE
+
+
+def main():
+    players = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    images = [action[1] for actions in config.chapters.values() for action in actions if action[0] == IMAGE]
+    # Only images that exist on disk (the quest may reference missing ones)
+    images = [image for image in images if os.path.exists(config.DATA_DIR + image.replace("\\", "/"))]
+
+    uploaded = []
+
+    def fake_send_photo(chat_id, photo):
+        if not isinstance(photo, str):
+            uploaded.append(len(photo.read()))
+        return MagicMock(photo=[MagicMock(file_id=f"id-{len(uploaded)}")])
+
+    with tempfile.TemporaryDirectory() as tmp, \
+         patch.object(config, "MEDIA_CACHE_FILE", os.path.join(tmp, "media_cache.json")), \
+         patch.object(bot, "send_photo", side_effect=fake_send_photo), \
+         contextlib.redirect_stdout(io.StringIO()):
+        for player in range(players):
+            for image in images:
+                handle_image(player, image)
+
+    views = players * len(images)
+    without_cache = sum(os.path.getsize(config.DATA_DIR + image.replace("\\", "/")) for image in images) * players
+    print(f"{len(images)} chapters with images, {players} players, {views} image views")
+    print(f"upload per view without cache: {without_cache / views / 1024:8.1f} KiB")
+    print(f"upload per view with file_id  : {sum(uploaded) / views / 1024:8.1f} KiB "
+          f"({media_cache.stats['uploads']} uploads, {media_cache.stats['reused']} reused)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Metrics overhead: players clicking through the shipped quest with and without metrics.
+
+Button presses go through bot.process_new_callback_query (the handlers of the bot, the
+Bot API replaced by an in-process fake, see delay_ms). Rounds alternate between
+metrics off (handlers and API not instrumented) and on (utils.metrics.install), in
+alternating order; the best round of each is compared. As whole rounds vary by a few
+percent on a busy machine, the instrumentation is also costed directly: for handlers,
+send_chapter and API calls, observations per update times the extra time of an
+instrumented call over a plain one. Every Bot API call takes delay_ms (default 30, a
+Telegram round trip); 0 answers at once, the worst case for the relative overhead.
+Run from the project root:  python -m benchmarks.bench_metrics [updates per round] [rounds] [delay_ms]
+"""
+import gc
+import random
+import timeit
+import sys
+import time
+from time import perf_counter
+from types import SimpleNamespace
+import telebot.apihelper as apihelper
+import telebot.types as types
+from config import bot, config
+from handlers.game_handler import send_chapter
+from handlers.stats_handler import show_characteristics
+from handlers.inventory_handler import show_inventory
+from handlers.instruction_handler import send_instruction
+from handlers import admin_handler
+from utils import metrics
+from utils.state_manager import get_state, reset_state
+
+PLAYERS = 50
+delay = 0.0  # seconds per Bot API call
+
+
+def fake_request(token, method_name, method="get", params=None, files=None):
+    if delay:
+        time.sleep(delay)
+    return {"message_id": 1, "date": 0, "chat": {"id": int((params or {}).get("chat_id", 1)), "type": "private"}}
+
+
+def press(chat_id, data):
+    return types.CallbackQuery.de_json({
+        "id": "1", "chat_instance": "1", "data": data,
+        "from": {"id": chat_id, "is_bot": False, "first_name": "Player"},
+        "message": {"message_id": 1, "date": 0, "chat": {"id": chat_id, "type": "private"}},
+    })
+
+
+def play(updates, seed):
+    # ✅ Both modes replay the same walk: same start, same choices
+    rng = random.Random(seed)
+    for chat_id in range(1, PLAYERS + 1):
+        reset_state(chat_id)
+        send_chapter(chat_id)
+    gc.collect()
+    start = time.perf_counter()
+    for update in range(updates):
+        chat_id = update % PLAYERS + 1
+        buttons = [text for text in get_state(chat_id)["options"] if not text.endswith("_actions")]
+        if not buttons:  # the end of a path: start over
+            reset_state(chat_id)
+            send_chapter(chat_id)
+            continue
+        bot.process_new_callback_query([press(chat_id, rng.choice(buttons))])
+    return time.perf_counter() - start
+
+
+def main():
+    updates = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    global delay
+    delay = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.030
+    bot.threaded = False
+    apihelper._make_request = fake_request
+    handlers = bot.message_handlers + bot.callback_query_handlers
+
+    plain = SimpleNamespace(functions=[handler["function"] for handler in handlers], request=apihelper._make_request)
+    metrics.install(bot, SimpleNamespace(METRICS_ENABLED=True, METRICS_PORT=0))
+    timed = SimpleNamespace(functions=[handler["function"] for handler in handlers], request=apihelper._make_request)
+
+    def use(on):
+        mode = timed if on else plain
+        metrics.enabled = on
+        apihelper._make_request = mode.request
+        for handler, function in zip(handlers, mode.functions):
+            handler["function"] = function
+
+    use(False)
+    play(updates, 0)  # warm up
+    times = {False: [], True: []}
+    for seed in range(rounds):
+        for on in ((False, True) if seed % 2 else (True, False)):
+            use(on)
+            times[on].append(play(updates, seed))
+
+    off, on = min(times[False]), min(times[True])
+    print(f"{updates} updates x {rounds} rounds, Bot API round trip {delay * 1000:.0f} ms")
+    print(f"metrics off: {off / updates * 1e6:7.1f} us per update")
+    print(f"metrics on : {on / updates * 1e6:7.1f} us per update ({(on / off - 1) * 100:+.2f}%)")
+
+    # ✅ Direct costing per kind: observations per update x extra time of an instrumented call
+    # (one label, so its queue fills and is aggregated like on the hot path)
+    histograms = {"handler": metrics.handler_seconds, "chapter": metrics.chapter_seconds, "api": metrics.api_seconds}
+    observed = {}
+    for name, histogram in histograms.items():
+        histogram.aggregate()
+        observed[name] = sum(sum(series[:-1]) for series in histogram.series.values()) / (updates * rounds)
+    delay = 0.0
+
+    def cost(instrumented, bare, calls=500_000):
+        return (min(timeit.repeat(instrumented, number=calls, repeat=5)) -
+                min(timeit.repeat(bare, number=calls, repeat=5))) / calls
+
+    def handler(update):
+        return None
+    timed_handler = metrics.Histogram("bench_seconds", "", "f").time("handler", handler, one_arg=True)
+    observe = metrics.Histogram("bench_seconds", "", "f").observer()
+
+    def chapter():  # the timing send_chapter does around a render
+        start = perf_counter()
+        observe(1, perf_counter() - start)
+
+    def nothing():
+        return None
+
+    extras = {
+        "handler": cost(lambda: timed_handler(None), lambda: handler(None)),
+        "chapter": cost(chapter, nothing),
+        "api": cost(lambda: timed.request("1:a", "sendMessage"), lambda: plain.request("1:a", "sendMessage")),
+    }
+    parts, total = [], 0.0
+    for name, extra in extras.items():
+        parts.append(f"{name} {observed[name]:.1f} x {extra * 1e6:.2f} us")
+        total += observed[name] * extra
+    print(f"instrumentation: {', '.join(parts)} = {total * 1e6:.2f} us per update"
+          f" ({total / (off / updates) * 100:.2f}% of metrics off)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""Parse time of a generated quest with 1/2/4/8 worker processes (python utils/parser.py --jobs N).
+
+Run from the project root:  python -m benchmarks.bench_parallel [size_mb]
+"""
+import os
+import sys
+import tempfile
+import time
+from benchmarks.bench_lexer import make_quest
+from utils.parser import parse_input_to_json
+
+JOBS = (1, 2, 4, 8)
+
+
+def main():
+    size_mb = float(sys.argv[1]) if len(sys.argv) > 1 else 20
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, "quest.txt")
+        copies = make_quest(input_path, size_mb)
+        print(f"generated quest: {os.path.getsize(input_path) / 1024 / 1024:.1f} MB, {copies} copies, "
+              f"{os.cpu_count()} CPUs")
+
+        expected = None
+        baseline = None
+        for jobs in JOBS:
+            start = time.perf_counter()
+            result = parse_input_to_json(input_path, jobs=jobs)
+            elapsed = time.perf_counter() - start
+            if expected is None:
+                expected, baseline = result, elapsed
+            assert result == expected, f"--jobs {jobs} output differs"
+            print(f"--jobs {jobs}: {elapsed:6.2f} s  (x{baseline / elapsed:.2f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Parse time of data/input.txt: full rebuild vs incremental rebuild after small edits.
+
+Run from the project root:  python -m benchmarks.bench_parser
+"""
+import os
+import shutil
+import tempfile
+import time
+from utils.parser import parse_input_to_json
+
+INPUT_FILE = "data/input.txt"
+
+
+def timed(func, runs=7):
+    results = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        value = func()
+        results.append(time.perf_counter() - start)
+    return sorted(results)[runs // 2] * 1000, value
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, "input.txt")
+        cache_path = os.path.join(tmp, "parse_cache.msgpack")
+        shutil.copy(INPUT_FILE, input_path)
+        with open(input_path, encoding="utf-8") as file:
+            source = file.read()
+
+        def edit(new_source):
+            with open(input_path, "w", encoding="utf-8") as file:
+                file.write(new_source)
+
+        def incremental_after(new_source):
+            # Warm the cache with the original text, then time one rebuild after the edit
+            def run():
+                edit(source)
+                parse_input_to_json(input_path, cache_path)
+                edit(new_source)
+                start = time.perf_counter()
+                result = parse_input_to_json(input_path, cache_path)
+                run.elapsed = time.perf_counter() - start
+                return result
+            results = []
+            for _ in range(7):
+                result = run()
+                results.append(run.elapsed)
+            assert result == parse_input_to_json(input_path), "incremental output differs from a full parse"
+            return sorted(results)[3] * 1000
+
+        full, _ = timed(lambda: parse_input_to_json(input_path))
+        print(f"full rebuild                 : {full:6.1f} ms")
+
+        one_chapter = source.replace("PLN Однако древние легенды", "PLN Однако очень древние легенды", 1)
+        print(f"incremental, 1 chapter edited: {incremental_after(one_chapter):6.1f} ms")
+
+        use_chapter = source + "\n:use_Кольчуга\nPLN Вы поправляете кольчугу.\nEnd\n"
+        print(f"incremental, new use_ chapter: {incremental_after(use_chapter):6.1f} ms")
+        print(f"incremental, nothing changed : {incremental_after(source):6.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
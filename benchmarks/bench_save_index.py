@@ -0,0 +1,123 @@
+"""Save-slot index: file I/O of the save/load flows before and after.
+
+Every user has SAVES_LIMIT saves (a real state of the first chapter). The flows run the
+store calls of the handlers: save_game (save), load_game (list, the menu) and
+handle_load_choice (list + load of the chosen slot). "Before" reads the whole
+saves/<user>.json for every call, as the JSON store did; "after" uses the index, in memory
+(warm) and read from disk after a restart (cold). Counted per flow: files opened, bytes
+read and written, bytes of JSON decoded.
+Run from the project root:  python -m benchmarks.bench_save_index [users]
+"""
+import builtins
+import json
+import sys
+import tempfile
+from unittest.mock import patch
+from config import config
+from benchmarks.bench_saves import sample_state, save_names
+from utils import save_store
+from utils.save_store import JsonSaveStore
+
+
+class WholeFileStore(JsonSaveStore):
+    """The JSON store without the index: every call parses the user's whole file."""
+
+    def save(self, user_id, name, state):
+        slots = self._read(user_id)
+        slots[name] = state
+        for oldest in sorted(slots)[:-self.limit]:
+            del slots[oldest]
+        with open(self._path(user_id), "w", encoding="utf-8") as file:
+            json.dump(slots, file, ensure_ascii=False, indent=4)
+
+    def list(self, user_id):
+        return sorted(self._read(user_id), reverse=True)
+
+    def load(self, user_id, name=None):
+        slots = self._read(user_id)
+        if name is None:
+            name = max(slots, default=None)
+        return (name, slots[name]) if name in slots else (None, None)
+
+
+class Counter:
+    def __init__(self):
+        self.io = dict.fromkeys(("opened", "read", "written", "decoded"), 0)
+
+    def open(self, *args, **kwargs):
+        file = real_open(*args, **kwargs)
+        self.io["opened"] += 1
+        counter = self
+
+        class Counted:
+            def __getattr__(self, name):
+                return getattr(file, name)
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return file.__exit__(*exc)
+
+            def read(self, *args):
+                data = file.read(*args)
+                counter.io["read"] += len(data)
+                return data
+
+            def write(self, data):
+                counter.io["written"] += len(data)
+                return file.write(data)
+
+        return Counted()
+
+    def loads(self, text, *args, **kwargs):
+        self.io["decoded"] += len(text)
+        return real_loads(text, *args, **kwargs)
+
+    def load(self, file, *args, **kwargs):
+        return self.loads(file.read(), *args, **kwargs)
+
+
+real_open, real_loads = builtins.open, json.loads
+
+
+def run(label, make_store, saves_dir, users, state, restarts):
+    store = make_store(saves_dir)
+    for user_id in range(users):
+        store.list(user_id)  # older saves get their index here, not in the measured flows
+    flows = {
+        "save": lambda store, user_id: store.save(user_id, "2025-01-02 10:00:00", state),
+        "menu": lambda store, user_id: store.list(user_id),
+        "choose": lambda store, user_id: store.load(user_id, store.list(user_id)[1]),
+    }
+    for cold in restarts:
+        for flow, call in flows.items():
+            counter = Counter()
+            if cold:
+                store = make_store(saves_dir)  # restart: nothing in memory
+            with patch.object(builtins, "open", counter.open), \
+                 patch.object(save_store.json, "load", counter.load), \
+                 patch.object(save_store.json, "loads", counter.loads):
+                for user_id in range(users):
+                    call(store, user_id)
+            io = {key: value / users for key, value in counter.io.items()}
+            print(f"{label + (' cold' if cold else ''):11} {flow:6}: {io['opened']:4.1f} files, "
+                  f"{io['read']:8.0f} B read, {io['written']:7.0f} B written, {io['decoded']:7.0f} B decoded")
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    state = sample_state()
+    slots = {name: state for name in save_names(config.SAVES_LIMIT)}
+    print(f"{users} users with {config.SAVES_LIMIT} saves, I/O per flow")
+    for label, store_class, restarts in (("before", WholeFileStore, (False,)),
+                                         ("after", JsonSaveStore, (False, True))):
+        with tempfile.TemporaryDirectory() as tmp:
+            for user_id in range(users):
+                with open(f"{tmp}/{user_id}.json", "w", encoding="utf-8") as file:
+                    json.dump(slots, file, ensure_ascii=False, indent=4)
+            run(label, lambda saves_dir: store_class(saves_dir, config.SAVES_LIMIT), tmp, users, state, restarts)
+
+
+if __name__ == "__main__":
+    main()
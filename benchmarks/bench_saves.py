@@ -0,0 +1,84 @@
+"""Save/list/load latency: JSON file per user vs SQLite save store, at 100k users.
+
+Both stores are filled with SAVES_LIMIT saves for every user (a real state of the first
+chapter), then save/list/load are timed for randomly picked users.
+Run from the project root:  python -m benchmarks.bench_saves [users] [samples]
+"""
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from unittest.mock import MagicMock
+from config import bot, config
+from handlers.game_handler import send_chapter
+from utils.linker import state_to_keys
+from utils.save_store import JsonSaveStore, SqliteSaveStore
+from utils.state_manager import reset_state, state_cache
+
+
+def sample_state():
+    bot.send_message, bot.send_photo = MagicMock(), MagicMock()
+    with contextlib.redirect_stdout(io.StringIO()):
+        reset_state(0)
+        send_chapter(0)
+    return state_to_keys(state_cache[0], config.chapters)
+
+
+def save_names(count):
+    return [f"2025-01-01 10:{minute:02d}:00" for minute in range(count)]
+
+
+def fill_json(saves_dir, users, state):
+    slots = {name: state for name in save_names(config.SAVES_LIMIT)}
+    for user_id in range(users):
+        with open(f"{saves_dir}/{user_id}.json", "w", encoding="utf-8") as file:
+            json.dump(slots, file, ensure_ascii=False, indent=4)
+
+
+def fill_sqlite(store, users, state):
+    names = save_names(config.SAVES_LIMIT)
+    for start in range(0, users, 10000):
+        store.save_many([(user_id, name, state) for user_id in range(start, min(start + 10000, users))
+                         for name in names])
+
+
+def timed(func, users, samples):
+    times = []
+    for user_id in random.Random(1).sample(range(users), samples):
+        start = time.perf_counter()
+        func(user_id)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return f"p50 {statistics.median(times) * 1000:6.3f} ms  p99 {times[int(len(times) * 0.99)] * 1000:6.3f} ms"
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    samples = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    state = sample_state()
+    new_name = "2025-01-02 10:00:00"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_store = JsonSaveStore(tmp, config.SAVES_LIMIT)
+        sqlite_store = SqliteSaveStore(os.path.join(tmp, "saves.db"), config.SAVES_LIMIT)
+
+        start = time.perf_counter()
+        fill_json(tmp, users, state)
+        fill_sqlite(sqlite_store, users, state)
+        print(f"{users} users x {config.SAVES_LIMIT} saves ({len(json.dumps(state))} bytes per state), "
+              f"filled in {time.perf_counter() - start:.1f} s, {samples} samples")
+
+        for label, store in (("json", json_store), ("sqlite", sqlite_store)):
+            print(f"{label:6} save: {timed(lambda user_id: store.save(user_id, new_name, state), users, samples)}")
+            print(f"{label:6} list: {timed(store.list, users, samples)}")
+            print(f"{label:6} load: {timed(store.load, users, samples)}")
+        print(f"sqlite db: {os.path.getsize(sqlite_store.path) / 2 ** 20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Session cache: memory, hit ratio and evictions with many players.
+
+Players (a few active, most of them rare, Zipf-like) open a chapter in turn; every view
+goes through get_state and send_chapter. The unbounded dict of before is compared with
+the bounded SessionCache writing evicted sessions to a temporary SQLite store.
+Run from the project root:  python -m benchmarks.bench_sessions [players] [views] [cache_size]
+"""
+import contextlib
+import gc
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from unittest.mock import patch
+from config import bot, config
+from handlers.game_handler import send_chapter
+from utils import state_manager
+from utils.save_store import SqliteSaveStore
+from utils.session_cache import SessionCache
+
+
+def play(views, players):
+    rng = random.Random(1)
+    weights = [1 / (rank + 1) for rank in range(players)]
+    chats = rng.choices(range(players), weights, k=views)
+    chapters = list(config.chapters.keys())[:200]
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for chat_id in chats:
+            state = state_manager.get_state(chat_id)
+            state["chapter"] = config.chapters.id_of(rng.choice(chapters))
+            send_chapter(chat_id)
+    return time.perf_counter() - start
+
+
+def measure(label, cache, views, players):
+    gc.collect()
+    tracemalloc.start()
+    with patch.object(state_manager, "state_cache", cache), \
+         patch("handlers.game_handler.state_cache", cache):
+        elapsed = play(views, players)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:9}: {len(cache):6} sessions in memory, {current / 2 ** 20:7.1f} MiB, "
+          f"{elapsed / views * 1e6:6.1f} us per view")
+
+
+def main():
+    players = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    views = int(sys.argv[2]) if len(sys.argv) > 2 else 100_000
+    cache_size = int(sys.argv[3]) if len(sys.argv) > 3 else 5000
+    bot.send_message = bot.send_photo = lambda *args, **kwargs: None  # no Telegram, no call records
+    print(f"{players} players, {views} chapter views, cache of {cache_size} sessions")
+
+    measure("dict", {}, views, players)
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = SessionCache(SqliteSaveStore(os.path.join(tmp, "saves.db"), config.SAVES_LIMIT),
+                             max_entries=cache_size, dump=state_manager.state_cache.dump,
+                             load=state_manager.state_cache.load)
+        measure("bounded", cache, views, players)
+        print(f"bounded  : {cache.report()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Webhook load test: synthetic updates posted to the built-in HTTP server at a high rate.
+
+Client threads post /start updates of many players over keep-alive connections (every
+tenth request has a wrong secret token and must be rejected). Sends to Telegram are
+replaced by a fake that takes a fixed round trip, so handlers behave like in production.
+Reports the accepted rate, response latency and how long the dispatcher needs to drain.
+Run from the project root:  python -m benchmarks.bench_webhook [requests] [clients] [workers] [delay_ms]
+"""
+import contextlib
+import http.client
+import io
+import json
+import statistics
+import sys
+import threading
+import time
+from unittest.mock import patch
+from config import bot
+from utils import dispatcher as chat_dispatcher
+from utils.webhook import SECRET_HEADER, WebhookServer
+import handlers.game_handler  # noqa: F401  registers the game handlers
+
+SECRET = "bench-secret"
+
+
+def start_update(update_id, chat_id):
+    return json.dumps({"update_id": update_id, "message": {
+        "message_id": update_id, "date": 0, "text": "/start",
+        "chat": {"id": chat_id, "type": "private"},
+        "from": {"id": chat_id, "is_bot": False, "first_name": "p"},
+        "entities": [{"type": "bot_command", "offset": 0, "length": 6}]}}).encode()
+
+
+def client(port, update_ids, latencies, statuses):
+    # a rejected request closes its connection (Connection: close): http.client reconnects
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    for update_id in update_ids:
+        secret = SECRET if update_id % 10 else "wrong"
+        body = start_update(update_id, 2_000_000 + update_id % 500)
+        start = time.perf_counter()
+        try:
+            connection.request("POST", "/webhook", body, {SECRET_HEADER: secret, "Content-Type": "application/json"})
+            response = connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            statuses.append(None)  # failed request: counted, the client goes on
+            connection.close()
+            continue
+        latencies.append(time.perf_counter() - start)
+        statuses.append(response.status)
+    connection.close()
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+    delay_ms = float(sys.argv[4]) if len(sys.argv) > 4 else 30
+
+    def fake_send(*args, **kwargs):
+        time.sleep(delay_ms / 1000)
+
+    latencies, statuses = [], []
+    with patch.object(bot, "send_message", side_effect=fake_send), \
+         patch.object(bot, "send_photo", side_effect=fake_send), \
+         patch.object(bot, "process_new_updates", bot.process_new_updates), \
+         contextlib.redirect_stdout(io.StringIO()):
+        dispatcher = chat_dispatcher.install(bot, workers)
+        server = WebhookServer(("127.0.0.1", 0), bot.process_new_updates, SECRET)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=client, args=(server.server_port, range(i, requests, clients),
+                                                         latencies, statuses)) for i in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        posted = time.perf_counter() - start
+
+        server.drain(dispatcher.join)
+        drained = time.perf_counter() - start
+        dispatcher.shutdown()
+
+    latencies = sorted(latencies)
+    accepted = statuses.count(200)
+    print(f"{requests} requests from {clients} clients, {workers} workers, Telegram round trip {delay_ms:.0f} ms")
+    print(f"posted      : {posted:6.2f} s, {requests / posted:7.1f} requests/s "
+          f"({accepted} accepted, {statuses.count(403)} rejected by secret, {statuses.count(None)} failed)")
+    print(f"latency     : p50 {statistics.median(latencies) * 1000:.2f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms")
+    print(f"drained     : {drained:6.2f} s, {accepted / drained:7.1f} updates/s processed, "
+          f"{dispatcher.stats['updates']} dispatched, {dispatcher.stats['errors']} errors")
+    print(f"server stats: {server.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,37 @@
+import logging
 from config import config, bot
 from handlers.game_handler import send_chapter
 from handlers.stats_handler import show_characteristics
 from handlers.inventory_handler import show_inventory
 from handlers.instruction_handler import send_instruction
+from handlers import admin_handler
+from utils.expressions import precompile_expressions
+from utils import autosave, dispatcher, metrics, send_queue
+from utils.state_manager import state_cache
+
+logger = logging.getLogger(__name__)
+
+# ✅ Compile all chapter conditions before serving players
+# (a lazy ChapterStore keeps startup independent of quest size, its chapters compile on first use)
+if not config.chapters.lazy:
+    precompile_expressions(config.chapters)
+
+# ✅ Updates of different chats run in parallel, each chat's updates in order
+chat_dispatcher = dispatcher.install(bot, config.UPDATE_WORKERS)
+
+# ✅ Outgoing messages go through a queue within Telegram's rate limits
+send_queue.install(bot, config)
+
+# ✅ Handler, chapter and Bot API latency on /metrics (all handlers are registered by now)
+metrics.install(bot, config)
+
+# ✅ Player progress is written to disk in the background and on shutdown
+# (SIGTERM stops polling, the last pass runs once it has returned)
+autosaver = autosave.start(state_cache, config.AUTOSAVE_INTERVAL, on_stop=bot.stop_polling)
 
 bot.polling()
+
+# ✅ Updates already received from Telegram are handled before the last autosave pass
+if not chat_dispatcher.shutdown(config.UPDATE_DRAIN_TIMEOUT):
+    logger.warning("⚠️ Shutdown: not every received update was handled in %s s", config.UPDATE_DRAIN_TIMEOUT)
+autosaver.close()
@@ -0,0 +1,21 @@
+import asyncio
+from config import config, bot
+from handlers.game_handler import send_chapter
+from handlers.stats_handler import show_characteristics
+from handlers.inventory_handler import show_inventory
+from handlers.instruction_handler import send_instruction
+from handlers import admin_handler
+from utils.expressions import precompile_expressions
+from utils.async_engine import AsyncEngine
+from utils import autosave, metrics
+from utils.state_manager import state_cache
+
+# ✅ Asyncio engine mode: same handlers as bot.py, Telegram I/O on one event loop
+if not config.chapters.lazy:
+    precompile_expressions(config.chapters)
+
+metrics.install(bot, config)
+engine = AsyncEngine()
+autosaver = autosave.start(state_cache, config.AUTOSAVE_INTERVAL, on_stop=engine.stop)
+asyncio.run(engine.run_polling())
+autosaver.close()
@@ -0,0 +1,18 @@
+from config import config, bot
+from handlers.game_handler import send_chapter
+from handlers.stats_handler import show_characteristics
+from handlers.inventory_handler import show_inventory
+from handlers.instruction_handler import send_instruction
+from handlers import admin_handler
+from utils.expressions import precompile_expressions
+from utils import autosave, dispatcher, metrics, send_queue, webhook
+from utils.state_manager import state_cache
+
+# ✅ Webhook mode: same handlers as bot.py, updates arrive over HTTP
+if not config.chapters.lazy:
+    precompile_expressions(config.chapters)
+
+send_queue.install(bot, config)
+metrics.install(bot, config)
+autosave.start(state_cache, config.AUTOSAVE_INTERVAL)
+webhook.run(bot, config, dispatcher.install(bot, config.UPDATE_WORKERS))
@@ -1,12 +1,19 @@
 from dataclasses import dataclass, field
 import os
 import json
+import logging
 from dotenv import load_dotenv
 from telebot import TeleBot
+from utils.bundle import load_bundle, ChapterStore
+from utils.linker import LinkedQuest, link_chapters, resolve_chapter
+from utils.actions import compile_actions
+from utils import log
 
 # Загрузка переменных окружения
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 @dataclass
 class Config:
     # Переменные окружения
@@ -24,15 +31,75 @@ class Config:
     # Режим работы (0 — тестовый, 1 — продакшн)
     PROD_MODE: int = int(os.getenv("PROD_MODE", "1"))
 
+    # Логи (utils/log.py): в продакшне без отладочных сообщений
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL") or ("INFO" if int(os.getenv("PROD_MODE", "1")) else "DEBUG")
+    LOG_LEVELS: str = os.getenv("LOG_LEVELS", "")  # уровни модулей: "handlers.game_handler=DEBUG,utils.parser=WARNING"
+    LOG_QUEUE_SIZE: int = 10000  # записей в очереди к потоку вывода, лишние отбрасываются
+
     # Пути к файлам и директориям
     CHAPTERS_FILE: str = "data/chapters.json"
+    CHAPTERS_BUNDLE: str = "data/chapters.msgpack"  # собирается utils/parser.py
+    CHAPTERS_INDEX: str = "data/chapters.idx"  # смещения глав внутри bundle
     INSTRUCTIONS_FILE: str = "data/instructions.json"
+    MEDIA_CACHE_FILE: str = "data/media_cache.json"  # file_id загруженных картинок
     SAVES_DIR: str = "saves"
+    SAVE_BACKEND: str = os.getenv("SAVE_BACKEND", "json")  # json | sqlite (utils/save_store.py)
+    SAVES_DB: str = "saves/saves.db"  # база сохранений для SAVE_BACKEND=sqlite
     DATA_DIR: str = "data"
 
     # Лимиты
     HISTORY_LIMIT: int = 10
     SAVES_LIMIT: int = 5
+    SAVE_INDEX_SIZE: int = 10000  # игроков, чей список сохранений держится в памяти
+    EXPRESSION_CACHE_SIZE: int = 4096  # скомпилированные условия/выражения
+    CHAPTER_CACHE_SIZE: int = 256  # декодированные главы в памяти (ленивая загрузка)
+    SESSION_CACHE_SIZE: int = int(os.getenv("SESSION_CACHE_SIZE", "10000"))  # состояний игроков в памяти
+    SESSION_CACHE_BYTES: int = int(os.getenv("SESSION_CACHE_BYTES", "0"))  # лимит памяти на них, 0 — без лимита
+    SESSION_TTL: float = float(os.getenv("SESSION_TTL", "86400"))  # секунд без действий до выгрузки на диск
+    AUTOSAVE_INTERVAL: float = float(os.getenv("AUTOSAVE_INTERVAL", "5"))  # секунд между записями изменённых сессий
+
+    # Обработка апдейтов: разные чаты параллельно, апдейты одного чата строго по очереди
+    UPDATE_WORKERS: int = int(os.getenv("UPDATE_WORKERS", "4"))
+    UPDATE_DRAIN_TIMEOUT: float = 30.0  # секунд на обработку полученных апдейтов при остановке polling
+
+    # Исходящие сообщения: очередь с лимитами Telegram (token bucket)
+    SEND_RATE: float = 30.0  # сообщений в секунду на весь бот
+    SEND_BURST: int = 30
+    SEND_CHAT_RATE: float = 1.0  # сообщений в секунду в один чат
+    SEND_CHAT_BURST: int = 3
+    SEND_WORKERS: int = 8  # потоков, одновременно отправляющих запросы
+    SEND_QUEUE_SIZE: int = 10000  # сообщений в очереди; сверх этого отправка отклоняется
+
+    # Webhook (bot_webhook.py): Telegram присылает апдейты на встроенный HTTP-сервер
+    WEBHOOK_URL: str = os.getenv("WEBHOOK_URL")  # полный публичный https-адрес; если задан — вызывается setWebhook
+    WEBHOOK_SECRET: str = os.getenv("WEBHOOK_SECRET")  # заголовок X-Telegram-Bot-Api-Secret-Token
+    WEBHOOK_HOST: str = os.getenv("WEBHOOK_HOST", "127.0.0.1")  # за reverse proxy / балансировщиком
+    WEBHOOK_PORT: int = int(os.getenv("WEBHOOK_PORT", "8080"))
+    WEBHOOK_PATH: str = os.getenv("WEBHOOK_PATH", "/webhook")
+    WEBHOOK_MAX_BODY: int = int(os.getenv("WEBHOOK_MAX_BODY", str(1 << 20)))  # байт; апдейты Telegram намного меньше
+    WEBHOOK_DRAIN_TIMEOUT: float = 30.0  # секунд на обработку принятых апдейтов при остановке
+
+    # Аналитика (GA4 Measurement Protocol, отправка в фоне пачками)
+    ANALYTICS_URL: str = os.getenv("ANALYTICS_URL", "https://www.google-analytics.com/mp/collect")
+    ANALYTICS_QUEUE_SIZE: int = 10000  # при переполнении отбрасываются самые старые события
+    ANALYTICS_BATCH_SIZE: int = 25  # событий в одном запросе (максимум протокола)
+    ANALYTICS_TIMEOUT: float = 5.0  # секунд на запрос
+    ANALYTICS_RETRIES: int = 3
+
+    # Метрики (utils/metrics.py): Prometheus на 127.0.0.1:METRICS_PORT и команда /metrics для админов
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "1") == "1"
+    METRICS_HOST: str = os.getenv("METRICS_HOST", "127.0.0.1")
+    METRICS_PORT: int = int(os.getenv("METRICS_PORT", "9090"))  # 0 — без HTTP-эндпоинта
+    ADMIN_IDS: list = field(default_factory=lambda: [
+        int(user_id) for user_id in os.getenv("ADMIN_IDS", "").split(",") if user_id.strip()
+    ])
+
+    # Журнал ошибок (utils/error_handler.py)
+    ERROR_LOG: str = "logs/errors.log"
+    ERROR_LOG_MAX_BYTES: int = 5 * 1024 * 1024  # размер файла до ротации
+    ERROR_LOG_BACKUPS: int = 5  # errors.log.1 ... errors.log.5
+    ERROR_DEDUP_WINDOW: float = 60.0  # секунд: одинаковая ошибка пишется раз за окно, повторы считаются
+    ERROR_SAMPLE_RATE: float = 0.1  # доля повторов, отправляемых в аналитику
 
     # Кнопки
     COMMON_BUTTONS: list = field(default_factory=lambda: [
@@ -43,7 +110,8 @@ class Config:
         "📖 Instructions"
     ])
 
-    # Данные, загруженные из JSON
+    # Данные, загруженные из JSON (главы — LinkedQuest: список по ID + доступ по ключу,
+    # действия — кортежи с числовым кодом, см. utils/actions.py)
     chapters: dict = field(default_factory=dict)
     instructions: dict = field(default_factory=dict)
 
@@ -52,18 +120,41 @@ class Config:
     first_instruction: str = None
 
     def __post_init__(self):
+        log.setup(self.LOG_LEVEL, self.LOG_LEVELS, self.LOG_QUEUE_SIZE)
+
         # Создание директории для сохранений, если её нет
         if not os.path.exists(self.SAVES_DIR):
             os.makedirs(self.SAVES_DIR)
 
-        # Загрузка данных из JSON
-        self.chapters = self.load_json(self.CHAPTERS_FILE)
+        # Загрузка данных (скомпилированный bundle или JSON)
+        self.chapters = self.load_chapters()
         self.instructions = self.load_json(self.INSTRUCTIONS_FILE)
 
-        # Определение первой главы и инструкции
-        self.first_chapter = list(self.chapters.keys())[0] if self.chapters else None
+        # Определение первой главы и инструкции (в состоянии игрока главы хранятся как ID)
+        self.first_chapter = resolve_chapter(self.chapters, list(self.chapters.keys())[0]) if self.chapters else None
         self.first_instruction = list(self.instructions.keys())[0] if self.instructions else None
 
+    def load_chapters(self):
+        # ✅ Prefer the compiled bundle unless chapters.json was changed after it was built
+        if os.path.exists(self.CHAPTERS_BUNDLE) and (
+            not os.path.exists(self.CHAPTERS_FILE)
+            or os.path.getmtime(self.CHAPTERS_BUNDLE) >= os.path.getmtime(self.CHAPTERS_FILE)
+        ):
+            # ✅ With the offset index chapters are decoded lazily from a memory map
+            if os.path.exists(self.CHAPTERS_INDEX):
+                try:
+                    store = ChapterStore(self.CHAPTERS_BUNDLE, self.CHAPTERS_INDEX, self.CHAPTER_CACHE_SIZE,
+                                         linked=True, transform=compile_actions)
+                    return LinkedQuest(store, store)
+                except (OSError, ValueError) as e:
+                    logger.warning("⚠️ Cannot open %s: %s. Loading the whole bundle", self.CHAPTERS_INDEX, e)
+            try:
+                chapters = load_bundle(self.CHAPTERS_BUNDLE, linked=True)
+                return LinkedQuest(chapters, [compile_actions(actions) for actions in chapters.values()])
+            except (OSError, ValueError) as e:
+                logger.warning("⚠️ Cannot load %s: %s. Falling back to %s", self.CHAPTERS_BUNDLE, e, self.CHAPTERS_FILE)
+        return link_chapters(self.load_json(self.CHAPTERS_FILE), compile_actions)
+
     @staticmethod
     def load_json(file_path):
         if os.path.exists(file_path):
@@ -0,0 +1,21 @@
+from config import bot, config
+from utils import metrics
+
+MESSAGE_LIMIT = 4000  # Telegram allows 4096 characters per message
+
+
+# ✅ /metrics — the Prometheus metrics for admins (ADMIN_IDS); "/metrics full" with histogram buckets
+@bot.message_handler(commands=['metrics'], func=lambda message: message.from_user.id in config.ADMIN_IDS)
+def send_metrics(message):
+    full = message.text.split()[1:2] == ["full"]
+    lines = [line for line in metrics.render().splitlines() if full or "_bucket{" not in line]
+
+    # Plain text (no Markdown: metric names have underscores), split at line boundaries
+    chunk = ""
+    for line in lines:
+        if chunk and len(chunk) + len(line) + 1 > MESSAGE_LIMIT:
+            bot.send_message(message.chat.id, chunk)
+            chunk = ""
+        chunk += line[:MESSAGE_LIMIT] + "\n"
+    if chunk:
+        bot.send_message(message.chat.id, chunk)
@@ -1,14 +1,27 @@
 from config import config, bot
-from utils.state_manager import load_specific_state, save_state, get_state, reset_state, state_cache  
+from utils.state_manager import load_specific_state, save_state, get_state, reset_state, state_cache, list_saves
 from utils.helpers import process_inventory_action, replace_variables_in_text, evaluate_condition
+from utils.expressions import compile_expression
+from utils.linker import resolve_chapter, chapter_name
+from utils.actions import compile_action, ACTION_TYPES, TEXT, BTN, XBTN, INVENTORY, GOLD, ASSIGN, GOTO, IMAGE, IF, END, OTHER
+from utils.actions import ActionRef, button_ref, button_actions
 from handlers.instruction_handler import send_instruction, handle_instruction_action
 import telebot.types as types
 from collections import deque
+from contextlib import contextmanager
+import threading
+import logging
+from time import perf_counter
 from datetime import datetime
-import os, random, re, json
+import os, json
 from handlers.stats_handler import show_characteristics
 from utils.firebase_analytics import log_event
 from utils.error_handler import safe_handler
+from utils.message_buffer import buffered, send_text, flush
+from utils.media_cache import send_photo
+from utils import metrics
+
+logger = logging.getLogger(__name__)
 
 # ✅ Start of the game
 @bot.message_handler(commands=['start'])
@@ -19,43 +32,71 @@ def start_game(message):
     send_chapter(user_id)
 
 
+# ✅ Chapter whose actions are being executed (a stack: goto renders another chapter inside),
+# so a button can keep a reference to its actions instead of a copy
+_sources = threading.local()
+
+@contextmanager
+def actions_of(chapter_key):
+    stack = getattr(_sources, "stack", None)
+    if stack is None:
+        stack = _sources.stack = []
+    stack.append(chapter_key)
+    try:
+        yield
+    finally:
+        stack.pop()
+
+
 # ✅ Sending the chapter to the player
 def send_chapter(chat_id):
+    # ✅ Texts of the chapter (and of chapters reached with goto) are merged into few messages
+    if not metrics.enabled:
+        with buffered(chat_id):
+            render_chapter(chat_id)
+        return
+    # ✅ Render time per chapter (chapters reached with goto included)
+    start = perf_counter()
+    with buffered(chat_id):
+        chapter_key = render_chapter(chat_id)
+    metrics.observe_chapter(chapter_key, perf_counter() - start)
+
+def render_chapter(chat_id):
     # Получаем состояние пользователя
     state = get_state(chat_id)
-    chapter_key = state["chapter"]
+    # ✅ Chapters are kept as IDs in state (a key set by older code/saves is converted here)
+    chapter_key = state["chapter"] = resolve_chapter(config.chapters, state["chapter"])
     chapter = config.chapters.get(chapter_key)
 
-    print(f"------------------------CHAPTER: {chapter_key}")
-    print(f"send chapter end_triggered={state.get('end_triggered')}")
-    print(f"send chapter goto_triggered={state.get('goto_triggered')}")
-    
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("------------------------CHAPTER: %s (end_triggered=%s, goto_triggered=%s)",
+                     chapter_name(config.chapters, chapter_key), state.get("end_triggered"), state.get("goto_triggered"))
+
     if chapter_key == config.first_chapter:
-        print("⚠️ First chapter detected - resetting state")
+        logger.debug("⚠️ First chapter detected - resetting state")
         state = reset_state(chat_id)
 
     # Логируем открытие главы
     if config.PROD_MODE == 1:
-        log_event(chat_id, "chapter_opened", {"chapter": chapter_key})
+        log_event(chat_id, "chapter_opened", {"chapter": chapter_name(config.chapters, chapter_key)})
     
     # Проверяем, существует ли глава
     if not chapter:
-        bot.send_message(chat_id, "Error: Chapter not found.")
-        return
+        send_text(chat_id, "Error: Chapter not found.")
+        return chapter_key
 
     # Очищаем опции
     state["options"] = {}
 
     # Выполняем действия из главы
-    for action in chapter:
-        print(f"------ACTION: {str(action)[:60]}{'...' if len(str(action)) > 60 else ''}")
-        
-        execute_action(chat_id, state, action)
+    with actions_of(chapter_key):
+        for action in chapter:
+            execute_action(chat_id, state, action)
 
-        # Останавливаем выполнение, если сработал флаг end_triggered
-        if state.get("end_triggered"):
-            print(f"end triggered - stop next actions")
-            break
+            # Останавливаем выполнение, если сработал флаг end_triggered
+            if state.get("end_triggered"):
+                logger.debug("end triggered - stop next actions")
+                break
 
     gold = state.get("gold", 0)
     message_text = f"💰 {gold} " if gold > 0 else ""
@@ -73,47 +114,50 @@ def send_chapter(chat_id):
 
     state["goto_triggered"] = False
     state["end_triggered"] = False
-    #save_state(chat_id)
+    # ✅ Progress reaches the disk through the autosave (utils/autosave.py), save slots stay separate
     state_cache[chat_id] = state
+    return chapter_key
 
 def execute_action(chat_id, state, action):
     try:
-        action_type = action["type"]
-        value = action["value"]
-        print(f"🚀 Executing action: {action_type} -> {value}")
-        
-        if action_type == "text":
-            handle_text(chat_id, value)
-        elif action_type == "btn" or action_type == "xbtn":
-            # ✅ Remove previous related buttons with the same actions
-            state["options"].pop(value["text"], None)
-            state["options"].pop(f"{value['text']}_actions", None)
-
-            # ✅ Add new button
-            state["options"][value["text"]] = value["target"]
-            if "actions" in value:
-                state["options"][f"{value['text']}_actions"] = value["actions"]
-            print(f"🔘 Added button: {value['text']} -> {value['target']}")
-        elif action_type == "inventory":
-            handle_inventory(state, value)
-        elif action_type == "gold":
-            handle_gold(state, value)
-        elif action_type == "assign":
-            handle_assign(state, value)
-        elif action_type == "goto":
-            handle_goto(chat_id, state, value)
-            state["goto_triggered"] = True
-            state["end_triggered"] = True
-        elif action_type == "image":
-            handle_image(chat_id, value)
-        elif action_type == "if":
-            handle_if(chat_id, state, value)
-        elif action_type == "end":
-            state["end_triggered"] = True
+        # ✅ Loaded chapters are already compiled; dict actions (tests, old saves) are compiled here
+        action = compile_action(action)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("🚀 Executing action: %s -> %.80s",
+                         ACTION_TYPES[action[0]] if action[0] != OTHER else action[1], action[1:])
+        ACTION_HANDLERS[action[0]](chat_id, state, action)
     except Exception as e:
-        print(f"❌ Error executing action {action}: {e}")
-        bot.send_message(chat_id, "⚠️ An error occurred while executing the action. The game continues.")
-
+        logger.error("❌ Error executing action %.200s: %s", action, e)
+        send_text(chat_id, "⚠️ An error occurred while executing the action. The game continues.")
+
+
+def handle_button(chat_id, state, action):
+    _, text, target, actions = action
+    # ✅ Remove previous related buttons with the same actions
+    state["options"].pop(text, None)
+    state["options"].pop(f"{text}_actions", None)
+
+    # ✅ Add new button
+    state["options"][text] = target
+    if actions is not None:
+        # ✅ A reference into the loaded quest; a copy only when the button's chapter is unknown
+        state["options"][f"{text}_actions"] = find_button(action) or actions
+    logger.debug("🔘 Added button: %s -> %s", text, target)
+
+def find_button(action):
+    stack = getattr(_sources, "stack", None)
+    if not stack:
+        return None
+    chapter_key = stack[-1]
+    return button_ref(chapter_key, config.chapters.get(chapter_key) or (), action)
+
+def handle_goto_action(chat_id, state, action):
+    handle_goto(chat_id, state, action[1])
+    state["goto_triggered"] = True
+    state["end_triggered"] = True
+
+def handle_end(chat_id, state, action):
+    state["end_triggered"] = True
 
 def handle_goto(chat_id, state, value):
     if value == "return":
@@ -131,7 +175,7 @@ def handle_goto(chat_id, state, value):
 def handle_text(chat_id, value):
     state = state_cache[chat_id]
     new_value = replace_variables_in_text(state, value)
-    bot.send_message(chat_id, new_value, reply_markup=types.ReplyKeyboardRemove())
+    send_text(chat_id, new_value)
 
 
 def handle_inventory(state, value):
@@ -146,46 +190,55 @@ def handle_gold(state, value):
         else:
             state["gold"] = int(value)
     except Exception as e:
-        print(f"Error in handling gold: {e}")
+        logger.warning("Error in handling gold: %s", e)
 
-def handle_assign(state, value):
-    key = value["key"].lower()
-    new_value = value["value"]
-    new_name = value.get("name", key)  
+def handle_assign(state, key, new_value, new_name=None):
+    key = key.lower()
+    if new_name is None:
+        new_name = key
     if new_name == "" and key in state["characteristics"]:
         new_name = state["characteristics"][key].get("name", key)
 
-    new_value = re.sub(r'rnd(\d+)', lambda m: str(random.randint(1, int(m.group(1)))), new_value)
-    local_vars = {k: v["value"] for k, v in state["characteristics"].items()}
     try:
-        new_value = int(new_value) if new_value.isdigit() else eval(new_value, {}, local_vars)
+        # ✅ Compiled once per distinct expression (see utils/expressions.py)
+        new_value = compile_expression(new_value)(state)
     except Exception as e:
         new_value = state["characteristics"].get(key, {"value": 0})["value"]
 
-    print(f"assign {key} -> {new_value}")
+    logger.debug("assign %s -> %s", key, new_value)
     state["characteristics"][key] = {"name": new_name, "value": new_value}
 
 def handle_image(chat_id, value):
     image_path = config.DATA_DIR + value.replace("\\", "/")
+    flush(chat_id)  # texts before the image go out first
     if os.path.exists(image_path):
-        with open(image_path, "rb") as photo:
-            bot.send_photo(chat_id, photo)
+        send_photo(chat_id, image_path)  # uploaded once, then sent by file_id
     else:
-        bot.send_message(chat_id, f"⚠️ Image not found: {value}")
-
-def handle_if(chat_id, state, value):
-    condition = value["condition"]
-    actions = value["actions"]
-    else_actions = value.get("else_actions", [])
+        send_text(chat_id, f"⚠️ Image not found: {value}")
 
+def handle_if(chat_id, state, condition, actions, else_actions=None):
     if evaluate_condition(state, condition):
-        print(f"✅ Condition is TRUE: {condition}")
+        logger.debug("✅ Condition is TRUE: %s", condition)
         for sub_action in actions:
             execute_action(chat_id, state, sub_action)
     else:
-        print(f"❌ Condition is FALSE: {condition}")
-        for sub_action in else_actions:
-            execute_action(chat_id, state, sub_action,)
+        logger.debug("❌ Condition is FALSE: %s", condition)
+        for sub_action in else_actions or ():
+            execute_action(chat_id, state, sub_action)
+
+
+# ✅ Jump table: opcode (utils/actions.py) -> handler(chat_id, state, action)
+ACTION_HANDLERS = [None] * (OTHER + 1)
+ACTION_HANDLERS[TEXT] = lambda chat_id, state, action: handle_text(chat_id, action[1])
+ACTION_HANDLERS[BTN] = ACTION_HANDLERS[XBTN] = handle_button
+ACTION_HANDLERS[INVENTORY] = lambda chat_id, state, action: handle_inventory(state, action[1])
+ACTION_HANDLERS[GOLD] = lambda chat_id, state, action: handle_gold(state, action[1])
+ACTION_HANDLERS[ASSIGN] = lambda chat_id, state, action: handle_assign(state, *action[1:])
+ACTION_HANDLERS[GOTO] = handle_goto_action
+ACTION_HANDLERS[IMAGE] = lambda chat_id, state, action: handle_image(chat_id, action[1])
+ACTION_HANDLERS[IF] = lambda chat_id, state, action: handle_if(chat_id, state, *action[1:])
+ACTION_HANDLERS[END] = handle_end
+ACTION_HANDLERS[OTHER] = lambda chat_id, state, action: None  # "unknown" lines of the quest
 
 
 # ✅ Instruction button handler
@@ -197,7 +250,7 @@ def enter_instruction(call):
 
 @bot.callback_query_handler(func=lambda call: call.data == "⬅️ Go back")
 def handle_back(call):
-    print(f"------------------handle back instruction")
+    logger.debug("------------------handle back instruction")
     chat_id = call.message.chat.id
     #state = get_state(chat_id)
     state = state_cache.get(chat_id)
@@ -214,8 +267,7 @@ def handle_back(call):
 def save_game(call):
     chat_id = call.message.chat.id
 
-    save_state(chat_id)  # ✅ Сохраняем текущее состояние
-    last_save = sorted(get_saved_states(chat_id))[-1]  # Берем последнее сохранение
+    last_save = save_state(chat_id)  # ✅ Сохраняем текущее состояние
 
     # Возвращаемся к текущим кнопкам главы
     send_buttons(chat_id, f"✅ Game saved: `{last_save}`")
@@ -225,16 +277,12 @@ def save_game(call):
 def load_game(call):
     chat_id = call.message.chat.id
 
-    save_file = f"{config.SAVES_DIR}/{chat_id}.json"
-    if not os.path.exists(save_file):
+    save_names = get_saved_states(chat_id)
+    if not save_names:
         bot.send_message(chat_id, "⚠️ *No available saves!*", parse_mode="Markdown")
         return
-    
-    with open(save_file, "r", encoding="utf-8") as file:
-        existing_data = json.load(file)
 
-    # ✅ Создаем inline-клавиатуру для выбора сохранений (только ключи верхнего уровня)
-    save_names = sorted(existing_data.keys(), reverse=True)
+    # ✅ Создаем inline-клавиатуру для выбора сохранений (от новых к старым)
     markup = types.InlineKeyboardMarkup(row_width=2)  # ✅ 2 в ряд
     for i, save_name in enumerate(save_names):
         markup.add(types.InlineKeyboardButton(
@@ -254,12 +302,7 @@ def handle_load_choice(call):
     try:
         save_index = int(call.data.split("_")[1])
 
-        save_file = f"{config.SAVES_DIR}/{chat_id}.json"
-        with open(save_file, "r", encoding="utf-8") as file:
-            existing_data = json.load(file)
-
-        save_names = sorted(existing_data.keys(), reverse=True)
-        selected_save = save_names[save_index]
+        selected_save = get_saved_states(chat_id)[save_index]
 
         # ✅ Загружаем состояние
         load_specific_state(chat_id, selected_save)
@@ -268,18 +311,13 @@ def handle_load_choice(call):
         send_chapter(chat_id)
 
     except (ValueError, IndexError) as e:
-        print(f"⚠️ Error during save selection: {e}")
+        logger.warning("⚠️ Error during save selection: %s", e)
         bot.send_message(chat_id, "⚠️ *Save selection error.*", parse_mode="Markdown")
 
 
 def get_saved_states(chat_id):
-    """Получает список сохранений (только верхние ключи JSON)"""
-    save_file = f"{config.SAVES_DIR}/{chat_id}.json"
-    if not os.path.exists(save_file):
-        return []
-    
-    with open(save_file, "r", encoding="utf-8") as file:
-        return sorted(json.load(file).keys(), reverse=True)  # Сортируем от новых к старым
+    """Получает список сохранений, от новых к старым"""
+    return list_saves(chat_id)
 
 @bot.callback_query_handler(func=lambda call: call.data == "cancel_load")
 def cancel_load(call):
@@ -320,7 +358,12 @@ def send_buttons(chat_id, text="➡️"):
         row_buttons = common_buttons[i:i + 2]
         markup.row(*row_buttons)
 
-    print(f"📌 Sending inline buttons: {list(state['options'].keys()) + config.COMMON_BUTTONS}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("📌 Sending inline buttons: %s", list(state["options"]) + config.COMMON_BUTTONS)
+
+    # ✅ During a chapter render the keyboard goes on the last text message
+    if flush(chat_id, reply_markup=markup, footer=text):
+        return
 
     # ✅ Send keyboard
     bot.send_message(chat_id, text, reply_markup=markup, parse_mode="Markdown")
@@ -333,15 +376,23 @@ def handle_inline_choice(call):
     state = state_cache.get(chat_id)
     #state = get_state(chat_id)
 
-    print(f"🔘 Inline button pressed: {message_text}")
+    logger.debug("🔘 Inline button pressed: %s", message_text)
 
     target = state["options"].get(message_text)
     actions = state["options"].get(f"{message_text}_actions")
+    source = state["chapter"]
+
+    if isinstance(actions, ActionRef):
+        source = actions.chapter
+        actions = button_actions(config.chapters.get(source) or (), actions, message_text)
+        if actions is None:
+            logger.warning("⚠️ Actions of %s not found in the quest (was it rebuilt?)", message_text)
 
     if actions:
-        print(f"✅ Executing nested actions for {message_text}: {actions}")
-        for sub_action in actions:
-            execute_action(chat_id, state, sub_action)
+        logger.debug("✅ Executing nested actions for %s: %.200s", message_text, actions)
+        with actions_of(source):
+            for sub_action in actions:
+                execute_action(chat_id, state, sub_action)
 
     # ✅ Handling buttons from COMMON_BUTTONS
     if message_text == "📖 Instructions":
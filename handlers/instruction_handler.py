@@ -1,14 +1,14 @@
 import os
-import json
 from config import bot, config
 import telebot.types as types
 from utils.state_manager import state_cache
+from utils.media_cache import send_photo
+import logging
 
-# ✅ Load instructions.json
-INSTRUCTIONS_FILE = os.path.join(config.DATA_DIR, "instructions.json")
+logger = logging.getLogger(__name__)
 
-with open(INSTRUCTIONS_FILE, "r", encoding="utf-8") as f:
-    instructions = json.load(f)
+# ✅ instructions.json is already loaded by config
+instructions = config.instructions
 
 # ✅ Send instruction to the user
 def send_instruction(chat_id):
@@ -53,8 +53,7 @@ def execute_instruction_action(chat_id, state, action):
     elif action_type == "image":
         image_path = config.DATA_DIR + value.replace("\\", "/")
         if os.path.exists(image_path):
-            with open(image_path, "rb") as photo:
-                bot.send_photo(chat_id, photo)
+            send_photo(chat_id, image_path)
         else:
             bot.send_message(chat_id, f"⚠️ Image not found: {value}")
 
@@ -93,7 +92,7 @@ def handle_instruction_action(call):
 
     message_text = call.data
     target = state["options"].get(message_text)
-    print(f"call.data = {call.data}")
+    logger.debug("call.data = %s", call.data)
     if call.data == "go_back":
         state["mode"] = "game"
         from handlers.game_handler import send_chapter
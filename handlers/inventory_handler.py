@@ -2,6 +2,10 @@ from config import bot, config
 from utils.state_manager import get_state, state_cache
 from handlers.game_handler import send_buttons, send_chapter
 import telebot.types as types
+from utils.linker import resolve_chapter
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 # ✅ Показать инвентарь с Inline-кнопками
@@ -30,7 +34,7 @@ def show_inventory(call):
     markup = types.InlineKeyboardMarkup(row_width=2)
 
     for item in inventory_list:
-        print(f"Inventory item: {item}")
+        logger.debug("Inventory item: %s", item)
         if "[usable]" in item:
             item_name = item.replace("[usable]", "").strip()
             # ✅ Добавляем кнопку "Использовать"
@@ -59,7 +63,7 @@ def handle_use_item(call):
         if state["history"] and state["history"][-1] != state["chapter"]:
             state["history"].append(state["chapter"])
 
-        state["chapter"] = call.data
+        state["chapter"] = resolve_chapter(config.chapters, call.data)
         send_chapter(chat_id)
     else:
         bot.send_message(chat_id, f"⚠️ Chapter '{call.data}' not found.")
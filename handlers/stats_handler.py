@@ -2,13 +2,16 @@ from config import bot
 from utils.state_manager import state_cache
 import telebot.types as types
 import re
+import logging
+
+logger = logging.getLogger(__name__)
 
 @bot.callback_query_handler(func=lambda call: call.data == "📊 Characteristics")
 def show_characteristics(call):
     chat_id = call.message.chat.id
 
     if not isinstance(chat_id, int):
-        print(f"⚠️ Error: chat_id should be an integer, not {type(chat_id)}")
+        logger.warning("⚠️ Error: chat_id should be an integer, not %s", type(chat_id))
         return
 
     # ✅ Directly working with state in memory
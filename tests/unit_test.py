@@ -1,6 +1,7 @@
 import unittest
+import gc
 import json
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 from config import bot, config
 from handlers.game_handler import handle_inline_choice, enter_instruction, handle_back, send_chapter, execute_action, save_game, load_game, handle_load_choice
 from handlers.inventory_handler import show_inventory, handle_use_item
@@ -8,6 +9,42 @@ from utils.state_manager import get_state, save_state, load_specific_state, stat
 import subprocess
 from handlers.stats_handler import show_characteristics
 from handlers.instruction_handler import send_instruction, handle_instruction_action
+from utils.expressions import compile_condition, compile_expression
+from utils.bundle import pack_chapters, unpack_chapters, save_bundle, ChapterStore
+import os, tempfile
+from utils.linker import link_chapters, state_to_keys, state_to_ids
+from utils.actions import compile_action, compile_actions, actions_to_dicts
+from utils.message_buffer import merge_texts
+from utils import media_cache, message_buffer
+from utils.firebase_analytics import AnalyticsSender
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import asyncio
+import telebot.types as types
+from telebot.async_telebot import AsyncTeleBot
+from utils.async_engine import AsyncEngine
+from utils.dispatcher import ChatDispatcher
+from utils.webhook import WebhookServer, SECRET_HEADER
+import http.client
+import socket
+from concurrent.futures import Future
+from collections import deque
+from utils.send_queue import SendScheduler, SendQueueFull, KEYBOARD
+from telebot.apihelper import ApiTelegramException
+from utils.save_store import SqliteSaveStore, JsonSaveStore
+from utils.migrate_saves import migrate
+from utils.session_cache import SessionCache
+from utils.autosave import Autosaver
+from utils import log
+from utils.error_handler import ErrorReporter
+from utils import metrics
+from handlers.admin_handler import send_metrics
+from telebot import TeleBot
+import logging
+import queue
+import sys
+import time
+from utils.parser import parse_input_to_json, split_into_chapters, collect_usable_items, parse_chapter
 
 # Remove __pycache__
 subprocess.run("find . -name '__pycache__' -exec rm -rf {} +", shell=True)
@@ -79,6 +116,32 @@ class TestBotActions(unittest.TestCase):
 
         print("✅ Test passed!")
 
+    def test_button_refs(self):
+        chapters = dict(test_chapters, ref_ch=[
+            {"type": "text", "value": "Развилка"},
+            {"type": "if", "value": {"condition": "1 = 1", "actions": [
+                {"type": "xbtn", "value": {"text": "Взять золото", "target": "test_secret",
+                                           "actions": [{"type": "gold", "value": "+5"}]}},
+            ], "else_actions": []}},
+        ])
+        with patch("handlers.game_handler.config.chapters", chapters):
+            state_cache[self.chat_id] = self.state
+            self.state.update(chapter="ref_ch", gold=100, options={})
+            send_chapter(self.chat_id)
+
+            # ✅ The button keeps a reference, not a copy of its actions
+            ref = self.state["options"]["Взять золото_actions"]
+            self.assertEqual(tuple(ref), ("ref_ch", 0))
+            saved = state_to_keys(self.state, chapters)
+            self.assertEqual(saved["options"]["Взять золото_actions"], {"chapter": "ref_ch", "index": 0})
+            self.assertEqual(state_to_ids(json.loads(json.dumps(saved)), chapters)["options"], self.state["options"])
+
+            handle_inline_choice(self.simulate_inline("Взять золото"))
+            self.assertEqual(self.state["gold"], 125)  # +5 by the button, +20 in test_secret
+            self.assertEqual(self.state["chapter"], "test_secret")
+
+        print("✅ Test passed!")
+
     def test_end(self):
         with patch("handlers.game_handler.config.chapters", test_chapters):
             # ✅ Устанавливаем главу "test_end"
@@ -207,6 +270,545 @@ class TestBotActions(unittest.TestCase):
             
         print("✅ Test passed!")
 
+    def test_compiled_condition(self):
+        state = {
+            "inventory": ["меч", "кольчуга"],
+            "characteristics": {"m2": {"name": "", "value": 7}, "mbo1": {"name": "", "value": 7}}
+        }
+        # ✅ Comparisons, "=" and "=<" spellings, inventory items and missing variables
+        self.assertTrue(compile_condition("m2 > mbo1 or m2 = mbo1")(state))
+        self.assertTrue(compile_condition("m2 =< 7 and меч")(state))
+        self.assertFalse(compile_condition("меч and волшебный меч")(state))
+        self.assertTrue(compile_condition("not sopp=1 and not перья попугая")(state))
+        self.assertFalse(compile_condition("unknown > 0")(state))
+
+        # ✅ Same text -> same compiled evaluator
+        self.assertIs(compile_condition("m2 > mbo1"), compile_condition("m2 > mbo1"))
+
+        state["characteristics"]["m2"]["value"] = 1
+        self.assertFalse(compile_condition("m2 > mbo1 or m2 = mbo1")(state))
+        print("✅ Test passed!")
+
+    def test_compiled_expression(self):
+        state = {"inventory": [], "characteristics": {"v1": {"name": "", "value": 16}, "v": {"name": "", "value": 20}}}
+        self.assertEqual(compile_expression("12")(state), 12)
+        self.assertEqual(compile_expression("v1 -2")(state), 14)
+        self.assertEqual(compile_expression("v1+v/2")(state), 26)
+
+        # ✅ rndN is drawn on every evaluation
+        for _ in range(20):
+            self.assertIn(compile_expression("rnd6 +6")(state), range(7, 13))
+
+        # ✅ Unknown variables raise, so handle_assign keeps the old value
+        with self.assertRaises(NameError):
+            compile_expression("missing + 1")(state)
+        print("✅ Test passed!")
+
+    def test_bundle_roundtrip(self):
+        bundle = pack_chapters(test_chapters)
+        loaded = unpack_chapters(bundle)
+        self.assertEqual(loaded, test_chapters)
+        self.assertEqual(list(loaded.keys()), list(test_chapters.keys()))
+
+        # ✅ Repeated strings share one object after loading
+        types = [action["type"] for actions in loaded.values() for action in actions if action["type"] == "text"]
+        self.assertTrue(all(t is types[0] for t in types))
+
+        with self.assertRaises(ValueError):
+            unpack_chapters(bundle[:-5])
+
+        # ✅ Null required fields keep their places; the GC setting of the host is kept
+        nulls = {"test_nulls": [
+            {"type": "assign", "value": {"key": "hp", "value": None, "name": None}},
+            {"type": "btn", "value": {"text": None, "target": "test_end"}},
+            {"type": "xbtn", "value": {"target": "test_end", "text": None, "actions": []}},
+        ]}
+        gc.disable()
+        try:
+            self.assertEqual(unpack_chapters(pack_chapters(nulls)), nulls)
+            self.assertFalse(gc.isenabled())
+        finally:
+            gc.enable()
+        print("✅ Test passed!")
+
+    def test_chapter_store(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            bundle_path = os.path.join(tmp, "chapters.msgpack")
+            index_path = os.path.join(tmp, "chapters.idx")
+            save_bundle(test_chapters, bundle_path, index_path)
+
+            store = ChapterStore(bundle_path, index_path, cache_size=2)
+            self.assertEqual(list(store), list(test_chapters))
+            self.assertIn("test_end", store)
+            self.assertIsNone(store.get("missing"))
+
+            # ✅ Chapters are decoded on demand and the LRU keeps only the hot ones
+            for key in test_chapters:
+                self.assertEqual(store[key], test_chapters[key])
+            self.assertEqual(store.misses, len(test_chapters))
+            self.assertEqual(len(store._cache), 2)
+
+            last_key = list(test_chapters)[-1]
+            self.assertIs(store[last_key], store[last_key])
+            self.assertEqual(store.misses, len(test_chapters))
+
+            # ✅ Chapter IDs outside 0..len-1 are not chapters
+            self.assertEqual(store[len(test_chapters) - 1], test_chapters[last_key])
+            for chapter_id in (-1, len(test_chapters)):
+                with self.assertRaises(KeyError):
+                    store[chapter_id]
+                self.assertIsNone(store.get(chapter_id))
+            store.close()
+        print("✅ Test passed!")
+
+    def test_linker(self):
+        chapters = dict(test_chapters, test_dangling=[
+            {"type": "btn", "value": {"text": "Назад", "target": "return"}},
+            {"type": "goto", "value": "nowhere"},
+        ])
+        quest = link_chapters(chapters)
+        secret = quest.id_of("test_secret")
+        self.assertEqual(quest.keys_by_id, list(chapters))
+        self.assertEqual(quest[secret], quest["test_secret"])
+        self.assertEqual(quest["test_start"][-1]["value"], secret)
+        self.assertEqual(quest.dangling, [("test_dangling", "nowhere")])
+        self.assertEqual(chapters["test_start"][-1]["value"], "test_secret")  # source is not modified
+
+        # ✅ The bundle decodes the same linked targets, eagerly and lazily
+        with tempfile.TemporaryDirectory() as tmp:
+            bundle_path = os.path.join(tmp, "chapters.msgpack")
+            index_path = os.path.join(tmp, "chapters.idx")
+            save_bundle(chapters, bundle_path, index_path)
+            self.assertEqual(list(unpack_chapters(pack_chapters(chapters), linked=True).values()), quest.chapters)
+            store = ChapterStore(bundle_path, index_path, linked=True)
+            self.assertEqual([store[i] for i in range(len(store))], quest.chapters)
+            store.close()
+
+        # ✅ Saves keep chapter keys and dict actions
+        quest = link_chapters(chapters, compile_actions)
+        state = {"chapter": secret, "history": [0], "options": {"Go": secret, "Go_actions": quest["test_start"][-1:]}}
+        saved = state_to_keys(state, quest)
+        self.assertEqual(saved["chapter"], "test_secret")
+        self.assertEqual(saved["options"]["Go_actions"], chapters["test_start"][-1:])
+        self.assertEqual(state_to_ids(saved, quest), state)
+        print("✅ Test passed!")
+
+    def test_compact_actions(self):
+        for actions in test_chapters.values():
+            compiled = compile_actions(actions)
+            self.assertTrue(all(type(action) is tuple and type(action[0]) is int for action in compiled))
+            self.assertEqual(actions_to_dicts(compiled), actions)
+
+        # ✅ Compiled and dict actions run the same way
+        action = {"type": "assign", "value": {"key": "Luck", "value": "2 + 3", "name": "Удача"}}
+        execute_action(self.chat_id, self.state, compile_action(action))
+        self.assertEqual(self.state["characteristics"]["luck"], {"name": "Удача", "value": 5})
+        execute_action(self.chat_id, self.state, {"type": "unknown", "value": "Pause 100"})
+        print("✅ Test passed!")
+
+    def test_message_coalescing(self):
+        chapters = {"test_render": [
+            {"type": "text", "value": "Первый абзац"},
+            {"type": "assign", "value": {"key": "hp", "value": "3", "name": "[hp]Здоровье"}},
+            {"type": "text", "value": "Второй абзац"},
+            {"type": "btn", "value": {"text": "Дальше", "target": "test_render"}},
+        ]}
+        with patch("handlers.game_handler.config.chapters", chapters):
+            with patch("handlers.game_handler.bot.send_message") as mock_send:
+                self.state["chapter"] = "test_render"
+                self.state["gold"] = 0
+                send_chapter(self.chat_id)
+
+                # ✅ Both texts and the keyboard arrive in one message
+                self.assertEqual(mock_send.call_count, 1)
+                args, kwargs = mock_send.call_args
+                self.assertEqual(args[1], "Первый абзац\n\nВторой абзац\n\n💚 3")
+                self.assertIsInstance(kwargs["reply_markup"], types.InlineKeyboardMarkup)
+
+        # ✅ Messages stay within Telegram's limit
+        messages = merge_texts(["а" * 3000, "б" * 3000, "в" * 5000])
+        self.assertEqual([len(message) for message in messages], [3000, 3000, 4096, 904])
+        print("✅ Test passed!")
+
+    def test_async_engine(self):
+        chapters = {"test_render": [
+            {"type": "text", "value": "Первый абзац"},
+            {"type": "btn", "value": {"text": "Дальше", "target": "test_render"}},
+        ]}
+        async_bot = AsyncTeleBot(config.TOKEN)
+        async_bot.send_message = AsyncMock()
+        with patch("handlers.game_handler.config.chapters", chapters), \
+             patch.object(bot, "send_message") as mock_send, \
+             patch.object(bot, "send_photo"), \
+             patch.object(bot, "threaded", True):
+            engine = AsyncEngine(async_bot)
+            self.state["chapter"] = "test_render"
+            self.state["gold"] = 0
+            self.state["characteristics"] = {}  # no footer left by earlier tests
+            asyncio.run(engine.send_chapter(self.chat_id))
+
+            # ✅ The sync engine only recorded the message, AsyncTeleBot sent it
+            mock_send.assert_not_called()
+            async_bot.send_message.assert_awaited_once()
+            args, kwargs = async_bot.send_message.call_args
+            self.assertEqual(args[:2], (self.chat_id, "Первый абзац"))
+            self.assertIsInstance(kwargs["reply_markup"], types.InlineKeyboardMarkup)
+            self.assertEqual(engine.stats, {"updates": 1, "api_calls": 1, "errors": 0})
+
+            # ✅ Outside the engine bot.send_message is the real call
+            bot.send_message(self.chat_id, "direct")
+            mock_send.assert_called_once_with(self.chat_id, "direct")
+
+            # ✅ Images: the media_cache file checks run in a worker thread, not on the event loop
+            threads = []
+
+            def cached_file_id(path):
+                threads.append(threading.current_thread())
+                return "file-1"
+
+            async_bot.send_photo = AsyncMock()
+            with patch.object(media_cache, "cached_file_id", side_effect=cached_file_id), \
+                 patch.object(media_cache, "count_reused") as count_reused:
+                asyncio.run(engine.deliver([("send_image", (self.chat_id, "img.png"), {})]))
+            async_bot.send_photo.assert_awaited_once_with(self.chat_id, "file-1")
+            count_reused.assert_called_once_with("img.png")
+            self.assertEqual(len(threads), 1)
+            self.assertIsNot(threads[0], threading.main_thread())
+
+            # ✅ Evicted sessions wait in the deferred queue instead of being written on the loop
+            self.assertIsInstance(state_cache.deferred, deque)
+
+            # ✅ Closed: the recorders are gone
+            engine.close()
+            self.assertIs(bot.send_message, mock_send)
+            self.assertIsNone(media_cache.recorder)
+            self.assertIsNone(state_cache.deferred)
+        print("✅ Test passed!")
+
+    def test_dispatcher_order(self):
+        chapters = {"test_count": [
+            {"type": "assign", "value": {"key": "hp", "value": "hp+1", "name": ""}},
+            {"type": "btn", "value": {"text": "Дальше", "target": "test_count"}},
+        ]}
+        chats, presses = range(1, 9), 50
+        processed = {chat_id: [] for chat_id in chats}
+
+        def process(updates):
+            update = updates[0]
+            processed[update.callback_query.message.chat.id].append(update.update_id)
+            time.sleep(0.001)  # let other workers run in the middle of an update
+            bot.process_new_updates(updates)
+
+        def press(update_id, chat_id):
+            return types.Update.de_json({"update_id": update_id, "callback_query": {
+                "id": str(update_id), "chat_instance": "1", "data": "Дальше",
+                "from": {"id": chat_id, "is_bot": False, "first_name": "p"},
+                "message": {"message_id": 1, "date": 0, "chat": {"id": chat_id, "type": "private"}}}})
+
+        with patch("handlers.game_handler.config.chapters", chapters), \
+             patch.object(bot, "threaded", False):
+            for chat_id in chats:
+                state = get_state(chat_id)
+                state["chapter"] = "test_count"
+                state["options"] = {"Дальше": "test_count"}
+                state["characteristics"] = {"hp": {"name": "", "value": 0}}
+
+            dispatcher = ChatDispatcher(process, num_threads=8)
+            updates = [press(i * len(chats) + chat_id, chat_id) for i in range(presses) for chat_id in chats]
+            dispatcher.process_new_updates(updates)
+            # ✅ Shutdown (SIGTERM in polling mode) handles every update received before it
+            self.assertTrue(dispatcher.shutdown(timeout=30))
+
+        # ✅ Every update of a chat ran once, in arrival order, without lost increments
+        for chat_id in chats:
+            self.assertEqual(processed[chat_id], [i * len(chats) + chat_id for i in range(presses)])
+            self.assertEqual(state_cache.pop(chat_id)["characteristics"]["hp"]["value"], presses)
+        self.assertEqual(dispatcher.stats["errors"], 0)
+
+        slow = ChatDispatcher(lambda updates: time.sleep(0.2), num_threads=1)
+        slow.process_new_updates([press(1, 1)])
+        self.assertFalse(slow.shutdown(timeout=0.01))  # the drain timed out
+        print("✅ Test passed!")
+
+    def test_webhook(self):
+        processed = []
+
+        def process(updates):
+            time.sleep(0.05)  # still running when the server is asked to stop
+            processed.extend(update.update_id for update in updates)
+
+        dispatcher = ChatDispatcher(process, num_threads=2)
+        server = WebhookServer(("127.0.0.1", 0), dispatcher.process_new_updates, "secret", max_body=1000)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        def post(body, secret="secret", headers=None):
+            connection = http.client.HTTPConnection("127.0.0.1", server.server_port)
+            connection.request("POST", "/webhook", body, dict({SECRET_HEADER: secret}, **(headers or {})))
+            status = connection.getresponse().status
+            connection.close()
+            return status
+
+        def raw_post(head):
+            # Headers http.client would not send: the answer has to come without reading a body
+            with socket.create_connection(("127.0.0.1", server.server_port), timeout=5) as connection:
+                connection.sendall(b"POST /webhook HTTP/1.1\r\nHost: x\r\n" + head + b"\r\n")
+                return int(connection.recv(100).split()[1])
+
+        update = {"update_id": 1, "message": {"message_id": 1, "date": 0, "text": "hi",
+                                              "chat": {"id": self.chat_id, "type": "private"}}}
+        self.assertEqual(post(json.dumps(update)), 200)
+        self.assertEqual(post(json.dumps(dict(update, update_id=2))), 200)
+        self.assertEqual(post(json.dumps(update), secret="wrong"), 403)
+        self.assertEqual(post("not json"), 400)
+        self.assertEqual(post("x" * 1001), 413)
+        self.assertEqual(post(json.dumps(update), headers={"Content-Length": "abc"}), 400)
+        self.assertEqual(raw_post(SECRET_HEADER.encode() + b": secret\r\n"), 400)  # no Content-Length
+        self.assertEqual(raw_post(SECRET_HEADER.encode() + ": сек\r\nContent-Length: 5\r\n".encode()), 403)
+
+        # ✅ A rejection tells a keep-alive client to reconnect: its next request still goes through
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=5)
+        connection.request("POST", "/webhook", json.dumps(update), {SECRET_HEADER: "wrong"})
+        response = connection.getresponse()
+        response.read()
+        self.assertEqual((response.status, response.getheader("Connection")), (403, "close"))
+        connection.request("POST", "/webhook", json.dumps(dict(update, update_id=3)), {SECRET_HEADER: "secret"})
+        response = connection.getresponse()
+        response.read()
+        self.assertEqual(response.status, 200)
+        connection.close()
+
+        # ✅ Graceful stop: accepted updates are processed, new connections are refused
+        self.assertTrue(server.drain(dispatcher.join, timeout=10))
+        self.assertEqual(processed, [1, 2, 3])
+        self.assertEqual(server.stats, {"received": 3, "rejected": 3, "invalid": 4})
+        with self.assertRaises(OSError):
+            post(json.dumps(update))
+        dispatcher.shutdown()
+        print("✅ Test passed!")
+
+    def test_send_scheduler(self):
+        sent, flood, flooded_at = [], [True], []
+
+        def send(method, chat_id, text, **kwargs):
+            if chat_id == 1 and flood:
+                flood.pop()
+                flooded_at.append(time.monotonic())
+                raise ApiTelegramException("sendMessage", None, {
+                    "error_code": 429, "description": "Too Many Requests", "parameters": {"retry_after": 0.2}})
+            if chat_id == 4:
+                raise ValueError("bad chat")
+            sent.append((chat_id, text, time.monotonic()))
+            return text
+
+        errors = []
+        # 10 messages/s in total, 20/s per chat, no bursts
+        scheduler = SendScheduler(send, rate=10, burst=1, chat_rate=20, chat_burst=1, workers=2,
+                                  on_error=lambda method, chat_id, error: errors.append((chat_id, type(error))))
+        start = time.monotonic()
+        first = scheduler.submit(1, "send_message", (1, "a1"))  # answered with 429
+        scheduler.submit(2, "send_message", (2, "b1"))
+        scheduler.submit(3, "send_message", (3, "c1"), priority=KEYBOARD)
+        scheduler.submit(1, "send_message", (1, "a2"))
+        failed = scheduler.submit(4, "send_message", (4, "d1"))
+        self.assertTrue(scheduler.join(timeout=5))
+
+        # ✅ Keyboard first; after the 429 every chat waits retry_after, the flooded chat keeps its order
+        self.assertEqual([(chat_id, text) for chat_id, text, _ in sent], [(3, "c1"), (1, "a1"), (2, "b1"), (1, "a2")])
+        self.assertTrue(all(sent_at - flooded_at[0] >= 0.19 for _, _, sent_at in sent[1:]))
+        # ✅ Global rate: one message per 0.1 s
+        times = [sent_at for _, _, sent_at in sent]
+        self.assertTrue(all(later - earlier >= 0.09 for earlier, later in zip(times, times[1:])))
+        self.assertEqual(scheduler.stats["retried_429"], 1)
+        self.assertEqual(scheduler.stats["sent"], 4)
+
+        # ✅ Results and errors come back through the future; errors also to on_error
+        self.assertEqual(first.result(timeout=1), "a1")
+        self.assertIsInstance(failed.exception(timeout=1), ValueError)
+        self.assertEqual(errors, [(4, ValueError)])
+        scheduler.close()
+
+        # ✅ Bounded queue: beyond max_queued a send is refused at once
+        scheduler = SendScheduler(send, rate=1, burst=1, chat_rate=1, chat_burst=1, max_queued=2)
+        futures = [scheduler.submit(2, "send_message", (2, str(number))) for number in range(3)]
+        self.assertIsInstance(futures[2].exception(timeout=0), SendQueueFull)
+        self.assertEqual(scheduler.stats["refused"], 1)
+        scheduler.close(timeout=3)
+        print("✅ Test passed!")
+
+    def test_media_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            image_path = os.path.join(tmp, "1.JPG")
+            with open(image_path, "wb") as file:
+                file.write(b"jpeg bytes")
+            uploaded = MagicMock(photo=[MagicMock(file_id="small"), MagicMock(file_id="file-1")])
+
+            with patch.object(config, "MEDIA_CACHE_FILE", os.path.join(tmp, "media_cache.json")), \
+                 patch("utils.media_cache._entries", None), \
+                 patch("handlers.game_handler.bot.send_photo", return_value=uploaded) as mock_photo:
+                media_cache.send_photo(self.chat_id, image_path)
+                media_cache.send_photo(self.chat_id, image_path)
+                self.assertNotIsInstance(mock_photo.call_args_list[0][0][1], str)  # uploaded
+                self.assertEqual(mock_photo.call_args_list[1][0][1], "file-1")  # reused
+
+                # ✅ Persisted between runs
+                media_cache._entries = None
+                self.assertEqual(media_cache.cached_file_id(image_path), "file-1")
+
+                # ✅ Changed content: uploaded again
+                with open(image_path, "wb") as file:
+                    file.write(b"other jpeg bytes")
+                self.assertIsNone(media_cache.cached_file_id(image_path))
+                media_cache.send_photo(self.chat_id, image_path)
+
+                # ✅ Only a file_id error drops the file_id: a blocked bot is not an upload
+                def rejected(code, description):
+                    return ApiTelegramException("sendPhoto", None, {"error_code": code, "description": description})
+
+                mock_photo.reset_mock()
+                mock_photo.side_effect = [rejected(403, "Forbidden: bot was blocked by the user")]
+                with self.assertRaises(ApiTelegramException):
+                    media_cache.send_photo(self.chat_id, image_path)
+                self.assertEqual(mock_photo.call_count, 1)
+                self.assertEqual(media_cache.cached_file_id(image_path), "file-1")
+
+                mock_photo.side_effect = [rejected(400, "Bad Request: wrong file identifier/HTTP URL specified"), uploaded]
+                media_cache.send_photo(self.chat_id, image_path)
+                self.assertNotIsInstance(mock_photo.call_args_list[-1][0][1], str)  # uploaded again
+                mock_photo.side_effect = None
+                media_cache.forget(image_path)
+
+            # ✅ Queued sends (a Future): the file_id is kept once the upload is done
+            queued = Future()
+            with patch.object(config, "MEDIA_CACHE_FILE", os.path.join(tmp, "media_cache.json")), \
+                 patch("utils.media_cache._entries", None), \
+                 patch("handlers.game_handler.bot.send_photo", return_value=queued):
+                self.assertIs(media_cache.send_photo(self.chat_id, image_path), queued)
+                self.assertIsNone(media_cache.cached_file_id(image_path))
+                queued.set_result(uploaded)
+                self.assertEqual(media_cache.cached_file_id(image_path), "file-1")
+        print("✅ Test passed!")
+
+    def test_analytics_batching(self):
+        requests_received = []
+        failures = [1]
+
+        class StubHandler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                requests_received.append(body)
+                # ✅ The first request fails: the sender has to retry it
+                self.send_response(500 if failures and failures.pop() else 204)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}/mp/collect"
+        try:
+            sender = AnalyticsSender(url, flush_interval=0.05, backoff=0.01)
+            for i in range(30):
+                sender.log(1, "chapter_opened", {"chapter": str(i)})
+            sender.log(2, "error_occurred")
+            self.assertTrue(sender.flush(timeout=5))
+            sender.close()
+
+            delivered = requests_received[1:]
+            self.assertEqual(sender.stats["sent"], 31)
+            self.assertEqual(sender.stats["retries"], 1)
+            self.assertTrue(all(len(body["events"]) <= 25 for body in delivered))
+            self.assertEqual(sorted(len(body["events"]) for body in delivered), [1, 5, 25])
+
+            # ✅ A batch that cannot be sent (not JSON) is dropped, the sender keeps running
+            requests_received.clear()
+            sender = AnalyticsSender(url, flush_interval=0.05)
+            sender.log(4, "bad", {"value": object()})
+            self.assertTrue(sender.flush(timeout=5))
+            sender.log(5, "chapter_opened")
+            self.assertTrue(sender.flush(timeout=5))
+            self.assertTrue(sender.thread.is_alive())
+            self.assertEqual((sender.stats["failed"], sender.stats["sent"]), (1, 1))
+            sender.close()
+
+            # ✅ Full queue drops the oldest events, the rest is sent on close
+            requests_received.clear()
+            sender = AnalyticsSender(url, queue_size=3, flush_interval=10)
+            for i in range(5):
+                sender.log(3, "chapter_opened", {"chapter": str(i)})
+            sender.close(timeout=5)
+            self.assertEqual(sender.stats["dropped"], 2)
+            self.assertEqual([event["params"]["chapter"] for event in requests_received[0]["events"]], ["2", "3", "4"])
+        finally:
+            server.shutdown()
+            server.server_close()
+        print("✅ Test passed!")
+
+    def test_incremental_parse(self):
+        source = (
+            ":Start\nPLN Вы нашли меч.\nInv+ Меч\nBTN Next,Дальше\nEnd\n"
+            ":Next\nPLN Дорога.\nif меч then goto start\nEnd\n"
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            input_path = os.path.join(tmp, "input.txt")
+            cache_path = os.path.join(tmp, "cache.msgpack")
+
+            def build(text):
+                with open(input_path, "w", encoding="utf-8") as file:
+                    file.write(text)
+                return parse_input_to_json(input_path, cache_path), parse_input_to_json(input_path)
+
+            incremental, full = build(source)
+            self.assertEqual(incremental, full)
+
+            # ✅ Edited chapter is parsed again
+            incremental, full = build(source.replace("Дорога.", "Длинная дорога."))
+            self.assertEqual(incremental, full)
+
+            # ✅ A new use_ chapter makes the cached inventory action of "start" usable
+            incremental, full = build(source + ":use_Меч\nPLN Взмах.\nEnd\n")
+            self.assertEqual(incremental, full)
+            self.assertEqual(incremental[0]["start"][1]["value"], "inv+меч[usable]")
+
+            # ✅ Reading the cache keeps the host's GC setting
+            gc.disable()
+            try:
+                incremental, full = build(source)
+                self.assertFalse(gc.isenabled())
+            finally:
+                gc.enable()
+            self.assertEqual(incremental, full)
+        print("✅ Test passed!")
+
+    def test_streaming_parse(self):
+        # Inventory action parsed before its use_ chapter, "End..." line remainders, blank chapters
+        source = (
+            "  \n:Start\nPLN Вы нашли меч.\nInv+ Меч\nif a>1 then Inv+ Меч & btn x,y else Inv- Щит\n"
+            "Endless = 3\nEnd :Next\nPLN Дорога.\nEnd\n:use_Меч\nPLN Взмах.\nEnd\n\nEnd\n use_Щит\n end\nfoo\nEnd\n  \n"
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            input_path = os.path.join(tmp, "input.txt")
+            with open(input_path, "w", encoding="utf-8") as file:
+                file.write(source)
+
+            chapters = split_into_chapters(source)
+            usable_items = collect_usable_items(chapters)
+            rest_data = []
+            expected = dict(parse_chapter(chapter, usable_items, rest_data) for chapter in chapters)
+
+            self.assertEqual(parse_input_to_json(input_path), (expected, rest_data))
+            self.assertEqual(list(expected), ["start", "next", "use_меч", "", "use_щит"])
+            self.assertEqual(expected["start"][1]["value"], "inv+меч[usable]")
+            self.assertEqual(expected["start"][2]["value"]["else_actions"][0]["value"], "inv-щит[usable]")
+        print("✅ Test passed!")
+
+    def test_parallel_parse(self):
+        serial = parse_input_to_json("data/input.txt")
+        parallel = parse_input_to_json("data/input.txt", jobs=2)
+        self.assertEqual(list(parallel[0]), list(serial[0]))
+        self.assertEqual(parallel, serial)
+        print("✅ Test passed!")
+
     def test_assign_characteristics(self):
         with patch("handlers.game_handler.config.chapters", test_chapters):
             with patch("handlers.game_handler.bot.send_message") as mock_send:
@@ -313,6 +915,288 @@ class TestBotActions(unittest.TestCase):
 
         print("✅ Test successfully passed!")
 
+    def test_sqlite_saves(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "42.json"), "w", encoding="utf-8") as file:
+                json.dump({"2025-01-01 10:00:00": {"chapter": "inv_check"}}, file)
+
+            # ✅ Existing JSON saves are migrated
+            self.assertEqual(migrate(tmp, os.path.join(tmp, "saves.db"), 3), (1, 1))
+            store = SqliteSaveStore(os.path.join(tmp, "saves.db"), 3)
+            self.assertEqual(store.load(42), ("2025-01-01 10:00:00", {"chapter": "inv_check"}))
+
+            for minute in range(1, 5):
+                store.save(42, f"2025-01-01 10:0{minute}:00", {"chapter": f"ch{minute}"})
+            store.save(7, "2025-01-01 09:00:00", {"chapter": "other"})
+
+            # ✅ Only the newest SAVES_LIMIT slots are kept, other users untouched
+            self.assertEqual(store.list(42), ["2025-01-01 10:04:00", "2025-01-01 10:03:00", "2025-01-01 10:02:00"])
+            self.assertEqual(store.load(42), ("2025-01-01 10:04:00", {"chapter": "ch4"}))
+            self.assertEqual(store.load(42, "2025-01-01 10:02:00")[1], {"chapter": "ch2"})
+            self.assertEqual(store.load(42, "2025-01-01 10:00:00"), (None, None))
+            self.assertEqual(store.list(7), ["2025-01-01 09:00:00"])
+            self.assertEqual(store.list(99), [])
+        print("✅ Test passed!")
+
+    def test_save_index(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "42.json"), "w", encoding="utf-8") as file:
+                json.dump({"2025-01-01 10:00:00": {"chapter": "inv_check"}}, file, indent=4)
+
+            # ✅ Saves of an older version get an index on first use
+            store = JsonSaveStore(tmp, 3)
+            self.assertEqual([(slot["name"], slot["chapter"]) for slot in store.slots(42)],
+                             [("2025-01-01 10:00:00", "inv_check")])
+            for minute in range(1, 5):
+                store.save(42, f"2025-01-01 10:0{minute}:00", {"chapter": f"ch{minute}", "gold": minute})
+
+            # ✅ Menu from memory, only the chosen slot is read
+            with patch("builtins.open", side_effect=AssertionError("no I/O expected")):
+                self.assertEqual(store.list(42), ["2025-01-01 10:04:00", "2025-01-01 10:03:00", "2025-01-01 10:02:00"])
+            self.assertEqual(store.load(42, "2025-01-01 10:03:00"), ("2025-01-01 10:03:00", {"chapter": "ch3", "gold": 3}))
+            self.assertEqual(store.load(42, "2025-01-01 10:00:00"), (None, None))
+
+            # ✅ The save file stays plain JSON; after a restart the index is read from disk
+            with open(os.path.join(tmp, "42.json"), "r", encoding="utf-8") as file:
+                self.assertEqual(sorted(json.load(file)), ["2025-01-01 10:02:00", "2025-01-01 10:03:00", "2025-01-01 10:04:00"])
+            restarted = JsonSaveStore(tmp, 3)
+            self.assertEqual(restarted.slots(42), store.slots(42))
+            self.assertEqual(restarted.load(42), ("2025-01-01 10:04:00", {"chapter": "ch4", "gold": 4}))
+
+            sqlite_store = SqliteSaveStore(os.path.join(tmp, "saves.db"), 2)
+            sqlite_store.save(7, "2025-01-01 09:00:00", {"chapter": "a"})
+            self.assertEqual(sqlite_store.slots(7)[0]["chapter"], "a")
+            sqlite_store.save(7, "2025-01-01 09:01:00", {"chapter": "b"})
+            sqlite_store.save(7, "2025-01-01 09:02:00", {"chapter": "c"})
+            self.assertEqual(sqlite_store.slots(7), SqliteSaveStore(os.path.join(tmp, "saves.db"), 2).slots(7))
+            self.assertEqual([slot["chapter"] for slot in sqlite_store.slots(7)], ["c", "b"])
+        print("✅ Test passed!")
+
+    def test_session_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            now = [0.0]
+            cache = SessionCache(SqliteSaveStore(os.path.join(tmp, "saves.db"), 3), max_entries=2, ttl=100,
+                                 clock=lambda: now[0])
+            for chat_id in (1, 2, 3):
+                cache[chat_id] = {"chapter": f"ch{chat_id}", "gold": chat_id}
+            cache[2]["gold"] = 20
+
+            # ✅ Chat 1 was least recently used: written out, read back on the next access
+            self.assertEqual(sorted(cache), [2, 3])
+            self.assertEqual(cache.store.get_session(1), {"chapter": "ch1", "gold": 1})
+            self.assertEqual(cache.get(1), {"chapter": "ch1", "gold": 1})
+            self.assertEqual(sorted(cache), [1, 2])  # chat 3 made room for it
+
+            # ✅ Idle sessions are moved out even under the size limit
+            now[0] = 150
+            self.assertEqual(cache.get(2)["gold"], 20)
+            self.assertEqual(sorted(cache), [2])
+            self.assertEqual(cache.get(2)["gold"], 20)
+            self.assertIsNone(cache.get(4))
+            self.assertNotIn(1, cache)  # in memory only, the store is not read
+
+            report = cache.report()
+            self.assertEqual((report["evicted"], report["expired"], report["rehydrated"]), (2, 1, 1))
+            self.assertEqual(report["hit_ratio"], round(3 / 5, 4))
+
+            # ✅ A session replaced with the same content (a render) is not written again
+            self.assertEqual(cache.flush_dirty(), (1, 0))
+            cache[2] = dict(cache[2])
+            self.assertEqual(cache.flush_dirty(), (0, 1))
+            cache[2] = dict(cache[2], gold=21)
+            self.assertEqual(cache.flush_dirty(), (1, 0))
+
+            # ✅ An evicted session is written without the cache lock, and stays readable meanwhile
+            put_session, seen = cache.store.put_session, []
+
+            def other_chat(key):
+                free = cache._lock.acquire(timeout=1)
+                seen.append((free, key in cache))
+                if free:
+                    cache._lock.release()
+
+            def slow_put(key, saved):
+                other = threading.Thread(target=other_chat, args=(key,))
+                other.start()
+                other.join()
+                put_session(key, saved)
+
+            cache.store.put_session = slow_put
+            cache[2]["gold"] = 22
+            cache[5] = {"chapter": "ch5", "gold": 5}
+            cache[6] = {"chapter": "ch6", "gold": 6}  # chat 2 is evicted
+            self.assertEqual(seen, [(True, True)])
+            self.assertNotIn(2, cache)
+            self.assertEqual(cache.get(2)["gold"], 22)
+        print("✅ Test passed!")
+
+    def test_logging(self):
+        formatted = []
+
+        class Costly:
+            def __str__(self):
+                formatted.append(1)
+                return "costly"
+
+        logger = logging.getLogger("tests.logging")
+        records = queue.Queue(2)
+        logger.addHandler(log.DroppingQueueHandler(records))
+        logger.propagate = False
+        try:
+            # ✅ A level that is off formats nothing
+            logger.setLevel(logging.INFO)
+            logger.debug("value %s", Costly())
+            self.assertEqual(formatted, [])
+
+            # ✅ The message is merged when queued; a full queue drops records instead of blocking
+            logger.info("value %s", Costly())
+            self.assertEqual(records.get_nowait().msg, "value costly")
+            dropped = log.stats["dropped"]
+            for _ in range(3):
+                logger.info("flood")
+            self.assertEqual(log.stats["dropped"], dropped + 1)
+        finally:
+            logger.handlers.clear()
+
+        self.assertEqual(log.parse_levels("handlers.game_handler=debug, utils.parser=WARNING"),
+                         {"handlers.game_handler": "DEBUG", "utils.parser": "WARNING"})
+        print("✅ Test passed!")
+
+    def test_error_reporter(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            now, sent = [0.0], []
+            path = os.path.join(tmp, "logs", "errors.log")  # ✅ logs/ is created
+            reporter = ErrorReporter(path, window=60, max_bytes=2000, backups=5, sample_rate=0.5,
+                                     send=lambda *args: sent.append(args), clock=lambda: now[0],
+                                     rng=iter([0.9, 0.1, 0.9, 0.9]).__next__)
+
+            def fail(chapter):
+                try:
+                    raise KeyError(chapter)
+                except KeyError as e:
+                    reporter.report("handle_inline_choice", e, 42, context="обработчике")
+
+            # ✅ An error storm: one record, repeats counted, analytics sampled
+            for _ in range(5):
+                fail("bad_chapter")
+            self.assertEqual(reporter.stats, {"errors": 5, "written": 1, "repeats": 4, "sent": 2})
+            self.assertEqual([event[2]["sample_rate"] for event in sent], [1, 0.5])
+
+            now[0] = 61  # window ended: the count is written, the error is reported again
+            fail("bad_chapter")
+            for chapter in range(20):
+                fail(f"chapter_{chapter}")
+            reporter.close()
+
+            self.assertTrue(os.path.exists(f"{path}.1"))  # rotated
+            log_text = ""
+            for name in sorted(os.listdir(os.path.dirname(path))):
+                with open(os.path.join(os.path.dirname(path), name), encoding="utf-8") as file:
+                    log_text += file.read()
+            self.assertIn("repeated 4 more times within 60 s", log_text)
+            self.assertEqual(log_text.count("'bad_chapter'\nTraceback"), 2)
+
+            # ✅ Over max_tracked distinct errors the least recently seen is evicted, not deduplication
+            reporter = ErrorReporter(os.path.join(tmp, "lru", "errors.log"), window=60, sample_rate=0,
+                                     send=lambda *args: None, clock=lambda: now[0], max_tracked=2)
+            for chapter in ("a", "b", "a", "c", "c", "c", "a", "b"):
+                fail(chapter)
+            reporter.close()
+            self.assertEqual(reporter.stats, {"errors": 8, "written": 4, "repeats": 4, "sent": 4})
+            with open(os.path.join(tmp, "lru", "errors.log"), encoding="utf-8") as file:
+                self.assertIn("'c' — repeated 2 more times", file.read())
+        print("✅ Test passed!")
+
+    def test_metrics(self):
+        histogram = metrics.Histogram("test_seconds", "Test", "handler", buckets=(0.01, 0.1))
+        for seconds in (0.005, 0.05, 0.5):
+            histogram.observe('say "hi"', seconds)
+        text = "\n".join(histogram.render())
+        self.assertIn('test_seconds_bucket{handler="say \\"hi\\"",le="0.1"} 2', text)
+        self.assertIn('test_seconds_bucket{handler="say \\"hi\\"",le="+Inf"} 3', text)
+        self.assertIn('test_seconds_count{handler="say \\"hi\\""} 3', text)
+
+        # ✅ Registered handlers are timed under their names
+        test_bot = TeleBot("123:abc", threaded=False)
+        test_bot.callback_query_handler(func=lambda call: True)(lambda call: None)
+        metrics.instrument_handlers(test_bot)
+        metrics.instrument_handlers(test_bot)  # only once
+        test_bot.callback_query_handlers[0]["function"](None)
+        metrics.handler_seconds.aggregate()
+        self.assertEqual(sum(metrics.handler_seconds.series["<lambda>"][:-1]), 1)
+
+        # ✅ Scrape endpoint and the admin command
+        server = metrics.serve("127.0.0.1", 0)
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=5)
+            connection.request("GET", "/metrics")
+            response = connection.getresponse()
+            self.assertEqual(response.status, 200)
+            text = response.read().decode()
+            self.assertIn("questbot_sessions ", text)
+            self.assertIn("# TYPE questbot_api_calls_saved_total counter\n"
+                          f"questbot_api_calls_saved_total {message_buffer.stats['saved']}\n", text)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        message = types.Message.de_json({"message_id": 1, "date": 0, "text": "/metrics",
+                                         "chat": {"id": 7, "type": "private"},
+                                         "from": {"id": 7, "is_bot": False, "first_name": "Admin"}})
+        admin_only = next(handler["filters"]["func"] for handler in bot.message_handlers
+                          if handler["function"].__name__ == "send_metrics")
+        self.assertFalse(admin_only(message))
+        with patch.object(config, "ADMIN_IDS", [7]):
+            self.assertTrue(admin_only(message))
+        with patch("handlers.admin_handler.bot.send_message") as mock_send:
+            send_metrics(message)
+        sent = "".join(args[1] for args, _ in mock_send.call_args_list)
+        self.assertIn('questbot_handler_seconds_count{handler="<lambda>"} 1', sent)
+        self.assertNotIn("_bucket{", sent)
+        print("✅ Test passed!")
+
+    def test_autosave(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "saves.db")
+            cache = SessionCache(SqliteSaveStore(db_path, 3))
+            autosaver = Autosaver(cache, interval=3600)
+            cache[1] = {"chapter": "ch1", "gold": 1}
+            cache[2] = {"chapter": "ch2", "gold": 2}
+
+            autosaver.flush()
+            self.assertEqual(cache.store.get_session(1), {"chapter": "ch1", "gold": 1})
+
+            # ✅ Only sessions that really changed are written again
+            cache[1]["gold"] = 10
+            cache.get(2)
+            autosaver.flush()
+            autosaver.close()
+            self.assertEqual((autosaver.stats["written"], autosaver.stats["unchanged"]), (3, 1))
+
+            # ✅ After a restart sessions come back from the store
+            restarted = SessionCache(SqliteSaveStore(db_path, 3))
+            self.assertEqual(restarted.get(1), {"chapter": "ch1", "gold": 10})
+
+            # ✅ SIGTERM: the main loop ends normally, then the last pass runs before the process exits
+            script = (
+                "import os, signal, threading\n"
+                "from utils.save_store import SqliteSaveStore\n"
+                "from utils.session_cache import SessionCache\n"
+                "from utils import autosave\n"
+                f"cache = SessionCache(SqliteSaveStore({db_path!r}, 3))\n"
+                "polling = threading.Event()\n"
+                "autosaver = autosave.start(cache, 3600, on_stop=polling.set)\n"
+                "cache[3] = {'chapter': 'ch3'}\n"
+                "os.kill(os.getpid(), signal.SIGTERM)\n"
+                "polling.wait(10)\n"
+                "print('loop ended', autosaver.stopping.is_set(), cache.store.get_session(3))\n"
+            )
+            result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, timeout=30)
+            self.assertEqual(result.returncode, 0, result.stderr)
+            self.assertEqual(result.stdout.splitlines()[0], "loop ended True None")  # not written from the handler
+            self.assertEqual(restarted.store.get_session(3), {"chapter": "ch3"})
+        print("✅ Test passed!")
+
     def test_instruction_navigation(self):
         with patch("handlers.game_handler.config.chapters", test_chapters):
             with patch("handlers.game_handler.bot.send_message") as mock_send:
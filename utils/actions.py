@@ -0,0 +1,122 @@
+# ✅ Compact actions
+#
+# Loaded chapters are tuples of actions, each action a tuple with an integer opcode first
+# instead of a {"type": ..., "value": {...}} dict, and execute_action dispatches through
+# a table indexed by that opcode. chapters.json, the bundle and save files keep the dict
+# form; compile_action/action_to_dict convert between the two.
+#
+#   (TEXT, text)                    (INVENTORY, "inv+item")        (GOLD, "+5")
+#   (BTN, text, target, actions)    (XBTN, text, target, actions)  (GOTO, target)
+#   (ASSIGN, key, expression, name) (IMAGE, path)                  (END,)
+#   (IF, condition, actions, else_actions)
+#   (OTHER, type, value)            # "unknown" and anything else: nothing to execute
+#
+# actions/else_actions are tuples of compiled actions, or None when the dict had no such key.
+#
+# A button's actions are kept in player state as an ActionRef (chapter, index): the index
+# counts the buttons with actions of that chapter in iter_buttons order, so the actions are
+# taken from the loaded quest when the button is pressed instead of being copied.
+
+from typing import NamedTuple
+
+TEXT, BTN, XBTN, INVENTORY, GOLD, ASSIGN, GOTO, IMAGE, IF, END, OTHER = range(11)
+
+ACTION_TYPES = ("text", "btn", "xbtn", "inventory", "gold", "assign", "goto", "image", "if", "end")
+OPCODES = {action_type: opcode for opcode, action_type in enumerate(ACTION_TYPES)}
+
+
+def compile_actions(actions):
+    return tuple(compile_action(action) for action in actions)
+
+
+def _nested(actions):
+    return None if actions is None else compile_actions(actions)
+
+
+def compile_action(action):
+    """Tuple form of a dict action (tuples are returned as is)."""
+    if action.__class__ is tuple:
+        return action
+
+    action_type, value = action["type"], action["value"]
+    opcode = OPCODES.get(action_type, OTHER)
+    try:
+        if opcode in (TEXT, INVENTORY, GOLD, GOTO, IMAGE):
+            return (opcode, value)
+        if opcode == END:
+            return (END,)
+        if opcode in (BTN, XBTN):
+            return (opcode, value["text"], value["target"], _nested(value.get("actions")))
+        if opcode == ASSIGN:
+            return (ASSIGN, value["key"], value["value"], value.get("name"))
+        if opcode == IF:
+            return (IF, value["condition"], compile_actions(value["actions"]), _nested(value.get("else_actions")))
+    except (KeyError, TypeError, AttributeError):
+        pass  # malformed value: kept as is, nothing to execute
+    return (OTHER, action_type, value)
+
+
+def actions_to_dicts(actions):
+    return [action_to_dict(action) for action in actions]
+
+
+def action_to_dict(action):
+    """Dict form of a compiled action (dicts are returned as is)."""
+    if action.__class__ is dict:
+        return action
+
+    opcode = action[0]
+    if opcode == OTHER:
+        return {"type": action[1], "value": action[2]}
+    action_type = ACTION_TYPES[opcode]
+    if opcode == END:
+        value = ""
+    elif opcode in (BTN, XBTN):
+        value = {"text": action[1], "target": action[2]}
+        if action[3] is not None:
+            value["actions"] = actions_to_dicts(action[3])
+    elif opcode == ASSIGN:
+        value = {"key": action[1], "value": action[2]}
+        if action[3] is not None:
+            value["name"] = action[3]
+    elif opcode == IF:
+        value = {"condition": action[1], "actions": actions_to_dicts(action[2])}
+        if action[3] is not None:
+            value["else_actions"] = actions_to_dicts(action[3])
+    else:
+        value = action[1]
+    return {"type": action_type, "value": value}
+
+
+class ActionRef(NamedTuple):
+    chapter: object  # chapter ID in state (key in save files)
+    index: int
+
+
+def iter_buttons(actions):
+    """Buttons with actions of a chapter, depth first (inside if branches and button actions too)."""
+    for action in actions:
+        action = compile_action(action)
+        opcode = action[0]
+        if opcode in (BTN, XBTN) and action[3] is not None:
+            yield action
+            yield from iter_buttons(action[3])
+        elif opcode == IF:
+            yield from iter_buttons(action[2])
+            yield from iter_buttons(action[3] or ())
+
+
+def button_ref(chapter_id, actions, button):
+    """ActionRef of button (a compiled btn/xbtn) in the chapter's actions, None if it's not there."""
+    for index, candidate in enumerate(iter_buttons(actions)):
+        if candidate is button or candidate == button:
+            return ActionRef(chapter_id, index)
+    return None
+
+
+def button_actions(actions, ref, text):
+    """Actions of the button ref points to; None if the quest no longer has that button."""
+    for index, button in enumerate(iter_buttons(actions)):
+        if index == ref.index:
+            return button[3] if button[1] == text else None
+    return None
@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import weakref
+from collections import deque
+from contextvars import ContextVar
+from telebot.async_telebot import AsyncTeleBot
+from config import bot, config
+from handlers.game_handler import send_chapter as _send_chapter, execute_action as _execute_action
+from utils.state_manager import save_state as _save_state, load_state as _load_state, state_cache
+from utils import media_cache
+
+logger = logging.getLogger(__name__)
+
+# ✅ Asyncio engine mode
+#
+# The game engine stays synchronous: without network calls a chapter render is short,
+# CPU-only work. While it runs inside AsyncEngine, the bot.send_* calls it makes are
+# recorded instead of being sent, and the recorded calls are then sent with AsyncTeleBot.
+# So one event loop serves all players and no thread waits on Telegram. File I/O runs in
+# worker threads: images (media_cache checks and uploads), save/load buttons,
+# save_state/load_state, updates of chats whose session has to be read back from the
+# store, and the writes of sessions evicted from state_cache (kept in its deferred queue).
+# Updates of one chat are handled strictly one after another (per-chat asyncio.Lock).
+
+RECORDED_METHODS = ("send_message", "send_photo")
+
+# Buttons whose handlers read or write save files
+BLOCKING_CALLBACKS = {"📥 Save game", "📤 Load game"}
+
+_outbox = ContextVar("outbox", default=None)
+
+
+class PhotoUpload:
+    """A photo recorded as a file path: read and uploaded by the async sender."""
+
+    def __init__(self, path):
+        self.path = path
+
+
+def _recorder(method, send):
+    def record(*args, **kwargs):
+        outbox = _outbox.get()
+        if outbox is None:
+            return send(*args, **kwargs)  # not inside the async engine
+        if method == "send_photo" and hasattr(args[1], "read"):
+            args = (args[0], PhotoUpload(args[1].name), *args[2:])
+        outbox.append((method, args, kwargs))
+        return None  # no Message yet: media_cache stores the file_id after the upload
+    return record
+
+
+def _record_image(chat_id, path):
+    # media_cache.recorder: the image is sent by deliver, its file checks off the event loop
+    outbox = _outbox.get()
+    if outbox is None:
+        return False  # not inside the async engine: media_cache sends it itself
+    outbox.append(("send_image", (chat_id, path), {}))
+    return True
+
+
+def is_blocking(call):
+    return call.data in BLOCKING_CALLBACKS or call.data.startswith("load_")
+
+
+class AsyncEngine:
+    def __init__(self, async_bot=None):
+        self.async_bot = async_bot or AsyncTeleBot(config.TOKEN)
+        self._locks = weakref.WeakValueDictionary()  # chat_id -> asyncio.Lock while in use
+        self.stats = {"updates": 0, "api_calls": 0, "errors": 0}
+
+        # ✅ Sync handlers run inline (in the caller's context) and their sends are recorded
+        # (outside an update the recorder sends directly; close() puts the originals back)
+        bot.threaded = False
+        self._sends = {method: bot.__dict__.get(method) for method in RECORDED_METHODS}
+        for method in RECORDED_METHODS:
+            setattr(bot, method, _recorder(method, getattr(bot, method)))
+        self._media_recorder, media_cache.recorder = media_cache.recorder, _record_image
+        self._deferred, state_cache.deferred = state_cache.deferred, deque()
+
+        @self.async_bot.message_handler(func=lambda message: True)
+        async def on_message(message):
+            await self.process(message.chat.id, bot.process_new_messages, [message])
+
+        @self.async_bot.callback_query_handler(func=lambda call: True)
+        async def on_callback(call):
+            await self.process(call.message.chat.id, bot.process_new_callback_query, [call],
+                               blocking=is_blocking(call))
+
+    def _lock(self, chat_id):
+        lock = self._locks.get(chat_id)
+        if lock is None:
+            lock = self._locks[chat_id] = asyncio.Lock()
+        return lock
+
+    async def _run(self, func, *args, blocking=False):
+        outbox = []
+        token = _outbox.set(outbox)
+        try:
+            if blocking:
+                await asyncio.to_thread(func, *args)  # the thread gets a copy of this context
+            else:
+                func(*args)
+        finally:
+            _outbox.reset(token)
+        return outbox
+
+    async def process(self, chat_id, func, *args, blocking=False):
+        """Run a sync engine function for chat_id and send what it produced."""
+        async with self._lock(chat_id):
+            self.stats["updates"] += 1
+            try:
+                # ✅ A session that is not in memory is read back from the store in the worker thread
+                outbox = await self._run(func, *args, blocking=blocking or chat_id not in state_cache)
+                if state_cache.deferred:
+                    await asyncio.to_thread(state_cache.write_deferred)
+                await self.deliver(outbox)
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error("❌ Error in async update for %s: %s", chat_id, e, exc_info=True)
+
+    async def deliver(self, outbox):
+        for method, args, kwargs in outbox:
+            self.stats["api_calls"] += 1
+            if method == "send_image":
+                await self._send_image(*args)
+            elif method == "send_photo" and isinstance(args[1], PhotoUpload):
+                await self._upload_photo(args[0], args[1].path, *args[2:], **kwargs)
+            else:
+                await getattr(self.async_bot, method)(*args, **kwargs)
+
+    async def _send_image(self, chat_id, path):
+        # media_cache.send_photo, with its stat / hash / cache file I/O in worker threads
+        file_id = await asyncio.to_thread(media_cache.cached_file_id, path)
+        if file_id is not None:
+            try:
+                message = await self.async_bot.send_photo(chat_id, file_id)
+            except Exception as e:
+                if not media_cache.bad_file_id(e):
+                    raise
+                logger.warning("⚠️ Cached file_id for %s rejected: %s", path, e)
+                await asyncio.to_thread(media_cache.forget, path)
+            else:
+                await asyncio.to_thread(media_cache.count_reused, path)
+                return message
+        message = await self._upload_photo(chat_id, path)
+        await asyncio.to_thread(media_cache.count_upload, path)
+        return message
+
+    async def _upload_photo(self, chat_id, path, *args, **kwargs):
+        data = await asyncio.to_thread(_read_file, path)
+        message = await self.async_bot.send_photo(chat_id, data, *args, **kwargs)
+        if message and message.photo:
+            await asyncio.to_thread(media_cache.remember, path, message.photo[-1].file_id)
+        return message
+
+    # ✅ Coroutine-friendly engine API
+    async def send_chapter(self, chat_id):
+        await self.process(chat_id, _send_chapter, chat_id)
+
+    async def execute_action(self, chat_id, state, action):
+        await self.process(chat_id, _execute_action, chat_id, state, action)
+
+    async def save_state(self, user_id):
+        await asyncio.to_thread(_save_state, user_id)
+
+    async def load_state(self, user_id):
+        return await asyncio.to_thread(_load_state, user_id)
+
+    def close(self):
+        """Give bot its own send_message / send_photo back (and media_cache / state_cache their I/O)."""
+        for method, send in self._sends.items():
+            if send is None:
+                bot.__dict__.pop(method, None)  # the TeleBot method again
+            else:
+                setattr(bot, method, send)
+        media_cache.recorder = self._media_recorder
+        if state_cache.deferred:
+            state_cache.write_deferred()  # evictions not written yet
+        state_cache.deferred = self._deferred
+
+    def stop(self):
+        """End run_polling after the current getUpdates (safe from a signal handler)."""
+        self.async_bot._polling = False
+
+    async def run_polling(self):
+        try:
+            await self.async_bot.infinity_polling()
+        finally:
+            self.close()
+            await self.async_bot.close_session()
+
+
+def _read_file(path):
+    with open(path, "rb") as file:
+        return file.read()
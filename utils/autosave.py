@@ -0,0 +1,75 @@
+import atexit
+import logging
+import signal
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# ✅ Write-behind autosave of player sessions
+#
+# Every AUTOSAVE_INTERVAL seconds a background thread writes the sessions changed since
+# the last pass to the session store in one batch (state_cache.flush_dirty). The last
+# pass runs when the bot stops, SIGTERM included, so a deploy or restart keeps the
+# players' progress: SIGTERM only asks the entry point's main loop to stop (on_stop),
+# the loop returns normally and close() writes what is left. After a restart a session is read back the first time its chat
+# sends an update, so startup does not depend on the number of stored sessions.
+# Save slots (📥 Save game) are separate and stay as they are.
+
+
+class Autosaver:
+    def __init__(self, cache, interval=5.0, on_stop=None):
+        self.cache = cache
+        self.interval = interval
+        self.on_stop = on_stop  # ends the entry point's main loop (e.g. bot.stop_polling)
+        self.stopping = threading.Event()  # SIGTERM received
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()  # one pass at a time
+        self.closed = False
+        self.stats = {"passes": 0, "written": 0, "unchanged": 0, "errors": 0, "last_pass_ms": 0.0}
+        self.thread = threading.Thread(target=self._run, name="autosave", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            start = time.perf_counter()
+            try:
+                written, unchanged = self.cache.flush_dirty()
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error("❌ Autosave failed: %s", e)
+                return
+            self.stats["passes"] += 1
+            self.stats["written"] += written
+            self.stats["unchanged"] += unchanged
+            self.stats["last_pass_ms"] = (time.perf_counter() - start) * 1000
+
+    def request_stop(self, *args):
+        """SIGTERM handler: no exit from here, the main loop ends and the bot closes normally."""
+        self.stopping.set()
+        if self.on_stop is not None:
+            self.on_stop()
+
+    def close(self):
+        with self.lock:
+            if self.closed:  # by the entry point, then again by atexit
+                return
+            self.closed = True
+        self.stopped.set()
+        self.thread.join()
+        self.flush()
+        logger.info("💾 Sessions saved (%s writes in total)", self.stats["written"])
+
+
+def start(cache, interval, on_stop=None):
+    autosaver = Autosaver(cache, interval, on_stop)
+    atexit.register(autosaver.close)
+    # ✅ SIGTERM stops the main loop through on_stop; the last pass runs after it returns
+    # (entry points with their own SIGTERM handling, like webhook mode, pass no on_stop)
+    if on_stop is not None and signal.getsignal(signal.SIGTERM) is signal.SIG_DFL:
+        signal.signal(signal.SIGTERM, autosaver.request_stop)
+    return autosaver
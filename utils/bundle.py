@@ -0,0 +1,298 @@
+import gc
+import mmap
+import os
+import sys
+import threading
+from collections import Counter, OrderedDict
+from collections.abc import Mapping
+import msgpack
+
+# ✅ Compiled quest bundle
+#
+# A msgpack file written by utils/parser.py next to chapters.json. Every chapter key,
+# action type and repeated string (targets, conditions, button texts...) is stored once
+# in a string table and referenced by its index; on load the table is interned so all
+# chapters share the same string objects.
+#
+# Layout: a msgpack stream of {"format": "questtg", "version": 1, "strings": [...], "chapters": N}
+#         followed by N [key, actions] objects, so chapters are decoded one at a time
+# Index:  a second msgpack file with the byte range of the header and of every chapter,
+#         used by ChapterStore to decode chapters on demand straight from a memory map
+# Action: [type, value] for string values, [type, field, field, ...] for the types in
+#         _FIELDS, or [type, None, value] for anything else (stored as is)
+# Linked: chapter keys come first in the string table, so a btn/xbtn/goto target that
+#         references string i < N is chapter ID i (see utils/linker.py); decoding with
+#         linked=True returns those targets as ints
+
+BUNDLE_FORMAT = "questtg"
+BUNDLE_VERSION = 1
+INDEX_FORMAT = "questtg-index"
+
+# Field order of structured action values; nested action lists are marked with "*",
+# every field except the last optional one (else_actions) is required
+_OPTIONAL = {"else_actions"}
+_FIELDS = {
+    "btn": ("text", "target"),
+    "xbtn": ("target", "text", "*actions"),
+    "assign": ("key", "value", "name"),
+    "if": ("condition", "*actions", "*else_actions"),
+}
+_REQUIRED = {action_type: sum(field.lstrip("*") not in _OPTIONAL for field in fields)
+             for action_type, fields in _FIELDS.items()}
+
+
+def _walk_strings(actions, counter, types):
+    for action in actions:
+        types.add(action["type"])
+        value = action["value"]
+        if isinstance(value, str):
+            counter[value] += 1
+        elif action["type"] in _FIELDS and _is_structured(action):
+            for field in _FIELDS[action["type"]]:
+                if field.startswith("*"):
+                    _walk_strings(value.get(field[1:], []), counter, types)
+                else:
+                    counter[value[field]] += 1
+
+
+def _is_structured(action):
+    names = {field.lstrip("*") for field in _FIELDS[action["type"]]}
+    value = action["value"]
+    return isinstance(value, dict) and names - _OPTIONAL <= set(value) <= names
+
+
+def build_bundle(chapters):
+    """Serialize chapters (as loaded from chapters.json) into bundle bytes and its offset index."""
+    counter = Counter()
+    types = set()
+    for actions in chapters.values():
+        _walk_strings(actions, counter, types)
+
+    # Chapter keys and action types are always interned, other strings only if repeated
+    strings = list(dict.fromkeys([*chapters, *sorted(types), *(s for s, count in counter.items() if s and count > 1)]))
+    index = {s: i for i, s in enumerate(strings)}
+
+    def ref(value):
+        return index.get(value, value) if isinstance(value, str) else value
+
+    def encode(actions):
+        encoded = []
+        for action in actions:
+            action_type, value = action["type"], action["value"]
+            if isinstance(value, str):
+                encoded.append([ref(action_type), ref(value)])
+                continue
+            # A null first field would read as the [type, None, value] form: such values are stored as is
+            if action_type not in _FIELDS or not _is_structured(action) or \
+                    value.get(_FIELDS[action_type][0].lstrip("*")) is None:
+                encoded.append([ref(action_type), None, value])
+                continue
+            row = [ref(action_type)]
+            for field in _FIELDS[action_type]:
+                if field.startswith("*"):
+                    nested = value.get(field[1:])
+                    row.append(None if nested is None else encode(nested))
+                else:
+                    row.append(ref(value.get(field)))
+            # Trailing optional fields (else_actions) are dropped, required ones stay even when null
+            while len(row) > 1 + _REQUIRED[action_type] and row[-1] is None:
+                row.pop()
+            encoded.append(row)
+        return encoded
+
+    header = msgpack.packb({
+        "format": BUNDLE_FORMAT,
+        "version": BUNDLE_VERSION,
+        "strings": strings,
+        "chapters": len(chapters),
+    })
+    parts = [header]
+    spans = []
+    offset = len(header)
+    for key, actions in chapters.items():
+        packed = msgpack.packb([ref(key), encode(actions)])
+        parts.append(packed)
+        spans.append([key, offset, len(packed)])
+        offset += len(packed)
+
+    index = {
+        "format": INDEX_FORMAT,
+        "version": BUNDLE_VERSION,
+        "bundle_size": offset,
+        "header": [0, len(header)],
+        "chapters": spans,
+    }
+    return b"".join(parts), index
+
+
+def pack_chapters(chapters):
+    """Serialize chapters into bundle bytes (without the index)."""
+    return build_bundle(chapters)[0]
+
+
+def _check_header(header):
+    if not isinstance(header, dict) or header.get("format") != BUNDLE_FORMAT:
+        raise ValueError("Not a quest bundle")
+    if header.get("version") != BUNDLE_VERSION:
+        raise ValueError(f"Unsupported bundle version: {header.get('version')}")
+
+
+def _decoders(strings, linked_chapters=None):
+    """Return (string, decode) bound to the interned string table of a bundle.
+
+    With linked_chapters (the chapter count) btn/xbtn/goto targets are decoded as chapter IDs.
+    """
+    table = [sys.intern(s) for s in strings]
+
+    def string(value):
+        return table[value] if value.__class__ is int else value
+
+    if linked_chapters is None:
+        target = string
+    else:
+        def target(value):
+            return value if value.__class__ is int and value < linked_chapters else string(value)
+
+    def decode(rows):
+        # Unrolled per type (mirrors _FIELDS): this loop is the whole load time
+        actions = []
+        for row in rows:
+            action_type = string(row[0])
+            if len(row) == 2:
+                value = target(row[1]) if action_type == "goto" else string(row[1])
+            elif row[1] is None:
+                value = row[2]
+            elif action_type == "btn":
+                value = {"text": string(row[1]), "target": target(row[2])}
+            elif action_type == "assign":
+                value = {"key": string(row[1]), "value": string(row[2]), "name": string(row[3])}
+            elif action_type == "if":
+                value = {"condition": string(row[1]), "actions": decode(row[2])}
+                if len(row) > 3:
+                    value["else_actions"] = decode(row[3])
+            else:
+                value = {"target": target(row[1]), "text": string(row[2]), "actions": decode(row[3])}
+            actions.append({"type": action_type, "value": value})
+        return actions
+
+    return string, decode
+
+
+def unpack_chapters(stream, linked=False):
+    """Decode a bundle (bytes or binary file) back into the chapters dict used by the game.
+
+    linked=True returns btn/xbtn/goto targets as chapter IDs (positions in the dict).
+    """
+    unpacker = msgpack.Unpacker(stream) if hasattr(stream, "read") else msgpack.Unpacker()
+    if not hasattr(stream, "read"):
+        unpacker.feed(stream)
+
+    try:
+        header = unpacker.unpack()
+    except msgpack.OutOfData:
+        raise ValueError("Empty quest bundle") from None
+    _check_header(header)
+    string, decode = _decoders(header["strings"], header["chapters"] if linked else None)
+
+    # Thousands of small dicts: no point letting the cyclic GC scan them while decoding
+    # (the host's GC setting is restored, not forced on)
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        chapters = {}
+        for _ in range(header["chapters"]):
+            key, rows = unpacker.unpack()
+            chapters[string(key)] = decode(rows)
+        return chapters
+    except msgpack.OutOfData:
+        raise ValueError("Truncated quest bundle") from None
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def save_bundle(chapters, path, index_path=None):
+    data, index = build_bundle(chapters)
+    with open(path, "wb") as file:
+        file.write(data)
+    if index_path:
+        with open(index_path, "wb") as file:
+            file.write(msgpack.packb(index))
+
+
+def load_bundle(path, linked=False):
+    with open(path, "rb") as file:
+        return unpack_chapters(file, linked)
+
+
+# ✅ Lazy chapters: decoded from the memory-mapped bundle on first access, LRU of hot chapters
+# (readable by key or by chapter ID, i.e. position in the index)
+class ChapterStore(Mapping):
+    def __init__(self, path, index_path, cache_size=128, linked=False, transform=None):
+        with open(index_path, "rb") as file:
+            index = msgpack.unpackb(file.read())
+        if not isinstance(index, dict) or index.get("format") != INDEX_FORMAT or index.get("version") != BUNDLE_VERSION:
+            raise ValueError(f"Not a quest bundle index: {index_path}")
+
+        with open(path, "rb") as file:
+            if os.fstat(file.fileno()).st_size != index["bundle_size"]:
+                raise ValueError(f"{index_path} doesn't match {path}")
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        offset, length = index["header"]
+        header = msgpack.unpackb(self._map[offset:offset + length])
+        _check_header(header)
+        _, self._decode = _decoders(header["strings"], header["chapters"] if linked else None)
+
+        self._spans = {sys.intern(key): (offset, length) for key, offset, length in index["chapters"]}
+        self._keys = list(self._spans)
+        self._transform = transform  # applied to every decoded chapter (e.g. compile_actions)
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __getitem__(self, key):
+        if key.__class__ is int:
+            if not 0 <= key < len(self._keys):  # no negative indexing: -1 is not a chapter ID
+                raise KeyError(key)
+            key = self._keys[key]
+        with self._lock:
+            chapter = self._cache.get(key)
+            if chapter is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return chapter
+
+            offset, length = self._spans[key]
+            _, rows = msgpack.unpackb(self._map[offset:offset + length])
+            chapter = self._decode(rows)
+            if self._transform is not None:
+                chapter = self._transform(chapter)
+            self.misses += 1
+
+            self._cache[key] = chapter
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+            return chapter
+
+    def __contains__(self, key):
+        return key in self._spans
+
+    def __iter__(self):
+        return iter(self._spans)
+
+    def __len__(self):
+        return len(self._spans)
+
+    def close(self):
+        self._map.close()
+
+
+if __name__ == "__main__":
+    # Rebuild the bundle from an existing chapters.json: python -m utils.bundle
+    import json
+    with open("data/chapters.json", "r", encoding="utf-8") as file:
+        save_bundle(json.load(file), "data/chapters.msgpack", "data/chapters.idx")
+    print("✅ data/chapters.msgpack and data/chapters.idx written")
@@ -0,0 +1,105 @@
+import threading
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# ✅ Multi-threaded update processing with per-chat order
+#
+# Handlers mutate state_cache[chat_id] freely (and send_chapter recurses through goto),
+# so two updates of one chat must never run at the same time. Every chat gets a queue of
+# pending updates; a chat with work is scheduled on the pool once, its worker runs one
+# update and puts the chat back at the end of the pool queue if more are pending.
+# Different chats run in parallel, updates of one chat strictly in arrival order, and a
+# busy chat can't hold a worker while other chats wait.
+
+
+def update_chat_id(update):
+    """Chat an update belongs to, None for updates without one (run without ordering)."""
+    for message in (update.message, update.edited_message):
+        if message is not None:
+            return message.chat.id
+    call = update.callback_query
+    if call is not None:
+        return call.message.chat.id if call.message else call.from_user.id
+    return None
+
+
+class ChatDispatcher:
+    def __init__(self, process, num_threads=4):
+        self.process = process  # runs a list of updates inline
+        self.pool = ThreadPoolExecutor(num_threads, thread_name_prefix="updates")
+        self.pending = {}  # chat_id -> deque of updates, present while the chat is scheduled
+        self.condition = threading.Condition()
+        self.active = 0  # scheduled chats + unordered updates not finished yet
+        self.stats = {"updates": 0, "errors": 0, "max_queued": 0}
+
+    def submit(self, chat_id, update):
+        with self.condition:
+            self.stats["updates"] += 1
+            queue = self.pending.get(chat_id)
+            if queue is not None:
+                queue.append(update)  # its worker picks it up after the current update
+                self.stats["max_queued"] = max(self.stats["max_queued"], len(queue))
+                return
+            self.active += 1
+            if chat_id is not None:
+                self.pending[chat_id] = deque([update])
+        if chat_id is None:
+            self.pool.submit(self._run_unordered, update)
+        else:
+            self.pool.submit(self._run_chat, chat_id)
+
+    def process_new_updates(self, updates):
+        for update in updates:
+            self.submit(update_chat_id(update), update)
+
+    def _run(self, update):
+        try:
+            self.process([update])
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error("❌ Error while processing update %s: %s", update.update_id, e, exc_info=True)
+
+    def _run_unordered(self, update):
+        self._run(update)
+        self._done()
+
+    def _run_chat(self, chat_id):
+        with self.condition:
+            update = self.pending[chat_id][0]
+        self._run(update)
+        with self.condition:
+            queue = self.pending[chat_id]
+            queue.popleft()
+            if queue:
+                self.pool.submit(self._run_chat, chat_id)
+                return
+            del self.pending[chat_id]
+        self._done()
+
+    def _done(self):
+        with self.condition:
+            self.active -= 1
+            if not self.active:
+                self.condition.notify_all()
+
+    def join(self, timeout=None):
+        """Wait until every submitted update is processed. False on timeout."""
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.active, timeout)
+
+    def shutdown(self, timeout=None):
+        """Process the updates already received, then stop the workers. False on timeout."""
+        drained = self.join(timeout)
+        self.pool.shutdown(wait=False)
+        return drained
+
+
+def install(bot, num_threads):
+    """Process the updates bot receives (polling or webhook) on a ChatDispatcher."""
+    bot.threaded = False  # handlers run inline on the dispatcher's workers
+    dispatcher = ChatDispatcher(bot.process_new_updates, num_threads)
+    bot.process_new_updates = dispatcher.process_new_updates
+    return dispatcher
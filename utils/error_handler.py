@@ -1,8 +1,139 @@
+from collections import OrderedDict
 from functools import wraps
-from config import bot
+from config import bot, config
+import atexit
 import traceback
-from datetime import datetime
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
 from utils.firebase_analytics import log_event
+from utils.log import DroppingQueueHandler
+
+logger = logging.getLogger(__name__)
+
+# ✅ Error reporting
+#
+# A failing handler hands its exception to the ErrorReporter: the same error (same
+# place, same exception, same traceback frames) is written once per ERROR_DEDUP_WINDOW
+# seconds, its repeats are counted and written as one "repeated N times" line when the
+# window ends. logs/errors.log is written by a background thread and rotated at
+# ERROR_LOG_MAX_BYTES. The first occurrence in a window goes to analytics, repeats only
+# with probability ERROR_SAMPLE_RATE (the event says which rate it was sampled at).
+# At most max_tracked distinct errors are counted at once: a new one evicts the least
+# recently seen (its repeats are written), so a flood of distinct errors is still deduplicated.
+
+
+class ErrorReporter:
+    def __init__(self, path, window=60.0, max_bytes=5 * 2 ** 20, backups=5, sample_rate=0.1,
+                 send=log_event, clock=time.monotonic, rng=random.random, queue_size=1000, max_tracked=1000):
+        self.window = window
+        self.max_tracked = max_tracked  # distinct errors counted at once
+        self.sample_rate = sample_rate
+        self.send = send
+        self.clock = clock
+        self.rng = rng
+
+        # ✅ Background writer of the error log (logs/ is created if missing)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                                       encoding="utf-8", delay=True)
+        handler.setFormatter(logging.Formatter("%(asctime)s - %(message)s"))
+        records = queue.Queue(queue_size)
+        self.listener = logging.handlers.QueueListener(records, handler)
+        self.listener.start()
+        self.file = logging.getLogger(f"{__name__}.file.{id(self)}")
+        self.file.propagate = False
+        self.file.handlers[:] = [DroppingQueueHandler(records)]
+        self.file.setLevel(logging.ERROR)
+
+        self.seen = OrderedDict()  # (name, exception type, message, frames) -> [window start, repeats since], LRU
+        self.last_sweep = clock()
+        self.lock = threading.Lock()
+        self.stats = {"errors": 0, "written": 0, "repeats": 0, "sent": 0}
+
+    def report(self, name, error, client_id="system", context="функции"):
+        # ✅ Same place, same exception and the same frames: the same error (the traceback
+        # text is formatted only when it is written or sent)
+        frames = tuple((frame.f_code.co_filename, line) for frame, line in traceback.walk_tb(error.__traceback__))
+        key = (name, type(error).__name__, str(error), frames)
+        now = self.clock()
+        with self.lock:
+            self.stats["errors"] += 1
+            ended = self._sweep(now) if now - self.last_sweep >= self.window else []
+            entry = self.seen.get(key)
+            first = entry is None
+            if first:
+                if len(self.seen) >= self.max_tracked:
+                    ended.append(self.seen.popitem(last=False))  # least recently seen
+                self.seen[key] = [now, 0]
+                self.stats["written"] += 1
+            else:
+                entry[1] += 1
+                self.seen.move_to_end(key)
+                self.stats["repeats"] += 1
+            send = first or self.rng() < self.sample_rate
+            if send:
+                self.stats["sent"] += 1
+        self._write_repeats(ended)
+        if not (first or send):
+            return
+
+        text = "".join(traceback.format_exception(error))
+        if first:
+            logger.error("❌ Ошибка в %s %s: %s", context, name, error)
+            self.file.error("❌ Ошибка в %s %s: %s\n%s", context, name, error, text)
+        if send:
+            self.send(client_id, "error_occurred", {
+                "function": name,
+                "error": str(error),
+                "traceback": text[:1000],  # ограничение по размеру
+                "sample_rate": 1 if first else self.sample_rate,
+            })
+
+    def _sweep(self, now):
+        # Errors whose window has ended: forgotten, their repeats get written
+        self.last_sweep = now
+        ended = [(key, entry) for key, entry in self.seen.items() if now - entry[0] >= self.window]
+        for key, _ in ended:
+            del self.seen[key]
+        return ended
+
+    def _write_repeats(self, ended):
+        for (name, error_type, message, _), (start, repeats) in ended:
+            if repeats:
+                self.file.error("❌ %s: %s: %s — repeated %s more times within %.0f s",
+                                name, error_type, message, repeats, self.window)
+
+    def close(self):
+        with self.lock:
+            ended, self.seen = list(self.seen.items()), OrderedDict()
+        self._write_repeats(ended)
+        self.listener.stop()
+
+
+_reporter = None
+_reporter_lock = threading.Lock()
+
+
+def get_reporter():
+    global _reporter
+    with _reporter_lock:
+        if _reporter is None:
+            _reporter = ErrorReporter(
+                config.ERROR_LOG,
+                window=config.ERROR_DEDUP_WINDOW,
+                max_bytes=config.ERROR_LOG_MAX_BYTES,
+                backups=config.ERROR_LOG_BACKUPS,
+                sample_rate=config.ERROR_SAMPLE_RATE,
+            )
+            # ✅ Pending repeat counts are written when the bot stops
+            atexit.register(_reporter.close)
+        return _reporter
+
 
 # ✅ Для message и callback_query
 def safe_handler(func):
@@ -19,22 +150,12 @@ def safe_handler(func):
             else:
                 chat_id = "unknown"
 
-            # ✅ Готовим и логируем ошибку
-            error_message = f"❌ Ошибка в обработчике {func.__name__}: {e}\n{traceback.format_exc()}"
-            print(error_message)
-            with open("logs/errors.log", "a", encoding="utf-8") as log_file:
-                log_file.write(f"{datetime.now()} - {error_message}\n")
+            # ✅ Логируем ошибку (запись в файл и аналитика — в фоне)
+            get_reporter().report(func.__name__, e, chat_id, context="обработчике")
 
             # ✅ Сообщаем пользователю
             if chat_id != "unknown":
                 bot.send_message(chat_id, "⚠️ Произошла ошибка, но вы можете продолжить игру. Попробуйте снова.")
-
-            # ✅ Логируем в аналитику
-            log_event(chat_id, "error_occurred", {
-                "function": func.__name__,
-                "error": str(e),
-                "traceback": traceback.format_exc()[:1000]  # ограничение по размеру
-            })
     return wrapper
 
 
@@ -45,13 +166,5 @@ def safe_function(func):
         try:
             return func(*args, **kwargs)
         except Exception as e:
-            error_message = f"❌ Ошибка в функции {func.__name__}: {e}\n{traceback.format_exc()}"
-            print(error_message)
-            with open("logs/errors.log", "a", encoding="utf-8") as log_file:
-                log_file.write(f"{datetime.now()} - {error_message}\n")
-            log_event("system", "error_occurred", {
-                "function": func.__name__,
-                "error": str(e),
-                "traceback": traceback.format_exc()[:1000]  # ограничение по размеру
-            })
+            get_reporter().report(func.__name__, e)
     return wrapper
@@ -0,0 +1,285 @@
+import ast
+import builtins
+import logging
+import operator
+import random
+import re
+from functools import lru_cache
+from config import config
+from utils.actions import compile_action, ASSIGN, IF, BTN, XBTN
+
+logger = logging.getLogger(__name__)
+
+# ✅ Expression compiler
+#
+# Conditions ("m2 > mbo1 or m2 = mbo1", "меч and волшебный меч", ...) and assignment
+# right-hand sides ("rnd12 +m1", "v1 -2", ...) from chapters.json are translated once
+# into a tree of closures and cached by their text, so showing a chapter no longer
+# runs regex passes and eval() for every `if`/`assign` action.
+
+LOGICAL_OPERATORS = {"and", "or", "not"}
+COMPARISON_OPERATORS = (">", "<", ">=", "<=", "==", "!=")
+
+_LOGICAL_SPLIT = re.compile(r'(\band\b|\bor\b|\bnot\b)')
+_SINGLE_EQUALS = re.compile(r'(?<!<|>|!)=(?!=)')
+_IDENTIFIER = re.compile(r'\b([A-Za-z_][A-Za-z0-9_]*)\b')
+_KEPT_NAMES = LOGICAL_OPERATORS | {"in", "state", "inventory"}
+_RANDOM = re.compile(r'rnd(\d+)')
+
+_UNARY = {
+    ast.Not: operator.not_,
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+    ast.Invert: operator.invert,
+}
+
+_BINARY = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+
+_COMPARE = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Is: operator.is_,
+    ast.IsNot: operator.is_not,
+    ast.In: lambda left, right: left in right,
+    ast.NotIn: lambda left, right: left not in right,
+}
+
+
+class _Unsupported(Exception):
+    """Raised when an expression uses syntax the closure builder doesn't cover."""
+
+
+# ✅ Name resolvers (state -> value)
+def _variable(name):
+    # Same lookup order as helpers.replace_variables: characteristic, then inventory item
+    key = name.lower()
+
+    def resolve(state):
+        characteristics = state["characteristics"]
+        if key in characteristics:
+            return characteristics[key].get("value", 0)
+        return any(item.lower() == key for item in state["inventory"])
+    return resolve
+
+
+def _item(name):
+    return lambda state: name in state["inventory"]
+
+
+def _local(name):
+    # Names the regex doesn't touch (e.g. cyrillic) are read straight from characteristics
+    def resolve(state):
+        characteristic = state["characteristics"].get(name)
+        if characteristic is not None:
+            return characteristic["value"]
+        try:
+            return getattr(builtins, name)
+        except AttributeError:
+            raise NameError(name) from None
+    return resolve
+
+
+def _random(limit):
+    return lambda state: random.randint(1, limit)
+
+
+def _constant(value):
+    return lambda state: value
+
+
+def _build(node, names):
+    if isinstance(node, ast.Expression):
+        return _build(node.body, names)
+
+    if isinstance(node, ast.Constant):
+        return _constant(node.value)
+
+    if isinstance(node, ast.Name):
+        return names.get(node.id) or _local(node.id)
+
+    if isinstance(node, ast.BoolOp):
+        operands = [_build(value, names) for value in node.values]
+        if isinstance(node.op, ast.And):
+            def evaluate(state):
+                for operand in operands:
+                    result = operand(state)
+                    if not result:
+                        return result
+                return result
+        else:
+            def evaluate(state):
+                for operand in operands:
+                    result = operand(state)
+                    if result:
+                        return result
+                return result
+        return evaluate
+
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY:
+        op = _UNARY[type(node.op)]
+        operand = _build(node.operand, names)
+        return lambda state: op(operand(state))
+
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+        op = _BINARY[type(node.op)]
+        left = _build(node.left, names)
+        right = _build(node.right, names)
+        return lambda state: op(left(state), right(state))
+
+    if isinstance(node, ast.Compare) and all(type(op) in _COMPARE for op in node.ops):
+        left = _build(node.left, names)
+        ops = [_COMPARE[type(op)] for op in node.ops]
+        comparators = [_build(comparator, names) for comparator in node.comparators]
+
+        if len(ops) == 1:
+            op, right = ops[0], comparators[0]
+            return lambda state: op(left(state), right(state))
+
+        def evaluate(state):
+            current = left(state)
+            for op, comparator in zip(ops, comparators):
+                following = comparator(state)
+                if not op(current, following):
+                    return False
+                current = following
+            return True
+        return evaluate
+
+    raise _Unsupported(type(node).__name__)
+
+
+def _fallback(tree, names):
+    # Rare syntax: keep the compiled code object and eval it with the resolved names
+    code = compile(tree, "<expression>", "eval")
+
+    def evaluate(state):
+        local_vars = {k: v["value"] for k, v in state["characteristics"].items()}
+        for placeholder, resolve in names.items():
+            local_vars[placeholder] = resolve(state)
+        return eval(code, {}, local_vars)
+    return evaluate
+
+
+def _always_false(state):
+    return False
+
+
+def _translate_condition(condition):
+    """Turn a URQ condition into python source with placeholders for variables and items."""
+    condition = condition.replace("=>", ">=").replace("=<", "<=")
+    condition = _SINGLE_EQUALS.sub("==", condition)
+
+    names = {"state": lambda state: state}
+    placeholders = {}
+
+    def placeholder(kind, name, factory):
+        key = (kind, name)
+        if key not in placeholders:
+            placeholders[key] = f"__{kind}{len(placeholders)}"
+            names[placeholders[key]] = factory(name)
+        return placeholders[key]
+
+    def substitute(match):
+        name = match.group(1)
+        if name in _KEPT_NAMES:
+            return name
+        return placeholder("var", name, _variable)
+
+    parts = [part.strip() for part in _LOGICAL_SPLIT.split(condition) if part.strip()]
+    source = []
+    for part in parts:
+        if part in LOGICAL_OPERATORS:
+            source.append(part)
+        elif any(op in part for op in COMPARISON_OPERATORS):
+            source.append(f"({_IDENTIFIER.sub(substitute, part)})")
+        else:
+            # Anything else is an inventory item name
+            source.append(placeholder("item", part, _item))
+
+    return " ".join(source), names
+
+
+@lru_cache(maxsize=config.EXPRESSION_CACHE_SIZE)
+def compile_condition(condition):
+    """Compile a chapter condition into `evaluate(state)`; cached by the condition text."""
+    source, names = _translate_condition(condition)
+    try:
+        tree = ast.parse(source, mode="eval")
+    except SyntaxError as e:
+        logger.error("❌ Invalid condition '%s': %s", condition, e)
+        return _always_false
+
+    try:
+        evaluator = _build(tree, names)
+    except _Unsupported:
+        evaluator = _fallback(tree, names)
+
+    def evaluate(state):
+        try:
+            return evaluator(state)
+        except Exception as e:
+            logger.warning("❌ Error in condition '%s': %s", condition, e)
+            return False
+    return evaluate
+
+
+def _raise_invalid(error):
+    def evaluate(state):
+        raise ValueError(error)
+    return evaluate
+
+
+@lru_cache(maxsize=config.EXPRESSION_CACHE_SIZE)
+def compile_expression(expression):
+    """Compile an assignment right-hand side into `evaluate(state)`; errors are raised to the caller."""
+    if expression.isdigit():
+        return _constant(int(expression))
+
+    # ✅ Every rndN becomes its own node, drawn when the expression is evaluated
+    names = {}
+
+    def substitute(match):
+        placeholder = f"__rnd{len(names)}"
+        names[placeholder] = _random(int(match.group(1)))
+        return placeholder
+
+    source = _RANDOM.sub(substitute, expression)
+    try:
+        tree = ast.parse(source.strip(), mode="eval")
+    except SyntaxError as e:
+        return _raise_invalid(f"Invalid expression '{expression}': {e}")
+
+    try:
+        return _build(tree, names)
+    except _Unsupported:
+        return _fallback(tree, names)
+
+
+# ✅ Compile every expression of the quest up front (called once at startup)
+def precompile_expressions(chapters):
+    def walk(actions):
+        for action in actions or ():
+            action = compile_action(action)
+            if action[0] == ASSIGN:
+                compile_expression(action[2])
+            elif action[0] == IF:
+                compile_condition(action[1])
+                walk(action[2])
+                walk(action[3])
+            elif action[0] in (BTN, XBTN):
+                walk(action[3])
+
+    for actions in chapters.values():
+        walk(actions)
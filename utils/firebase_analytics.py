@@ -1,32 +1,161 @@
 from config import config
+from collections import deque
+import atexit
+import logging
+import threading
 import requests
 import time
 
+logger = logging.getLogger(__name__)
+
+# ✅ Background analytics
+#
+# log_event only puts the event into a bounded in-memory queue; a daemon thread sends
+# the queue to the GA4 Measurement Protocol in batches (up to 25 events of one client per
+# request) over a keep-alive session, with timeouts and retries with backoff. When the
+# queue is full the oldest events are dropped, and whatever is left is sent on shutdown.
+
+MAX_BATCH_EVENTS = 25  # limit of the Measurement Protocol
+
+
+class AnalyticsSender:
+    def __init__(self, url, queue_size=10000, batch_size=MAX_BATCH_EVENTS, flush_interval=1.0,
+                 timeout=5.0, retries=3, backoff=0.5, session=None):
+        self.url = url
+        self.batch_size = min(batch_size, MAX_BATCH_EVENTS)
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = session or requests.Session()
+
+        self.queue = deque(maxlen=queue_size)
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.closed = False
+        self.stats = {"queued": 0, "sent": 0, "dropped": 0, "failed": 0, "requests": 0, "retries": 0}
+
+        self.thread = threading.Thread(target=self._run, name="analytics-sender", daemon=True)
+        self.thread.start()
+
+    def log(self, client_id, name, params=None):
+        event = {"name": name, "params": params or {}, "timestamp_micros": int(time.time() * 1_000_000)}
+        with self.condition:
+            if self.closed:
+                self.stats["dropped"] += 1
+                return
+            if len(self.queue) == self.queue.maxlen:
+                self.stats["dropped"] += 1  # deque drops the oldest event
+            self.queue.append((str(client_id), event))
+            self.stats["queued"] += 1
+            if len(self.queue) >= self.batch_size:
+                self.condition.notify()
+
+    def _take_batches(self):
+        # Everything queued so far, grouped by client, in batches of batch_size events
+        by_client = {}
+        while self.queue:
+            client_id, event = self.queue.popleft()
+            by_client.setdefault(client_id, []).append(event)
+        return [
+            (client_id, events[i:i + self.batch_size])
+            for client_id, events in by_client.items()
+            for i in range(0, len(events), self.batch_size)
+        ]
+
+    def _run(self):
+        while True:
+            with self.condition:
+                if not self.queue and not self.closed:
+                    self.condition.wait(self.flush_interval)
+                if not self.queue:
+                    if self.closed:
+                        return
+                    continue
+                batches = self._take_batches()
+                self.in_flight += 1
+            try:
+                for client_id, events in batches:
+                    try:
+                        self._post(client_id, events)
+                    except Exception as e:
+                        # ✅ A bad event or response drops its batch, never the sender thread
+                        self.stats["failed"] += len(events)
+                        logger.error("❌ Ошибка отправки аналитики (%s событий): %s", len(events), e, exc_info=True)
+            finally:
+                with self.condition:
+                    self.in_flight -= 1
+                    self.condition.notify_all()
+
+    def _post(self, client_id, events):
+        payload = {"client_id": client_id, "events": events}
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.stats["retries"] += 1
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                self.stats["requests"] += 1
+                response = self.session.post(self.url, json=payload, timeout=self.timeout)
+                if response.status_code < 500 and response.status_code != 429:
+                    response.raise_for_status()  # other 4xx: retrying won't help
+                    self.stats["sent"] += len(events)
+                    return
+            except requests.HTTPError as e:
+                logger.error("❌ Ошибка отправки аналитики (%s событий): %s", len(events), e)
+                break
+            except requests.RequestException as e:
+                logger.warning("⚠️ Аналитика недоступна (попытка %s): %s", attempt + 1, e)
+        self.stats["failed"] += len(events)
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far is sent (or given up). False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            self.condition.notify_all()
+            while self.queue or self.in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+    def close(self, timeout=None):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join(timeout)
+        self.session.close()
+
+
+_sender = None
+_sender_lock = threading.Lock()
+
+
+def get_sender():
+    global _sender
+    with _sender_lock:
+        if _sender is None:
+            url = f"{config.ANALYTICS_URL}?measurement_id={config.MEASUREMENT_ID}&api_secret={config.API_SECRET}"
+            _sender = AnalyticsSender(
+                url,
+                queue_size=config.ANALYTICS_QUEUE_SIZE,
+                batch_size=config.ANALYTICS_BATCH_SIZE,
+                timeout=config.ANALYTICS_TIMEOUT,
+                retries=config.ANALYTICS_RETRIES,
+            )
+            # ✅ Send what's left when the bot stops
+            atexit.register(_sender.close, config.ANALYTICS_TIMEOUT * 2)
+        return _sender
+
+
+def queue_depth():
+    """Events waiting to be sent (0 before the first event)."""
+    return len(_sender.queue) if _sender is not None else 0
+
+
 # ✅ Функция отправки события
 def log_event(user_id: int, event_name: str, params: dict = None):
-    """Отправить кастомное событие в Firebase Analytics (GA4) через Measurement Protocol"""
-    if params is None:
-        params = {
-        }
-
-    # URL для Measurement Protocol
-    url = f"https://www.google-analytics.com/mp/collect?measurement_id={config.MEASUREMENT_ID}&api_secret={config.API_SECRET}"
-
-    # Тело запроса
-    payload = {
-        "client_id": str(user_id),  # Используем user_id как client_id (можно добавить session_id)
-        "timestamp_micros": int(time.time() * 1_000_000),  # Текущее время в микросекундах
-        "events": [
-            {
-                "name": event_name,
-                "params": params
-            }
-        ]
-    }
-
-    try:
-        response = requests.post(url, json=payload)
-        response.raise_for_status()  # Проверить статус ответа
-        print(f"✅ Событие '{event_name}' отправлено для пользователя {user_id}")
-    except requests.RequestException as e:
-        print(f"❌ Ошибка отправки события '{event_name}': {e}")
+    """Поставить кастомное событие в очередь отправки в Firebase Analytics (GA4)"""
+    if not config.MEASUREMENT_ID or not config.API_SECRET:
+        return  # аналитика не настроена
+    get_sender().log(user_id, event_name, params)
@@ -0,0 +1,165 @@
+from collections.abc import Mapping
+from utils.actions import compile_actions, actions_to_dicts, ActionRef
+
+# ✅ Quest linker
+#
+# Every chapter gets a dense integer ID (its position in chapters.json) and btn/xbtn/goto
+# targets are rewritten to those IDs, so the chapters live in a list indexed by ID and
+# player state holds small ints instead of chapter names. Targets that aren't chapters
+# ("return", typos in the quest) stay strings and are reported as dangling.
+#
+# Saves keep chapter keys (IDs change whenever the quest is rebuilt): see state_to_keys
+# and state_to_ids, used by utils/state_manager.py.
+
+SPECIAL_TARGETS = {"return"}
+
+
+class LinkedQuest(Mapping):
+    """Chapters indexed by ID; also readable by chapter key, iterates over keys in ID order."""
+
+    def __init__(self, keys, chapters, dangling=()):
+        self.keys_by_id = list(keys)
+        self.ids = {key: chapter_id for chapter_id, key in enumerate(self.keys_by_id)}
+        self.chapters = chapters  # list, or any sequence indexed by ID (lazy ChapterStore)
+        self.dangling = list(dangling)
+        self.lazy = not isinstance(chapters, list)
+
+    def __getitem__(self, chapter):
+        if chapter.__class__ is int:
+            if 0 <= chapter < len(self.keys_by_id):
+                return self.chapters[chapter]
+            raise KeyError(chapter)
+        return self.chapters[self.ids[chapter]]
+
+    def __contains__(self, chapter):
+        if chapter.__class__ is int:
+            return 0 <= chapter < len(self.keys_by_id)
+        return chapter in self.ids
+
+    def __iter__(self):
+        return iter(self.keys_by_id)
+
+    def __len__(self):
+        return len(self.keys_by_id)
+
+    def id_of(self, chapter):
+        """ID of a chapter given by key or ID; anything unknown is returned as is."""
+        if chapter.__class__ is int:
+            return chapter
+        return self.ids.get(chapter, chapter)
+
+    def key_of(self, chapter):
+        if chapter.__class__ is int and 0 <= chapter < len(self.keys_by_id):
+            return self.keys_by_id[chapter]
+        return chapter
+
+
+def _rewrite(actions, target):
+    """Copy of actions with every btn/xbtn/goto target passed through target()."""
+    rewritten = []
+    for action in actions:
+        action_type, value = action["type"], action["value"]
+        if action_type == "goto":
+            value = target(value)
+        elif action_type in ("btn", "xbtn") and isinstance(value, dict):
+            value = dict(value, target=target(value["target"]))
+            if "actions" in value:
+                value["actions"] = _rewrite(value["actions"], target)
+        elif action_type == "if" and isinstance(value, dict):
+            value = dict(value, actions=_rewrite(value["actions"], target))
+            if "else_actions" in value:
+                value["else_actions"] = _rewrite(value["else_actions"], target)
+        else:
+            rewritten.append(action)
+            continue
+        rewritten.append({"type": action_type, "value": value})
+    return rewritten
+
+
+def link_actions(actions, ids, dangling=None, chapter=None):
+    def target(value):
+        if value in ids:
+            return ids[value]
+        if dangling is not None and value not in SPECIAL_TARGETS:
+            dangling.append((chapter, value))
+        return value
+    return _rewrite(actions, target)
+
+
+def unlink_actions(actions, keys):
+    return _rewrite(actions, lambda value: keys[value] if value.__class__ is int else value)
+
+
+def link_chapters(chapters, transform=None):
+    """Link a chapters dict (as in chapters.json) into a LinkedQuest.
+
+    transform (e.g. compile_actions) is applied to every linked chapter.
+    """
+    if isinstance(chapters, LinkedQuest):
+        return chapters
+    keys = list(chapters)
+    ids = {key: chapter_id for chapter_id, key in enumerate(keys)}
+    dangling = []
+    linked = [link_actions(chapters[key], ids, dangling, key) for key in keys]
+    if transform is not None:
+        linked = [transform(actions) for actions in linked]
+    return LinkedQuest(keys, linked, dangling)
+
+
+def find_dangling(chapters):
+    """[(chapter, target), ...] for targets that don't name a chapter."""
+    return link_chapters(chapters).dangling
+
+
+# ✅ Helpers that work with a LinkedQuest as well as a plain chapters dict
+def resolve_chapter(chapters, chapter):
+    return chapters.id_of(chapter) if isinstance(chapters, LinkedQuest) else chapter
+
+
+def chapter_name(chapters, chapter):
+    return chapters.key_of(chapter) if isinstance(chapters, LinkedQuest) else chapter
+
+
+def _convert_option(target, chapter, actions, ref):
+    if isinstance(target, ActionRef):
+        return ref(chapter(target.chapter), target.index)
+    if isinstance(target, dict):  # ActionRef in a save file
+        return ref(chapter(target["chapter"]), target["index"])
+    if isinstance(target, (list, tuple)):
+        return actions(target)
+    return chapter(target)
+
+
+def _convert_state(state, chapter, actions, ref):
+    state = dict(state)
+    if "chapter" in state:
+        state["chapter"] = chapter(state["chapter"])
+    if "history" in state:
+        state["history"] = [chapter(entry) for entry in state["history"]]
+    if "options" in state:
+        state["options"] = {
+            text: _convert_option(target, chapter, actions, ref)
+            for text, target in state["options"].items()
+        }
+    return state
+
+
+def _saved_ref(chapter, index):
+    return {"chapter": chapter, "index": index}
+
+
+def state_to_keys(state, chapters):
+    """Copy of state for a save file: chapter keys instead of IDs, dict actions, history as a list."""
+    if not isinstance(chapters, LinkedQuest):
+        return _convert_state(state, lambda chapter: chapter, actions_to_dicts, _saved_ref)
+    return _convert_state(state, chapters.key_of,
+                          lambda actions: unlink_actions(actions_to_dicts(actions), chapters.keys_by_id),
+                          _saved_ref)
+
+
+def state_to_ids(state, chapters):
+    """Copy of a saved state with chapter IDs and compiled actions (history becomes a list)."""
+    if not isinstance(chapters, LinkedQuest):
+        return _convert_state(state, lambda chapter: chapter, compile_actions, ActionRef)
+    return _convert_state(state, chapters.id_of,
+                          lambda actions: compile_actions(link_actions(actions, chapters.ids)), ActionRef)
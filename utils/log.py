@@ -0,0 +1,84 @@
+import atexit
+import copy
+import logging
+import logging.handlers
+import queue
+import sys
+
+# ✅ Logging
+#
+# Modules log to logging.getLogger(__name__) with %-style arguments, so a message is
+# formatted only if its level is on. LOG_LEVEL is INFO in production (the action loop logs
+# at DEBUG: nothing of it is formatted) and DEBUG otherwise; LOG_LEVELS sets levels per
+# module, e.g. "handlers.game_handler=DEBUG,utils.send_queue=WARNING".
+# Handlers only put records into a bounded queue; a background thread formats and writes
+# them to stdout, so a slow log pipe never blocks players. If the queue is full, records
+# are dropped and counted in stats["dropped"].
+
+FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+
+stats = {"dropped": 0}
+_listener = None
+
+
+class StdoutHandler(logging.StreamHandler):
+    """Writes to the current sys.stdout (it may be redirected after setup)."""
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # ✅ Only the message is merged here (its arguments may change after the call);
+        # the timestamp, the format and tracebacks are done by the writer thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            stats["dropped"] += 1
+
+
+def parse_levels(text):
+    """"module=LEVEL,..." -> {module: LEVEL}"""
+    levels = {}
+    for item in filter(None, (part.strip() for part in (text or "").split(","))):
+        name, _, level = item.partition("=")
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup(level="INFO", levels="", queue_size=10000):
+    global _listener
+    if _listener is not None:
+        return
+    handler = StdoutHandler()
+    handler.setFormatter(logging.Formatter(FORMAT))
+    records = queue.Queue(queue_size)
+    _listener = logging.handlers.QueueListener(records, handler)
+    _listener.start()
+    atexit.register(stop)
+
+    root = logging.getLogger()
+    root.handlers[:] = [DroppingQueueHandler(records)]
+    root.setLevel(level.upper())
+    for name, module_level in parse_levels(levels).items():
+        logging.getLogger(name).setLevel(module_level)
+
+
+def stop():
+    """Write out the queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import Future
+from telebot.apihelper import ApiTelegramException
+from config import bot, config
+
+logger = logging.getLogger(__name__)
+
+# ✅ Telegram file_id cache for images
+#
+# The first time an image is sent its bytes are uploaded and Telegram returns a file_id;
+# later sends of the same file reuse that id, so nothing is read from disk or uploaded.
+# Entries are kept in MEDIA_CACHE_FILE as {path: {"file_id", "mtime", "size", "sha1"}}.
+# An entry is checked against the file on every send: when mtime/size differ the file is
+# hashed again and the file_id is dropped if the content changed. A file_id Telegram rejects
+# as such (FILE_ID_ERRORS) is dropped and the file uploaded again; other errors (blocked bot,
+# flood limit) are raised as they are.
+
+# Descriptions of the errors that mean the cached file_id itself is unusable (lower case)
+FILE_ID_ERRORS = ("wrong file identifier", "wrong remote file identifier", "file reference expired",
+                  "wrong file_id", "file_id_invalid", "file is temporarily unavailable")
+
+_lock = threading.Lock()
+_entries = None  # loaded on first use
+
+# Set by utils/async_engine.py: (chat_id, path) -> True if the send was recorded, to be made
+# off the event loop (send_photo then does no file I/O itself)
+recorder = None
+
+# uploads / file_id reuses and the bytes each of them took or avoided
+stats = {"uploads": 0, "reused": 0, "bytes_uploaded": 0, "bytes_saved": 0}
+
+
+def _load():
+    global _entries
+    if _entries is None:
+        try:
+            with open(config.MEDIA_CACHE_FILE, "r", encoding="utf-8") as file:
+                _entries = json.load(file)
+        except (OSError, ValueError):
+            _entries = {}
+    return _entries
+
+
+def _save():
+    # Write to a temporary file first so a crash never leaves a half-written cache
+    temp_path = f"{config.MEDIA_CACHE_FILE}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(_entries, file, ensure_ascii=False, indent=4)
+    os.replace(temp_path, config.MEDIA_CACHE_FILE)
+
+
+def file_hash(path):
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 16), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def cached_file_id(path):
+    """file_id of an earlier upload of path, None if there was none or the file changed."""
+    with _lock:
+        entries = _load()
+        entry = entries.get(path)
+        if entry is None:
+            return None
+
+        stat = os.stat(path)
+        if entry["mtime"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+            return entry["file_id"]
+
+        # ✅ Touched file: keep the file_id only if the content is the same
+        if file_hash(path) == entry["sha1"]:
+            entry["mtime"], entry["size"] = stat.st_mtime_ns, stat.st_size
+            _save()
+            return entry["file_id"]
+        del entries[path]
+        _save()
+        return None
+
+
+def remember(path, file_id):
+    stat = os.stat(path)
+    with _lock:
+        _load()[path] = {"file_id": file_id, "mtime": stat.st_mtime_ns, "size": stat.st_size, "sha1": file_hash(path)}
+        _save()
+
+
+def forget(path):
+    with _lock:
+        if _load().pop(path, None) is not None:
+            _save()
+
+
+def send_photo(chat_id, path):
+    """Sent Message, or its Future when sends are queued (utils/send_queue.py)."""
+    if recorder is not None and recorder(chat_id, path):
+        return None
+    file_id = cached_file_id(path)
+    if file_id is None:
+        return _upload(chat_id, path)
+    try:
+        message = bot.send_photo(chat_id, file_id)
+    except ApiTelegramException as e:
+        if not bad_file_id(e):
+            raise  # blocked bot, flood limit...: uploading again won't help
+        return _rejected(chat_id, path, e)
+    if isinstance(message, Future):  # checked once it is sent, without waiting here
+        message.add_done_callback(lambda sent: _reused(chat_id, path, sent.exception()))
+    else:
+        _reused(chat_id, path)
+    return message
+
+
+def bad_file_id(error):
+    """True for an API error (TeleBot or AsyncTeleBot) saying the cached file_id is unusable."""
+    description = str(getattr(error, "description", "") or "").lower()
+    return getattr(error, "error_code", None) == 400 and any(text in description for text in FILE_ID_ERRORS)
+
+
+def _reused(chat_id, path, error=None):
+    if bad_file_id(error):
+        _rejected(chat_id, path, error)
+    elif error is None:  # other errors went to the send queue's error reporter
+        count_reused(path)
+
+
+def count_reused(path):
+    stats["reused"] += 1
+    stats["bytes_saved"] += os.path.getsize(path)
+
+
+def count_upload(path):
+    stats["uploads"] += 1
+    stats["bytes_uploaded"] += os.path.getsize(path)
+
+
+def _rejected(chat_id, path, error):
+    # file_id no longer valid for this bot: upload again
+    logger.warning("⚠️ Cached file_id for %s rejected: %s", path, error)
+    forget(path)
+    return _upload(chat_id, path)
+
+
+def _upload(chat_id, path):
+    with open(path, "rb") as photo:
+        message = bot.send_photo(chat_id, photo)
+    count_upload(path)
+    if isinstance(message, Future):
+        message.add_done_callback(lambda sent: sent.exception() or _remember_sent(path, sent.result()))
+    else:
+        _remember_sent(path, message)
+    return message
+
+
+def _remember_sent(path, message):
+    # ✅ The largest size is the original upload
+    photos = getattr(message, "photo", None)
+    if photos and isinstance(photos[-1].file_id, str):
+        remember(path, photos[-1].file_id)
@@ -0,0 +1,74 @@
+from contextlib import contextmanager
+import telebot.types as types
+from telebot.util import smart_split
+from config import bot
+
+# ✅ Outgoing text buffer for a chapter render
+#
+# While a chapter is rendered (send_chapter, including chapters reached with goto) text
+# actions are collected instead of being sent one by one. Adjacent texts are merged into
+# messages of up to 4096 characters, the inline keyboard goes on the last one, and the
+# buffer is flushed early only before an image so the order of messages is kept.
+
+MESSAGE_LIMIT = 4096
+SEPARATOR = "\n\n"
+
+_buffers = {}  # chat_id -> {"depth": nested renders, "texts": [...]}
+
+# Telegram API calls avoided by merging (texts + keyboard messages - messages actually sent)
+stats = {"texts": 0, "messages": 0, "saved": 0}
+
+
+@contextmanager
+def buffered(chat_id):
+    buffer = _buffers.setdefault(chat_id, {"depth": 0, "texts": []})
+    buffer["depth"] += 1
+    try:
+        yield
+    finally:
+        buffer["depth"] -= 1
+        if buffer["depth"] == 0:
+            flush(chat_id)
+            del _buffers[chat_id]
+
+
+def send_text(chat_id, text):
+    buffer = _buffers.get(chat_id)
+    if buffer is None:
+        bot.send_message(chat_id, text, reply_markup=types.ReplyKeyboardRemove())
+        return
+    if text.strip():
+        buffer["texts"].append(text)
+        stats["texts"] += 1
+
+
+def merge_texts(texts, limit=MESSAGE_LIMIT):
+    messages = []
+    for text in texts:
+        for part in (smart_split(text, limit) if len(text) > limit else [text]):
+            if messages and len(messages[-1]) + len(SEPARATOR) + len(part) <= limit:
+                messages[-1] += SEPARATOR + part
+            else:
+                messages.append(part)
+    return messages
+
+
+def flush(chat_id, reply_markup=None, footer=""):
+    """Send the buffered texts; reply_markup (and footer) go on the last one.
+
+    Returns False when nothing was buffered, so the caller sends its own message.
+    """
+    buffer = _buffers.get(chat_id)
+    if not buffer or not buffer["texts"]:
+        return False
+
+    texts, buffer["texts"] = buffer["texts"], []
+    messages = merge_texts(texts + [footer] if footer else texts)
+
+    for message in messages[:-1]:
+        bot.send_message(chat_id, message, reply_markup=types.ReplyKeyboardRemove())
+    bot.send_message(chat_id, messages[-1], reply_markup=reply_markup or types.ReplyKeyboardRemove())
+
+    stats["messages"] += len(messages)
+    stats["saved"] += len(texts) + (1 if reply_markup else 0) - len(messages)
+    return True
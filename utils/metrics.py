@@ -0,0 +1,250 @@
+import logging
+import threading
+from bisect import bisect_right
+from collections import deque
+from functools import wraps
+from math import fsum
+from time import perf_counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import telebot.apihelper as apihelper
+import telebot.asyncio_helper as asyncio_helper
+from config import config
+from utils import firebase_analytics, message_buffer
+from utils.linker import chapter_name
+from utils.state_manager import state_cache
+
+logger = logging.getLogger(__name__)
+
+# ✅ Metrics
+#
+# Latency histograms of the bot handlers, of send_chapter per chapter and of Telegram API
+# calls (their _count is the number of calls), plus gauges (and the API calls saved by
+# utils/message_buffer.py) read when the metrics are scraped. render() gives the Prometheus text format: served on 127.0.0.1:METRICS_PORT
+# (/metrics) and sent to ADMIN_IDS by the /metrics command (handlers/admin_handler.py).
+# An observation is only appended to a queue; it is put into its bucket when scraped.
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+enabled = True  # send_chapter skips its timing when off
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Histogram:
+    def __init__(self, name, help_text, label, buckets=BUCKETS, label_format=str, max_pending=1000):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+        self.label_format = label_format  # label value -> text (e.g. chapter ID -> key), when rendered
+        self.series = {}  # label value -> [count per bucket..., count above the last, sum]
+        self.pending = {}  # label value -> deque of the times not counted yet
+        self.max_pending = max_pending  # per label value
+        self.lock = threading.Lock()
+
+    def queue(self, value):
+        times = self.pending.get(value)
+        if times is None:
+            times = self.pending.setdefault(value, deque())
+        return times
+
+    def observe(self, value, seconds):
+        # ✅ Only an append on the hot path; counted when scraped (or when too many are pending)
+        times = self.pending.get(value)
+        if times is None:
+            times = self.queue(value)
+        times.append(seconds)
+        if len(times) >= self.max_pending:
+            self.aggregate()
+
+    def observer(self):
+        """observe() with its lookups done once, for hot paths (send_chapter, the API wrapper)."""
+        pending, queue, limit, aggregate = self.pending, self.queue, self.max_pending, self.aggregate
+
+        def observe(value, seconds):
+            times = pending.get(value)
+            if times is None:
+                times = queue(value)
+            times.append(seconds)
+            if len(times) >= limit:
+                aggregate()
+        return observe
+
+    def aggregate(self):
+        size = len(self.buckets) + 1
+        with self.lock:
+            for value, queue in list(self.pending.items()):
+                # popleft is atomic: times appended meanwhile stay queued
+                times = sorted([queue.popleft() for _ in range(len(queue))])
+                if not times:
+                    continue
+                series = self.series.get(value)
+                if series is None:
+                    series = self.series[value] = [0] * size + [0.0]
+                # Sorted times are cut into the buckets by bisection (le: up to the bound)
+                previous = 0
+                for index, bound in enumerate(self.buckets):
+                    below = bisect_right(times, bound, previous)
+                    series[index] += below - previous
+                    previous = below
+                series[size - 1] += len(times) - previous
+                series[-1] += fsum(times)
+
+    def time(self, value, func, one_arg=False):
+        """func wrapped to observe its duration under value (one_arg: func is called with one argument)."""
+        times = self.queue(value)
+        append = times.append
+        limit = self.max_pending
+
+        if one_arg:
+            # ✅ A bot handler gets the update only: passing *args / **kwargs through costs more than the timing
+            def timed(arg):
+                start = perf_counter()
+                try:
+                    return func(arg)
+                finally:
+                    append(perf_counter() - start)  # observe(), inlined
+                    if len(times) >= limit:
+                        self.aggregate()
+        else:
+            def timed(*args, **kwargs):
+                start = perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    append(perf_counter() - start)
+                    if len(times) >= limit:
+                        self.aggregate()
+        return wraps(func)(timed)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        self.aggregate()
+        with self.lock:
+            series = {value: list(counts) for value, counts in self.series.items()}
+        for value, counts in sorted(series.items(), key=lambda item: str(item[0])):
+            label = f'{self.label}="{_escape(self.label_format(value))}"'
+            total = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                total += count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {total}')
+            lines.append(f"{self.name}_sum{{{label}}} {counts[-1]:.6f}")
+            lines.append(f"{self.name}_count{{{label}}} {total}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, help_text, read, kind="gauge"):
+        self.name = name
+        self.help_text = help_text
+        self.read = read  # called when scraped
+        self.kind = kind  # "counter" for a total that only grows
+
+    def render(self):
+        try:
+            value = self.read()
+        except Exception as e:
+            logger.warning("⚠️ Cannot read %s: %s", self.name, e)
+            return []
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}", f"{self.name} {value}"]
+
+
+handler_seconds = Histogram("questbot_handler_seconds", "Time spent in bot handlers", "handler")
+chapter_seconds = Histogram("questbot_send_chapter_seconds", "send_chapter render time per chapter", "chapter",
+                            label_format=lambda chapter: chapter_name(config.chapters, chapter))
+api_seconds = Histogram("questbot_telegram_api_seconds", "Telegram Bot API calls and their latency", "method")
+observe_chapter = chapter_seconds.observer()
+metrics = [
+    handler_seconds, chapter_seconds, api_seconds,
+    Gauge("questbot_sessions", "Player sessions in memory (state cache)", lambda: len(state_cache)),
+    Gauge("questbot_analytics_queue", "Analytics events waiting to be sent", firebase_analytics.queue_depth),
+    Gauge("questbot_api_calls_saved_total", "Telegram API calls saved by merging chapter texts",
+          lambda: message_buffer.stats["saved"], kind="counter"),
+]
+
+
+def render():
+    lines = []
+    for metric in metrics:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+def instrument_handlers(bot):
+    """Time every registered message / callback handler of bot (after all of them are registered)."""
+    for handlers in (bot.message_handlers, bot.callback_query_handlers):
+        for handler in handlers:
+            function = handler["function"]
+            if not getattr(function, "_timed", False):
+                # TeleBot calls a handler with the update alone, unless it takes the bot or middleware data
+                one_arg = not handler.get("pass_bot") and not bot.use_class_middlewares
+                handler["function"] = handler_seconds.time(function.__name__, function, one_arg)
+                handler["function"]._timed = True
+
+
+def instrument_api():
+    """Time the Bot API requests of TeleBot and AsyncTeleBot."""
+    if getattr(apihelper._make_request, "_timed", False):
+        return
+    make_request = apihelper._make_request
+    observe = api_seconds.observer()
+
+    # The signature of apihelper._make_request: passing *args / **kwargs through costs more than the timing
+    def timed_request(token, method_name, method='get', params=None, files=None):
+        start = perf_counter()
+        try:
+            return make_request(token, method_name, method, params, files)
+        finally:
+            observe(method_name, perf_counter() - start)
+
+    process_request = asyncio_helper._process_request
+
+    async def timed_process_request(token, url, *args, **kwargs):
+        start = perf_counter()
+        try:
+            return await process_request(token, url, *args, **kwargs)
+        finally:
+            api_seconds.observe(url, perf_counter() - start)
+
+    timed_request._timed = True
+    apihelper._make_request = timed_request
+    asyncio_helper._process_request = timed_process_request
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scrapes are not logged
+
+
+def serve(host, port):
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info("📈 Metrics on http://%s:%s/metrics", host, server.server_port)
+    return server
+
+
+def install(bot, config):
+    """Instrument bot and the Bot API; serve /metrics on METRICS_PORT (0: only the bot command)."""
+    global enabled
+    enabled = config.METRICS_ENABLED
+    if not enabled:
+        return None
+    instrument_handlers(bot)
+    instrument_api()
+    if config.METRICS_PORT:
+        return serve(config.METRICS_HOST, config.METRICS_PORT)
+    return None
@@ -0,0 +1,58 @@
+import argparse
+import json
+import os
+import sys
+
+if __name__ == "__main__" and not __package__:
+    # Allow `python utils/migrate_saves.py` from the project root
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import config
+from utils.save_store import SqliteSaveStore
+
+# ✅ Copies saves/<user>.json files into the SQLite save store.
+# The JSON files are left in place; running it again just rewrites the same rows.
+# Usage: python utils/migrate_saves.py [--saves-dir saves] [--db saves/saves.db]
+
+BATCH_USERS = 1000  # users per transaction
+
+
+def iter_json_saves(saves_dir):
+    for file_name in sorted(os.listdir(saves_dir)):
+        user, extension = os.path.splitext(file_name)
+        if extension != ".json" or not user.lstrip("-").isdigit():
+            continue
+        try:
+            with open(os.path.join(saves_dir, file_name), "r", encoding="utf-8") as file:
+                slots = json.load(file)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Skipping {file_name}: {e}")
+            continue
+        yield int(user), slots
+
+
+def migrate(saves_dir, db_path, limit):
+    store = SqliteSaveStore(db_path, limit)
+    users = slots_total = 0
+    rows = []
+    for user_id, slots in iter_json_saves(saves_dir):
+        rows.extend((user_id, name, state) for name, state in slots.items())
+        users += 1
+        slots_total += len(slots)
+        if users % BATCH_USERS == 0:
+            store.save_many(rows)
+            rows = []
+    if rows:
+        store.save_many(rows)
+    return users, slots_total
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Copy JSON saves into the SQLite save store")
+    arg_parser.add_argument("--saves-dir", default=config.SAVES_DIR)
+    arg_parser.add_argument("--db", default=config.SAVES_DB)
+    args = arg_parser.parse_args()
+
+    users, slots = migrate(args.saves_dir, args.db, config.SAVES_LIMIT)
+    print(f"✅ Migrated {slots} saves of {users} users into {args.db}")
+    print("ℹ️ Set SAVE_BACKEND=sqlite to use them")
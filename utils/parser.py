@@ -1,5 +1,23 @@
+import argparse
+import gc
+import hashlib
 import json
+import multiprocessing
+import os
 import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+if __name__ == "__main__" and not __package__:
+    # Allow `python utils/parser.py` from the project root
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import msgpack
+from utils.bundle import save_bundle
+from utils.linker import find_dangling
+
+PARSE_CACHE_VERSION = 1
 
 def read_file(input_path):
     with open(input_path, 'r', encoding='utf-8') as file:
@@ -23,54 +41,32 @@ def collect_usable_items(chapters):
             usable_items.add(item_name.lower())
     return usable_items
 
-def parse_action(line, usable_items, chapter_id, rest_data):
-    line_lower = line.lower()
-    if line.strip().startswith(';') or line.startswith('Pause'):
-        return None  # Skip comments and lines with 'Pause'
+def parse_text_action(line, usable_items, chapter_id, rest_data):
+    return {"type": "text", "value": line[4:].strip()}
 
-    if line.lower().startswith('pln'):
-        return {"type": "text", "value": line[4:].strip()}
-
-    elif line.lower().startswith('btn'):
-        parts = line[4:].split(',', 1)
-        if len(parts) == 2:
-            return {
-                "type": "btn",
-                "value": {
-                    "text": parts[1].strip(),  # Keep button text as is
-                    "target": parts[0].strip().lower()  # Convert target to lowercase
-                }
+def parse_btn_action(line, usable_items, chapter_id, rest_data):
+    parts = line[4:].split(',', 1)
+    if len(parts) == 2:
+        return {
+            "type": "btn",
+            "value": {
+                "text": parts[1].strip(),  # Keep button text as is
+                "target": parts[0].strip().lower()  # Convert target to lowercase
             }
-        else:
-            rest_data.append(f"{chapter_id}: {line}")
-            return {"type": "unknown", "value": line}
-
-    elif line.lower().startswith('inv+') or line.lower().startswith('inv-'):
-        return parse_inventory_action(line, usable_items, rest_data, chapter_id)
-
-    elif line.lower().startswith('goto '):
-        return {"type": "goto", "value": line[5:].strip().lower()}  # Convert to lowercase
-
-    elif line.lower().startswith('if '):
-        return parse_if_action(line, usable_items, chapter_id, rest_data)
-
-    elif line_lower.startswith('xbtn'):
-        return parse_xbtn_action(line, usable_items, chapter_id, rest_data)
+        }
+    else:
+        rest_data.append(f"{chapter_id}: {line}")
+        return {"type": "unknown", "value": line}
 
-    elif line_lower.startswith('image'):
-        return parse_image_action(line)
+def parse_goto_action(line, usable_items, chapter_id, rest_data):
+    return {"type": "goto", "value": line[5:].strip().lower()}  # Convert to lowercase
 
-    elif line_lower.startswith('end') and line.strip().lower() == 'end':
-        # Handle 'End' only if it's a separate line
+def parse_end_action(line, usable_items, chapter_id, rest_data):
+    # Handle 'End' only if it's a separate line
+    if line.strip().lower() == 'end':
         return {"type": "end", "value": ""}
+    return NOT_A_KEYWORD
 
-    elif '=' in line:
-        return parse_assign_action(line)
-
-    else:
-        rest_data.append(f"{chapter_id}: {line}")
-        return {"type": "unknown", "value": line}
-    
 def parse_inventory_action(line, usable_items, rest_data, chapter_id):
     line_lower = line.lower()
     if 'золотых монет' in line_lower:
@@ -204,8 +200,42 @@ def parse_assign_action(line):
         }
     else:
         return None  # Если нет '=', это не присваивание    
+NOT_A_KEYWORD = object()  # the line only looks like a keyword, parse it as an assignment/unknown
+
+# ✅ Leading keyword (first 3 letters, lowercased) -> (full keyword prefixes, parser)
+ACTION_PARSERS = {
+    'pln': (('pln',), parse_text_action),
+    'btn': (('btn',), parse_btn_action),
+    'inv': (('inv+', 'inv-'), lambda line, usable_items, chapter_id, rest_data:
+            parse_inventory_action(line, usable_items, rest_data, chapter_id)),
+    'got': (('goto ',), parse_goto_action),
+    'if ': (('if ',), parse_if_action),
+    'xbt': (('xbtn',), parse_xbtn_action),
+    'ima': (('image',), lambda line, usable_items, chapter_id, rest_data: parse_image_action(line)),
+    'end': (('end',), parse_end_action),
+}
+
+def parse_action(line, usable_items, chapter_id, rest_data):
+    if line.strip().startswith(';') or line.startswith('Pause'):
+        return None  # Skip comments and lines with 'Pause'
+
+    # One dict lookup on the leading keyword instead of a chain of line.lower().startswith()
+    entry = ACTION_PARSERS.get(line[:3].lower())
+    if entry is not None and line[:5].lower().startswith(entry[0]):
+        action = entry[1](line, usable_items, chapter_id, rest_data)
+        if action is not NOT_A_KEYWORD:
+            return action
+
+    if '=' in line:
+        return parse_assign_action(line)
+
+    rest_data.append(f"{chapter_id}: {line}")
+    return {"type": "unknown", "value": line}
+
 def parse_chapter(chapter, usable_items, rest_data):
-    lines = chapter.strip().split('\n')
+    return parse_chapter_lines(chapter.strip().split('\n'), usable_items, rest_data)
+
+def parse_chapter_lines(lines, usable_items, rest_data):
     chapter_id = lines[0].strip(':').lower()  # Convert to lowercase
     actions = []
     current_text = ""  # Переменная для накопления текста из последовательных PLN
@@ -263,19 +293,213 @@ def parse_chapter(chapter, usable_items, rest_data):
 
     return chapter_id, actions
     
-def parse_input_to_json(input_path):
-    content = read_file(input_path)
-    chapters = split_into_chapters(content)
-    usable_items = collect_usable_items(chapters)
+def parse_input_to_json(input_path, cache_path=None, jobs=1):
+    if cache_path or jobs > 1:
+        content = read_file(input_path)
+        chapters = split_into_chapters(content)
+        usable_items = collect_usable_items(chapters)
+        if cache_path:
+            return parse_chapters_incremental(chapters, usable_items, cache_path)
+        return parse_chapters_parallel(chapters, usable_items, jobs)
+
     json_data = {}
     rest_data = []
 
-    for chapter in chapters:
-        chapter_id, actions = parse_chapter(chapter, usable_items, rest_data)
+    for chapter_id, actions in stream_chapters(input_path, rest_data):
         json_data[chapter_id] = actions
 
     return json_data, rest_data
 
+# ✅ Streaming lexer
+#
+# Reads the source once, line by line, and yields parsed chapters one at a time, so neither
+# the whole file nor the list of all chapter strings is kept in memory. Chapter blocks are
+# cut exactly like split_into_chapters does (a line starting with "End" ends the block).
+# use_ chapters are collected on the way: an inventory action parsed before its use_
+# chapter appeared gets the "[usable]" suffix as soon as that chapter is read, so yielded
+# chapters are final once the generator is exhausted.
+
+END_LINE = re.compile(r'End\b')
+
+def read_lines(input_path):
+    with open(input_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            yield line[:-1] if line.endswith('\n') else line
+
+def iter_chapter_blocks(lines):
+    block = []
+    for number, line in enumerate(lines):
+        if number and line.startswith('End') and END_LINE.match(line):
+            yield block
+            block = [line[3:]]
+        else:
+            block.append(line)
+    # Like split_into_chapters, only the last block is dropped when it's empty
+    if any(line.strip() for line in block):
+        yield block
+
+def strip_block(block):
+    """Same lines as '\\n'.join(block).strip().split('\\n')."""
+    start, end = 0, len(block) - 1
+    while start <= end and not block[start].strip():
+        start += 1
+    while end >= start and not block[end].strip():
+        end -= 1
+    if start > end:
+        return ['']
+    lines = block[start:end + 1]
+    lines[0] = lines[0].lstrip()
+    lines[-1] = lines[-1].rstrip()
+    return lines
+
+def iter_inventory_actions(actions):
+    for action in actions:
+        if action["type"] == "inventory":
+            yield action
+        elif action["type"] == "if":
+            yield from iter_inventory_actions(action["value"]["actions"])
+            yield from iter_inventory_actions(action["value"].get("else_actions", []))
+        elif action["type"] == "xbtn":
+            yield from iter_inventory_actions(action["value"]["actions"])
+
+def stream_chapters(input_path, rest_data):
+    usable_items = set()
+    pending = {}  # item -> inventory actions parsed before the item was known to be usable
+
+    for block in iter_chapter_blocks(read_lines(input_path)):
+        lines = strip_block(block)
+
+        header = lines[0].strip(':')
+        if header.lower().startswith('use_'):
+            item = header[4:].lower()
+            usable_items.add(item)
+            for action in pending.pop(item, []):
+                action["value"] += "[usable]"
+
+        chapter_id, actions = parse_chapter_lines(lines, usable_items, rest_data)
+        for action in iter_inventory_actions(actions):
+            item = action["value"][4:]
+            if item not in usable_items:
+                pending.setdefault(item, []).append(action)
+
+        yield chapter_id, actions
+
+# ✅ Parallel build
+#
+# Once usable_items is known the chapters don't depend on each other: they are parsed in a
+# process pool in chunks and merged back in source order.
+
+_worker_usable_items = None
+
+def _init_worker(usable_items):
+    global _worker_usable_items
+    _worker_usable_items = usable_items
+
+def parse_chapter_chunk(chunk):
+    rest_data = []
+    parsed = [parse_chapter(chapter, _worker_usable_items, rest_data) for chapter in chunk]
+    return parsed, rest_data
+
+def parse_chapters_parallel(chapters, usable_items, jobs, chunk_size=None):
+    if chunk_size is None:
+        # A few chunks per worker so a slow chunk doesn't leave the others idle
+        chunk_size = max(1, -(-len(chapters) // (jobs * 4)))
+    chunks = [chapters[i:i + chunk_size] for i in range(0, len(chapters), chunk_size)]
+
+    json_data = {}
+    rest_data = []
+    # spawn: forking a process that already runs threads (the bot, tests) may deadlock
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=context,
+                             initializer=_init_worker, initargs=(usable_items,)) as pool:
+        # map() returns results in submission order
+        for parsed, chunk_rest in pool.map(parse_chapter_chunk, chunks):
+            json_data.update(parsed)
+            rest_data.extend(chunk_rest)
+    return json_data, rest_data
+
+# ✅ Incremental build
+#
+# Every chapter block is keyed by the hash of its source text. The cache keeps the parsed
+# actions, the unparsed lines and the item names the chapter checked against usable_items,
+# so a chapter is parsed again only if its text changed or one of those items became
+# (or stopped being) usable because a use_ chapter was added or removed.
+
+class TrackedItems(set):
+    """usable_items that remembers which item names were looked up."""
+    def __init__(self, items):
+        super().__init__(items)
+        self.looked_up = set()
+
+    def __contains__(self, item):
+        self.looked_up.add(item)
+        return super().__contains__(item)
+
+def parser_fingerprint():
+    # Any change to the parser itself invalidates the cache
+    with open(os.path.abspath(__file__), 'rb') as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+def load_parse_cache(cache_path, fingerprint):
+    empty = {"version": PARSE_CACHE_VERSION, "parser": fingerprint, "usable_items": [], "chapters": {}}
+    if not os.path.exists(cache_path):
+        return empty
+    gc_enabled = gc.isenabled()  # restored, not forced on
+    gc.disable()  # many small objects, nothing cyclic
+    try:
+        with open(cache_path, 'rb') as file:
+            cache = msgpack.unpackb(file.read())
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Ignoring parse cache {cache_path}: {e}")
+        return empty
+    finally:
+        if gc_enabled:
+            gc.enable()
+    if not isinstance(cache, dict) or cache.get("version") != PARSE_CACHE_VERSION or cache.get("parser") != fingerprint:
+        return empty
+    return cache
+
+def save_parse_cache(cache, cache_path):
+    with open(cache_path, 'wb') as file:
+        file.write(msgpack.packb(cache))
+
+def parse_chapters_incremental(chapters, usable_items, cache_path):
+    fingerprint = parser_fingerprint()
+    cache = load_parse_cache(cache_path, fingerprint)
+    changed_items = usable_items.symmetric_difference(cache["usable_items"])
+    tracked_items = TrackedItems(usable_items)
+
+    json_data = {}
+    rest_data = []
+    entries = {}
+    reused = 0
+
+    for chapter in chapters:
+        digest = hashlib.sha1(chapter.encode('utf-8')).hexdigest()
+        entry = entries.get(digest) or cache["chapters"].get(digest)
+        if entry is None or changed_items.intersection(entry["items"]):
+            tracked_items.looked_up = set()
+            chapter_rest = []
+            chapter_id, actions = parse_chapter(chapter, tracked_items, chapter_rest)
+            entry = {"id": chapter_id, "actions": actions, "rest": chapter_rest, "items": sorted(tracked_items.looked_up)}
+        else:
+            reused += 1
+
+        json_data[entry["id"]] = entry["actions"]
+        rest_data.extend(entry["rest"])
+        entries[digest] = entry
+
+    # Nothing to write back when every chapter came from the cache
+    if reused < len(chapters) or changed_items or entries.keys() != cache["chapters"].keys():
+        save_parse_cache({
+            "version": PARSE_CACHE_VERSION,
+            "parser": fingerprint,
+            "usable_items": sorted(usable_items),
+            "chapters": entries,
+        }, cache_path)
+    print(f"♻️ Reused {reused} of {len(chapters)} chapters, parsed {len(chapters) - reused}")
+    return json_data, rest_data
+
 def save_json_to_file(json_data, output_path):
     with open(output_path, 'w', encoding='utf-8') as file:
         json.dump(json_data, file, ensure_ascii=False, indent=4)
@@ -286,10 +510,28 @@ def save_rest_to_file(rest_data, rest_path):
 
 
 if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Convert an URQ quest (data/input.txt) into chapters.json and the compiled bundle")
+    arg_parser.add_argument("--incremental", action="store_true",
+                            help="reuse parse results of unchanged chapters from data/.parse_cache.msgpack")
+    arg_parser.add_argument("--jobs", type=int, default=1, metavar="N",
+                            help="parse chapters in N worker processes (full parse only)")
+    args = arg_parser.parse_args()
+
     input_path = 'data/input.txt' #input quest file
     output_path = 'data/chapters.json'
+    bundle_path = 'data/chapters.msgpack' # compiled quest, loaded by config when present
+    index_path = 'data/chapters.idx' # byte ranges of chapters inside the bundle
     rest_path = 'data/rest.txt' # strings that didn't parsed 
-
-    json_data, rest_data = parse_input_to_json(input_path)
+    cache_path = 'data/.parse_cache.msgpack' # per-chapter parse results for --incremental
+
+    start = time.perf_counter()
+    json_data, rest_data = parse_input_to_json(input_path, cache_path if args.incremental else None, args.jobs)
+    print(f"✅ Parsed {len(json_data)} chapters in {(time.perf_counter() - start) * 1000:.0f} ms")
+    # ✅ Link step: btn/xbtn/goto targets become chapter IDs when the quest is loaded
+    dangling = find_dangling(json_data)
+    for chapter_id, target in dangling:
+        print(f"⚠️ Dangling target in '{chapter_id}': '{target}'")
+    print(f"🔗 Linked {len(json_data)} chapters, {len(dangling)} dangling targets")
     save_json_to_file(json_data, output_path)
+    save_bundle(json_data, bundle_path, index_path)
     save_rest_to_file(rest_data, rest_path)
@@ -0,0 +1,292 @@
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from config import config
+
+# ✅ Save backends
+#
+# A save slot is a state (chapter keys, see state_to_keys) stored under its name, the
+# save time "YYYY-MM-DD HH:MM:SS", so names sort from oldest to newest. Each user keeps
+# at most SAVES_LIMIT slots. SAVE_BACKEND picks the storage:
+#   json   — saves/<user>.json with all slots of a user (the file is rewritten on save)
+#   sqlite — SAVES_DB, one row per slot, primary key (user_id, name), WAL journal
+# The same store keeps sessions moved out of memory by the session cache (one per user,
+# overwritten on every eviction), apart from the save slots.
+#
+# ✅ Save-slot index: slots(user) gives {"name", "chapter", "size"} of every slot, newest
+# first, without decoding any state. It is kept in memory for SAVE_INDEX_SIZE users and
+# updated on save, so the load menu needs no I/O; load(user, name) decodes that slot only.
+# The JSON store also keeps it on disk (saves/<user>.index.json, with each slot's byte
+# offset in saves/<user>.json); SQLite reads it from the saves table.
+
+
+class SlotIndex:
+    """Slot lists of the most recently seen users (LRU)."""
+
+    def __init__(self, max_users):
+        self.max_users = max_users
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            slots = self._users.get(user_id)
+            if slots is not None:
+                self._users.move_to_end(user_id)
+            return slots
+
+    def put(self, user_id, slots):
+        with self._lock:
+            self._users[user_id] = slots  # replaced, never changed in place
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    def discard(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+
+class JsonSaveStore:
+    def __init__(self, saves_dir, limit, index_size=10000):
+        self.saves_dir = saves_dir
+        self.limit = limit
+        self.index = SlotIndex(index_size)
+
+    def _path(self, user_id):
+        return f"{self.saves_dir}/{user_id}.json"
+
+    def _index_path(self, user_id):
+        return f"{self.saves_dir}/{user_id}.index.json"
+
+    def _read(self, user_id):
+        try:
+            with open(self._path(user_id), "r", encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+
+    def _write(self, user_id, entries):
+        """Write [(slot, state JSON)] (oldest first) as the user's save file and index; returns the index."""
+        parts, slots = [b"{"], []
+        offset = 1
+        for position, (slot, text) in enumerate(entries):
+            head = f"{',' if position else ''}\n    {json.dumps(slot['name'])}: ".encode()
+            data = text.encode()
+            offset += len(head)
+            slots.append(dict(slot, offset=offset, size=len(data)))
+            offset += len(data)
+            parts += (head, data)
+        parts.append(b"\n}\n")
+        content = b"".join(parts)
+
+        # Save file first: if the bot stops in between, the index no longer matches its size
+        with open(self._path(user_id), "wb") as file:
+            file.write(content)
+        slots.reverse()
+        with open(self._index_path(user_id), "w", encoding="utf-8") as file:
+            json.dump({"file_size": len(content), "slots": slots}, file, ensure_ascii=False)
+        return slots
+
+    def _read_index(self, user_id):
+        try:
+            file_size = os.path.getsize(self._path(user_id))
+        except FileNotFoundError:
+            return []
+        try:
+            with open(self._index_path(user_id), "r", encoding="utf-8") as file:
+                index = json.load(file)
+            if index["file_size"] == file_size:
+                return index["slots"]
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+        # ✅ No index (saves of an older version) or the file was changed by hand: rebuild it
+        slots = self._read(user_id)
+        return self._write(user_id, [
+            ({"name": name, "chapter": state.get("chapter")}, json.dumps(state, ensure_ascii=False, indent=4))
+            for name, state in sorted(slots.items())
+        ])
+
+    def slots(self, user_id):
+        slots = self.index.get(user_id)
+        if slots is None:
+            slots = self._read_index(user_id)
+            self.index.put(user_id, slots)
+        return slots
+
+    def save(self, user_id, name, state):
+        others = sorted((slot for slot in self.slots(user_id) if slot["name"] != name),
+                        key=lambda slot: slot["name"])
+        kept = others[max(0, len(others) - self.limit + 1):]  # ✅ with the new one: the newest SAVES_LIMIT
+        content = b""
+        if kept:
+            # ✅ Other slots are copied as they are, without decoding them
+            with open(self._path(user_id), "rb") as file:
+                content = file.read()
+        entries = [(slot, content[slot["offset"]:slot["offset"] + slot["size"]].decode()) for slot in kept]
+        entries.append(({"name": name, "chapter": state.get("chapter")},
+                         json.dumps(state, ensure_ascii=False, indent=4)))
+        entries.sort(key=lambda entry: entry[0]["name"])
+        self.index.put(user_id, self._write(user_id, entries))
+
+    def list(self, user_id):
+        """Save names, newest first."""
+        return [slot["name"] for slot in self.slots(user_id)]
+
+    def load(self, user_id, name=None):
+        """(name, state) of the save name, or of the newest one; (None, None) if there is none."""
+        slot = next((slot for slot in self.slots(user_id) if name in (None, slot["name"])), None)
+        if slot is None:
+            return None, None
+        with open(self._path(user_id), "rb") as file:
+            file.seek(slot["offset"])
+            return slot["name"], json.loads(file.read(slot["size"]))
+
+    def _session_path(self, user_id):
+        return f"{self.saves_dir}/sessions/{user_id}.json"
+
+    def put_session(self, user_id, state):
+        self.put_sessions([(user_id, json.dumps(state, ensure_ascii=False))])
+
+    def put_sessions(self, rows):
+        """Write (user_id, JSON text) rows of sessions."""
+        os.makedirs(f"{self.saves_dir}/sessions", exist_ok=True)
+        for user_id, text in rows:
+            # Temporary file first: a crash never leaves a half-written session
+            path = self._session_path(user_id)
+            with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+                file.write(text)
+            os.replace(f"{path}.tmp", path)
+
+    def get_session(self, user_id):
+        try:
+            with open(self._session_path(user_id), "r", encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def delete_session(self, user_id):
+        try:
+            os.remove(self._session_path(user_id))
+            return True
+        except FileNotFoundError:
+            return False
+
+
+class SqliteSaveStore:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS saves (
+            user_id INTEGER NOT NULL,
+            name    TEXT    NOT NULL,
+            state   TEXT    NOT NULL,
+            PRIMARY KEY (user_id, name)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS sessions (
+            user_id INTEGER PRIMARY KEY,
+            state   TEXT    NOT NULL
+        );
+    """
+    # Constant SQL with parameters: sqlite3 keeps the prepared statements per connection
+    SAVE = "INSERT OR REPLACE INTO saves (user_id, name, state) VALUES (?, ?, ?)"
+    TRIM = """
+        DELETE FROM saves WHERE user_id = ? AND name <= (
+            SELECT name FROM saves WHERE user_id = ? ORDER BY name DESC LIMIT 1 OFFSET ?)
+    """
+    SLOTS = """
+        SELECT name, json_extract(state, '$.chapter'), length(CAST(state AS BLOB))
+        FROM saves WHERE user_id = ? ORDER BY name DESC
+    """
+    LOAD = "SELECT name, state FROM saves WHERE user_id = ? AND name = ?"
+    LOAD_LAST = "SELECT name, state FROM saves WHERE user_id = ? ORDER BY name DESC LIMIT 1"
+    PUT_SESSION = "INSERT OR REPLACE INTO sessions (user_id, state) VALUES (?, ?)"
+    GET_SESSION = "SELECT state FROM sessions WHERE user_id = ?"
+    DELETE_SESSION = "DELETE FROM sessions WHERE user_id = ?"
+
+    def __init__(self, path, limit, index_size=10000):
+        self.path = path
+        self.limit = limit
+        self.index = SlotIndex(index_size)
+        self._local = threading.local()  # one connection per thread (updates run on a pool)
+        with self._connection() as connection:
+            connection.executescript(self.SCHEMA)
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")  # safe with WAL, no fsync per save
+            self._local.connection = connection
+        return connection
+
+    def save(self, user_id, name, state):
+        text = json.dumps(state, ensure_ascii=False)
+        with self._connection() as connection:  # one transaction
+            connection.execute(self.SAVE, (user_id, name, text))
+            connection.execute(self.TRIM, (user_id, user_id, self.limit))  # ✅ keep the newest SAVES_LIMIT
+        slots = self.index.get(user_id)
+        if slots is not None:
+            slot = {"name": name, "chapter": state.get("chapter"), "size": len(text.encode())}
+            others = [old for old in slots if old["name"] != name]
+            self.index.put(user_id, sorted(others + [slot], key=lambda slot: slot["name"], reverse=True)[:self.limit])
+
+    def save_many(self, rows):
+        """Insert (user_id, name, state) rows in one transaction, then trim their users."""
+        with self._connection() as connection:
+            connection.executemany(self.SAVE, ((user_id, name, json.dumps(state, ensure_ascii=False))
+                                               for user_id, name, state in rows))
+            connection.executemany(self.TRIM, ((user_id, user_id, self.limit)
+                                               for user_id in {row[0] for row in rows}))
+        for user_id in {row[0] for row in rows}:
+            self.index.discard(user_id)
+
+    def slots(self, user_id):
+        slots = self.index.get(user_id)
+        if slots is None:
+            slots = [{"name": name, "chapter": chapter, "size": size}
+                     for name, chapter, size in self._connection().execute(self.SLOTS, (user_id,))]
+            self.index.put(user_id, slots)
+        return slots
+
+    def list(self, user_id):
+        return [slot["name"] for slot in self.slots(user_id)]
+
+    def load(self, user_id, name=None):
+        if name is None:
+            row = self._connection().execute(self.LOAD_LAST, (user_id,)).fetchone()
+        else:
+            row = self._connection().execute(self.LOAD, (user_id, name)).fetchone()
+        return (row[0], json.loads(row[1])) if row else (None, None)
+
+    def put_session(self, user_id, state):
+        with self._connection() as connection:
+            connection.execute(self.PUT_SESSION, (user_id, json.dumps(state, ensure_ascii=False)))
+
+    def put_sessions(self, rows):
+        with self._connection() as connection:  # ✅ one transaction for the whole batch
+            connection.executemany(self.PUT_SESSION, rows)
+
+    def get_session(self, user_id):
+        row = self._connection().execute(self.GET_SESSION, (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete_session(self, user_id):
+        with self._connection() as connection:
+            return connection.execute(self.DELETE_SESSION, (user_id,)).rowcount > 0
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            if config.SAVE_BACKEND == "sqlite":
+                _store = SqliteSaveStore(config.SAVES_DB, config.SAVES_LIMIT, config.SAVE_INDEX_SIZE)
+            else:
+                _store = JsonSaveStore(config.SAVES_DIR, config.SAVES_LIMIT, config.SAVE_INDEX_SIZE)
+        return _store
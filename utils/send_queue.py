@@ -0,0 +1,234 @@
+import atexit
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from telebot.apihelper import ApiTelegramException
+import telebot.types as types
+from utils.error_handler import get_reporter
+
+logger = logging.getLogger(__name__)
+
+# ✅ Outbound send scheduler
+#
+# Every bot.send_message / bot.send_photo of the handlers is put into a queue instead of
+# going to Telegram at once. Token buckets keep the sends within Telegram's limits:
+# about 30 messages/s for the bot and about 1/s per chat, each with a small burst.
+# A 429 answer pauses all sends (the chat and the bot) for retry_after seconds and the
+# message is sent again. Messages of one chat keep their order (one in flight at a time).
+# Between chats, a chat whose next message has an inline keyboard (what the player waits
+# for) goes before chats with plain text. At most max_queued messages wait; more are
+# refused (a failed future).
+# send_message / send_photo never wait: they return a Future of the Message. A failed send
+# sets the future's exception and goes to on_error (the error reporter in install); a
+# photo file is read before it is queued, so the caller may close it.
+
+KEYBOARD, TEXT = 0, 1  # priorities, lower first
+
+
+class TokenBucket:
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """Seconds until a token is available (0 if one is available now)."""
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def full(self, now):
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+class Chat:
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.queue = deque()  # (priority, sequence, queued_at, method, args, kwargs, future)
+        self.in_flight = False
+        self.paused_until = 0.0
+
+
+class SendQueueFull(RuntimeError):
+    pass
+
+
+class SendScheduler:
+    def __init__(self, send, rate=30, burst=30, chat_rate=1.0, chat_burst=3, workers=8,
+                 clock=time.monotonic, max_queued=10000, on_error=None):
+        self.send = send  # send(method, *args, **kwargs) calls the Bot API
+        self.on_error = on_error  # on_error(method, chat_id, error) for every failed send
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.clock = clock
+        self.bucket = TokenBucket(rate, burst, clock())
+        self.paused_until = 0.0  # after a 429, for all chats
+        self.max_queued = max_queued
+        self.queued = 0
+        self.chats = {}  # chat_id -> Chat while it has queued messages or a non-full bucket
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix="send")
+        self.closed = False
+        self.stats = {"queued": 0, "sent": 0, "failed": 0, "refused": 0, "retried_429": 0, "max_wait": 0.0}
+
+        self.thread = threading.Thread(target=self._run, name="send-scheduler", daemon=True)
+        self.thread.start()
+
+    def submit(self, chat_id, method, args, kwargs=None, priority=TEXT):
+        """Queue bot.<method>(*args, **kwargs); returns the Future of its result."""
+        future = Future()
+        with self.condition:
+            refused = self.queued >= self.max_queued
+            if refused:
+                self.stats["refused"] += 1
+            else:
+                chat = self.chats.get(chat_id)
+                if chat is None:
+                    chat = self.chats[chat_id] = Chat(TokenBucket(self.chat_rate, self.chat_burst, self.clock()))
+                chat.queue.append((priority, next(self.sequence), self.clock(), method, args, kwargs or {}, future))
+                self.queued += 1
+                self.stats["queued"] += 1
+                self.condition.notify()
+        if refused:
+            self._failed(future, method, chat_id, SendQueueFull(f"{self.max_queued} messages are waiting"))
+        return future
+
+    def _next(self, now):
+        """Chat to send from now, or the seconds to wait before one may be ready."""
+        best, wait = None, None
+        for chat_id, chat in list(self.chats.items()):
+            if chat.in_flight:
+                continue
+            if not chat.queue:
+                if chat.bucket.full(now):
+                    del self.chats[chat_id]  # idle chat: nothing to remember
+                continue
+            delay = max(chat.paused_until - now, chat.bucket.wait_time(now))
+            if delay > 0:
+                wait = delay if wait is None else min(wait, delay)
+            else:
+                head = chat.queue[0][:2]  # (priority, sequence): keyboards first, then oldest
+                if best is None or head < best[0]:
+                    best = (head, chat_id)
+        if best is None:
+            return None, wait
+        global_wait = max(self.paused_until - now, self.bucket.wait_time(now))
+        if global_wait > 0:
+            return None, global_wait
+        return best[1], None
+
+    def _busy(self):
+        return any(chat.queue or chat.in_flight for chat in self.chats.values())
+
+    def _run(self):
+        with self.condition:
+            while True:
+                chat_id, wait = self._next(self.clock())
+                if chat_id is None:
+                    if self.closed and not self._busy():
+                        return
+                    self.condition.wait(wait)
+                    continue
+                chat = self.chats[chat_id]
+                self.bucket.take()
+                chat.bucket.take()
+                chat.in_flight = True
+                self.pool.submit(self._send, chat, chat.queue.popleft())
+
+    def _send(self, chat, item):
+        method, args, kwargs = item[3:6]
+        try:
+            result = self.send(method, *args, **kwargs)
+        except ApiTelegramException as e:
+            if e.error_code != 429:
+                return self._finish(chat, item, error=e)
+            retry_after = (e.result_json.get("parameters") or {}).get("retry_after", 1)
+            logger.warning("⚠️ 429 from Telegram (chat %s): all sends paused for %s s", args[0], retry_after)
+            with self.condition:
+                self.stats["retried_429"] += 1
+                chat.paused_until = self.paused_until = self.clock() + retry_after
+                chat.queue.appendleft(item)  # same message again, still first in its chat
+                chat.in_flight = False
+                self.condition.notify_all()
+        except Exception as e:
+            self._finish(chat, item, error=e)
+        else:
+            self._finish(chat, item, result=result)
+
+    def _finish(self, chat, item, result=None, error=None):
+        queued_at, method, args, future = item[2], item[3], item[4], item[6]
+        with self.condition:
+            chat.in_flight = False
+            self.queued -= 1
+            self.stats["max_wait"] = max(self.stats["max_wait"], self.clock() - queued_at)
+            self.stats["sent" if error is None else "failed"] += 1
+            self.condition.notify_all()
+        if error is None:
+            future.set_result(result)
+        else:
+            self._failed(future, method, args[0], error)
+
+    def _failed(self, future, method, chat_id, error):
+        if self.on_error is not None:
+            try:
+                self.on_error(method, chat_id, error)
+            except Exception as e:
+                logger.error("❌ Error reporting a failed send: %s", e)
+        else:
+            logger.error("❌ Error sending message: %s", error)
+        future.set_exception(error)
+
+    def join(self, timeout=None):
+        """Wait until every queued message is sent (or failed). False on timeout."""
+        with self.condition:
+            return self.condition.wait_for(lambda: not self._busy(), timeout)
+
+    def close(self, timeout=None):
+        self.join(timeout)
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join(timeout)
+        self.pool.shutdown(wait=False)
+
+
+def install(bot, config):
+    """Route bot.send_message / bot.send_photo through a SendScheduler (both return a Future)."""
+    methods = {"send_message": bot.send_message, "send_photo": bot.send_photo}
+
+    def report(method, chat_id, error):
+        get_reporter().report(method, error, chat_id, context="отправке")
+
+    scheduler = SendScheduler(
+        lambda method, *args, **kwargs: methods[method](*args, **kwargs),
+        rate=config.SEND_RATE, burst=config.SEND_BURST,
+        chat_rate=config.SEND_CHAT_RATE, chat_burst=config.SEND_CHAT_BURST,
+        workers=config.SEND_WORKERS, max_queued=config.SEND_QUEUE_SIZE, on_error=report,
+    )
+
+    def send_message(chat_id, text, *args, **kwargs):
+        keyboard = isinstance(kwargs.get("reply_markup"), types.InlineKeyboardMarkup)
+        return scheduler.submit(chat_id, "send_message", (chat_id, text, *args), kwargs,
+                                priority=KEYBOARD if keyboard else TEXT)
+
+    def send_photo(chat_id, photo, *args, **kwargs):
+        if hasattr(photo, "read"):
+            photo = photo.read()  # the caller closes the file before the upload
+        return scheduler.submit(chat_id, "send_photo", (chat_id, photo, *args), kwargs)
+
+    bot.send_message = send_message
+    bot.send_photo = send_photo
+    atexit.register(scheduler.close, 10)  # ✅ send what's queued when the bot stops
+    return scheduler
@@ -0,0 +1,232 @@
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from collections.abc import MutableMapping
+
+# ✅ Bounded session cache
+#
+# state_cache keeps player states in memory in LRU order and stays within max_entries
+# (and max_bytes, if set). A session idle longer than ttl seconds is also moved out.
+# An evicted session is written to the session store (see utils/save_store.py) outside
+# the cache lock; the next get_state / state_cache.get of that chat reads it back, so
+# eviction is invisible to the handlers. With deferred set (the asyncio engine) the writes
+# are left to write_deferred, run from a worker thread. len(), iteration and `in` cover
+# only the sessions in memory.
+# Sessions looked up or replaced are marked dirty; flush_dirty (run by utils/autosave.py)
+# writes those whose content changed since their last write (digest of the written JSON,
+# kept when a session is replaced), in one batch.
+
+
+def sizeof(value):
+    """Approximate memory taken by a state (containers and their contents)."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(sizeof(key) + sizeof(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset, deque)):
+        size += sum(sizeof(item) for item in value)
+    return size
+
+
+class SessionCache(MutableMapping):
+    def __init__(self, store, max_entries=10000, max_bytes=0, ttl=0, dump=None, load=None,
+                 clock=time.monotonic):
+        self.store = store  # put_session / get_session / delete_session
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes  # 0: no limit (sizes are not measured then)
+        self.ttl = ttl  # 0: no idle limit
+        self.dump = dump or (lambda state: state)  # state -> JSON-friendly dict for the store
+        self.load = load or (lambda saved: saved)
+        self.clock = clock
+
+        self._entries = OrderedDict()  # chat_id -> [state, last_used, size, digest], least recent first
+        self._dirty = set()  # looked up / replaced since the last flush: possibly changed
+        self._evicting = {}  # chat_id -> [state] moved out of memory, being written to the store
+        self._write_lock = threading.Lock()  # store writes in order (an eviction, then a newer flush)
+        self.deferred = None  # a deque: eviction writes wait there for write_deferred (asyncio engine)
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.stats = {"hits": 0, "misses": 0, "rehydrated": 0, "evicted": 0, "expired": 0}
+
+    def _touch(self, key, entry, now):
+        entry[1] = now
+        if self.max_bytes:
+            # the state was probably changed since the last access: measure it again
+            size = sizeof(entry[0])
+            self._bytes += size - entry[2]
+            entry[2] = size
+        self._entries.move_to_end(key)
+
+    def _lookup(self, key):
+        """State of key from memory or the store (counted in stats), None if there is none."""
+        with self._lock:
+            now = self.clock()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.stats["hits"] += 1
+                self._dirty.add(key)  # handlers change the state they get in place
+                self._touch(key, entry, now)
+                evicted = self._evict(now)
+                state = entry[0]
+            else:
+                evicted = None
+                pending = self._evicting.pop(key, None)  # evicted, its write not done yet
+                if pending is not None:
+                    self.stats["hits"] += 1
+                    evicted = self._insert(key, pending[0], now)
+                    state = pending[0]
+        if evicted is not None:
+            self._write_evicted(evicted)
+            return state
+
+        # ✅ Store I/O without the lock: other chats are not kept waiting
+        saved = self.store.get_session(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:  # put back meanwhile (by its handler or a parallel lookup)
+                return entry[0]
+            if saved is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["rehydrated"] += 1
+            state = self.load(saved)
+            evicted = self._insert(key, state, self.clock())
+        self._write_evicted(evicted)
+        return state
+
+    def _insert(self, key, state, now):
+        old = self._entries.pop(key, None)
+        digest = None  # digest of what the store has: unknown
+        if old is not None:
+            self._bytes -= old[2]
+            digest = old[3]  # replaced (e.g. a chapter render): still compared on flush
+        size = sizeof(state) if self.max_bytes else 0
+        self._entries[key] = [state, now, size, digest]
+        self._dirty.add(key)
+        self._bytes += size
+        return self._evict(now)
+
+    def _evict(self, now):
+        """Take the sessions to move out of memory; returns those _write_evicted has to store."""
+        # ✅ Oldest first: idle too long, or over the limits (the newest entry always stays)
+        evicted = []
+        while len(self._entries) > 1:
+            key, (state, last_used, size, digest) = next(iter(self._entries.items()))
+            if self.ttl and now - last_used > self.ttl:
+                self.stats["expired"] += 1
+            elif len(self._entries) > self.max_entries or (self.max_bytes and self._bytes > self.max_bytes):
+                self.stats["evicted"] += 1
+            else:
+                break
+            if key in self._dirty or digest is None:  # unchanged since the last flush: already stored
+                pending = self._evicting[key] = [state]  # readable until it is written
+                evicted.append((key, pending))
+            self._dirty.discard(key)
+            del self._entries[key]
+            self._bytes -= size
+        return evicted
+
+    def _write_evicted(self, evicted):
+        # Called without the lock: a slow store stalls only this caller
+        deferred = self.deferred
+        if deferred is not None:
+            deferred.extend(evicted)  # the caller can't block (an event loop): written by write_deferred
+            return
+        self._store_evicted(evicted)
+
+    def write_deferred(self):
+        """Write the evicted sessions kept in deferred (from a worker thread)."""
+        evicted = []
+        while self.deferred:
+            try:
+                evicted.append(self.deferred.popleft())
+            except IndexError:  # taken by a parallel call
+                break
+        self._store_evicted(evicted)
+
+    def _store_evicted(self, evicted):
+        for key, pending in evicted:
+            with self._write_lock:
+                if self._evicting.get(key) is pending:  # not read back in the meantime
+                    self.store.put_session(key, self.dump(pending[0]))
+            with self._lock:
+                if self._evicting.get(key) is pending:
+                    del self._evicting[key]
+
+    def __getitem__(self, key):
+        state = self._lookup(key)
+        if state is None:
+            raise KeyError(key)
+        return state
+
+    def get(self, key, default=None):
+        state = self._lookup(key)
+        return default if state is None else state
+
+    def __contains__(self, key):
+        # Memory only (no store I/O, no LRU touch): use get() to read a session back
+        return key in self._entries or key in self._evicting
+
+    def __setitem__(self, key, state):
+        with self._lock:
+            evicted = self._insert(key, state, self.clock())
+        self._write_evicted(evicted)
+
+    def __delitem__(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            pending = self._evicting.pop(key, None)
+            self._dirty.discard(key)
+            if entry is not None:
+                self._bytes -= entry[2]
+        with self._write_lock:
+            if not self.store.delete_session(key) and entry is None and pending is None:
+                raise KeyError(key)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._entries))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def flush_dirty(self):
+        """Write the dirty sessions that changed since their last write. Returns (written, unchanged)."""
+        if self.deferred:
+            self.write_deferred()
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            entries = [(key, self._entries[key]) for key in dirty if key in self._entries]
+
+        # Copies are made without the lock, so players aren't kept waiting
+        changed, retry = [], []
+        for key, entry in entries:
+            try:
+                text = json.dumps(self.dump(entry[0]), ensure_ascii=False, sort_keys=True)
+            except RuntimeError:
+                retry.append(key)  # changed by its handler while being copied: next time
+                continue
+            if hash(text) != entry[3]:
+                changed.append((key, entry, text))
+
+        with self._lock, self._write_lock:
+            # an entry evicted in the meantime was written by the eviction, with newer content
+            changed = [(key, entry, text) for key, entry, text in changed if self._entries.get(key) is entry]
+            try:
+                if changed:
+                    self.store.put_sessions([(key, text) for key, _, text in changed])
+            except Exception:
+                retry.extend(key for key, _, _ in changed)
+                raise
+            else:
+                for _, entry, text in changed:
+                    entry[3] = hash(text)
+            finally:
+                self._dirty.update(retry)
+        return len(changed), len(entries) - len(changed) - len(retry)
+
+    def report(self):
+        lookups = self.stats["hits"] + self.stats["misses"] + self.stats["rehydrated"]
+        return dict(self.stats, sessions=len(self._entries), bytes=self._bytes,
+                    hit_ratio=round(self.stats["hits"] / lookups, 4) if lookups else None)
@@ -1,18 +1,37 @@
-import json
-import os
 from collections import deque
+import logging
 from config import config
 from datetime import datetime
+from utils.linker import state_to_keys, state_to_ids
+from utils.save_store import get_store
+from utils.session_cache import SessionCache
 
-# ✅ State cache in memory
-state_cache = {}
+logger = logging.getLogger(__name__)
+
+def _from_saved(saved):
+    state = state_to_ids(saved, config.chapters)
+
+    # ✅ Convert to deque for efficient operations
+    state["history"] = deque(state.get("history", []), maxlen=config.HISTORY_LIMIT)
+    return state
+
+# ✅ State cache in memory: bounded LRU, evicted sessions go to the save store
+state_cache = SessionCache(
+    get_store(),
+    max_entries=config.SESSION_CACHE_SIZE,
+    max_bytes=config.SESSION_CACHE_BYTES,
+    ttl=config.SESSION_TTL,
+    dump=lambda state: state_to_keys(state, config.chapters),
+    load=_from_saved,
+)
 
 # ✅ Get state from cache or create a new state
 def get_state(user_id):
-    if user_id not in state_cache:
-        # print(f"⚠️ State for user {user_id} not found — creating a new state.")
-        reset_state(user_id)
-    return state_cache[user_id]
+    state = state_cache.get(user_id)
+    if state is None:
+        logger.debug("⚠️ State for user %s not found — creating a new state.", user_id)
+        state = reset_state(user_id)
+    return state
 
 def reset_state(user_id):
     """Полностью сбрасывает состояние пользователя к начальному"""
@@ -29,77 +48,43 @@ def reset_state(user_id):
     }
     return state_cache[user_id]
 
-# ✅ Save the current state to a shared JSON file (by save name)
+# ✅ Save the current state as a new save slot (see utils/save_store.py)
 def save_state(user_id):
-    save_file = f"{config.SAVES_DIR}/{user_id}.json"
-
-    # ✅ Load existing saves from the file (if any)
-    if os.path.exists(save_file):
-        with open(save_file, "r", encoding="utf-8") as file:
-            existing_data = json.load(file)
-    else:
-        existing_data = {}
-
-    # ✅ Prepare the current state for saving
-    state = state_cache[user_id].copy()
-    state["history"] = list(state["history"])
+    # ✅ Prepare the current state for saving (chapter keys, not IDs: IDs change when the quest is rebuilt)
+    state = state_to_keys(state_cache[user_id], config.chapters)
 
     # ✅ Create a unique save name (date)
     save_name = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    existing_data[save_name] = state
-
-    # ✅ Limit the number of saves in the file
-    while len(existing_data) > config.SAVES_LIMIT:
-        oldest_key = sorted(existing_data.keys())[0]
-        del existing_data[oldest_key]
 
-    # ✅ Save all data back to the JSON file
-    with open(save_file, "w", encoding="utf-8") as file:
-        json.dump(existing_data, file, ensure_ascii=False, indent=4)
+    # ✅ The store keeps only the newest SAVES_LIMIT saves
+    get_store().save(user_id, save_name, state)
 
-    print(f"✅ State saved under the name {save_name}")
-
-# ✅ Load the last save from the JSON file into the cache
-def load_state(user_id):
-    save_file = f"{config.SAVES_DIR}/{user_id}.json"
+    logger.info("✅ State saved under the name %s", save_name)
+    return save_name
 
-    if os.path.exists(save_file):
-        with open(save_file, "r", encoding="utf-8") as file:
-            existing_data = json.load(file)
+def _restore(user_id, save_name, saved):
+    state = _from_saved(saved)
 
-            if not existing_data:
-                return get_state(user_id)
+    # ✅ Load into the cache
+    state_cache[user_id] = state
+    logger.info("✅ Loaded save: %s", save_name)
+    return state
 
-            # ✅ Load the most recent save by time
-            last_key = sorted(existing_data.keys())[-1]
-            state = existing_data[last_key]
-
-            # ✅ Convert to deque for efficient operations
-            state["history"] = deque(state.get("history", []), maxlen=config.HISTORY_LIMIT)
-
-            # ✅ Load into the cache
-            state_cache[user_id] = state
-            print(f"✅ Loaded save: {last_key}")
-            return state
-
-    # ✅ If no data is in the file — create a new state
-    return get_state(user_id)
+# ✅ Load the last save into the cache
+def load_state(user_id):
+    save_name, saved = get_store().load(user_id)
+    if saved is None:
+        # ✅ No saves — create a new state
+        return get_state(user_id)
+    return _restore(user_id, save_name, saved)
 
 # ✅ Load a specific save by its name
 def load_specific_state(user_id, save_name):
-    save_file = f"{config.SAVES_DIR}/{user_id}.json"
-
-    if os.path.exists(save_file):
-        with open(save_file, "r", encoding="utf-8") as file:
-            existing_data = json.load(file)
-
-            if save_name in existing_data:
-                state = existing_data[save_name]
-                state["history"] = deque(state.get("history", []), maxlen=config.HISTORY_LIMIT)
-
-                # ✅ Load into the cache
-                state_cache[user_id] = state
-                print(f"✅ Loaded save: {save_name}")
-                return state
-
-    return None
+    save_name, saved = get_store().load(user_id, save_name)
+    if saved is None:
+        return None
+    return _restore(user_id, save_name, saved)
+
+# ✅ Save names of the user, newest first
+def list_saves(user_id):
+    return get_store().list(user_id)
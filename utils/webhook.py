@@ -0,0 +1,123 @@
+import hmac
+import json
+import logging
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import telebot.types as types
+
+logger = logging.getLogger(__name__)
+
+# ✅ Webhook mode
+#
+# Telegram POSTs every update to WEBHOOK_PATH on a small built-in HTTP server. The
+# X-Telegram-Bot-Api-Secret-Token header has to match WEBHOOK_SECRET and the body must fit
+# in WEBHOOK_MAX_BODY (both checked before the body is read). The update is
+# handed to bot.process_new_updates (the per-chat dispatcher when it is installed), and
+# the server answers 200 right away without waiting for the handlers.
+# On SIGTERM/SIGINT the server answers 503 to new updates (Telegram sends them again
+# later, e.g. to another instance), stops accepting connections, and waits until the
+# updates it has accepted are processed.
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive: Telegram reuses connections
+    timeout = 10  # idle keep-alive connections are closed, so draining never waits on them
+
+    def do_POST(self):
+        server = self.server
+        # ✅ Path, secret and size are checked before the body is read (rejected bodies stay unread:
+        # the connection is closed)
+        if self.path != server.path:
+            return self._reject(404)
+        secret = self.headers.get(SECRET_HEADER, "").encode("utf-8", "surrogateescape")
+        if not hmac.compare_digest(secret, server.secret):
+            server.stats["rejected"] += 1
+            return self._reject(403)
+        if server.draining:
+            return self._reject(503)
+        try:
+            length = int(self.headers["Content-Length"])
+        except (TypeError, ValueError):
+            length = -1
+        if length < 0:
+            server.stats["invalid"] += 1
+            return self._reject(400)
+        if length > server.max_body:
+            server.stats["invalid"] += 1
+            return self._reject(413)
+
+        body = self.rfile.read(length)
+        try:
+            update = types.Update.de_json(json.loads(body))
+        except (ValueError, TypeError, KeyError) as e:
+            server.stats["invalid"] += 1
+            logger.warning("⚠️ Invalid webhook update: %s", e)
+            return self._reply(400)
+
+        server.stats["received"] += 1
+        server.process_updates([update])
+        self._reply(200)
+
+    def _reject(self, status):
+        # the unread body can't be skipped: the client is told to reconnect for its next request
+        self.close_connection = True
+        self._reply(status, close=True)
+
+    def _reply(self, status, close=False):
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        if close:
+            self.send_header("Connection", "close")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass  # one line per update is too much
+
+
+class WebhookServer(ThreadingHTTPServer):
+    daemon_threads = False
+    block_on_close = True  # server_close waits for requests in progress
+
+    def __init__(self, address, process_updates, secret, path="/webhook", max_body=1 << 20):
+        super().__init__(address, WebhookHandler)
+        self.process_updates = process_updates
+        self.secret = (secret or "").encode()
+        self.path = path
+        self.max_body = max_body  # bytes; larger requests get 413
+        self.draining = False
+        self.stats = {"received": 0, "rejected": 0, "invalid": 0}
+
+    def drain(self, join=None, timeout=None):
+        """Stop taking updates, then wait (join) for the accepted ones.
+
+        Must be called from another thread than serve_forever.
+        """
+        self.draining = True
+        self.shutdown()
+        self.server_close()
+        return join(timeout) if join else True
+
+
+def run(bot, config, dispatcher=None):
+    if not config.WEBHOOK_SECRET:
+        raise ValueError("WEBHOOK_SECRET is required in webhook mode")
+    server = WebhookServer((config.WEBHOOK_HOST, config.WEBHOOK_PORT), bot.process_new_updates,
+                           config.WEBHOOK_SECRET, config.WEBHOOK_PATH, config.WEBHOOK_MAX_BODY)
+    if config.WEBHOOK_URL:
+        bot.set_webhook(url=config.WEBHOOK_URL, secret_token=config.WEBHOOK_SECRET)
+
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *args: stop.set())
+
+    threading.Thread(target=server.serve_forever, name="webhook", daemon=True).start()
+    logger.info("🌐 Webhook listening on %s:%s%s", config.WEBHOOK_HOST, config.WEBHOOK_PORT, config.WEBHOOK_PATH)
+    while not stop.wait(1):
+        pass
+
+    logger.info("⏳ Draining webhook updates...")
+    drained = server.drain(dispatcher.join if dispatcher else None, config.WEBHOOK_DRAIN_TIMEOUT)
+    logger.info("✅ Webhook stopped (%s)%s", server.stats, "" if drained else ", drain timed out")